@@ -0,0 +1,197 @@
+import json
+import os
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+
+# ==========================================
+# WORKER POOLS (Admission Control)
+# ==========================================
+# One executor per pipeline. A request is rejected (503 + Retry-After)
+# once `workers + queue` requests are already running/waiting on that pool.
+VISION_POOL_WORKERS = _env_int("VISION_POOL_WORKERS", 8)
+VISION_POOL_QUEUE = _env_int("VISION_POOL_QUEUE", 16)
+SURYA_POOL_WORKERS = _env_int("SURYA_POOL_WORKERS", 8)   # >= SURYA_MAX_BATCH so batches can fill
+SURYA_POOL_QUEUE = _env_int("SURYA_POOL_QUEUE", 8)
+CROP_POOL_WORKERS = _env_int("CROP_POOL_WORKERS", 4)
+CROP_POOL_QUEUE = _env_int("CROP_POOL_QUEUE", 8)
+
+# Stage limits shared by all pipelines
+GPU_STAGE_CONCURRENCY = _env_int("GPU_STAGE_CONCURRENCY", 2)        # cropper, Surya
+NETWORK_STAGE_CONCURRENCY = _env_int("NETWORK_STAGE_CONCURRENCY", 8)  # Ollama calls
+
+RETRY_AFTER_SECONDS = _env_int("RETRY_AFTER_SECONDS", 5)
+
+# ==========================================
+# DEADLINES & CLIENT DISCONNECTS
+# ==========================================
+# Each request gets a deadline: the X-Request-Timeout header (seconds, capped at
+# REQUEST_TIMEOUT_MAX) or its endpoint's default. Stages whose recent mean duration
+# no longer fits are skipped (-> 504); a disconnected client cancels its work.
+REQUEST_TIMEOUT_HEADER = os.environ.get("REQUEST_TIMEOUT_HEADER", "X-Request-Timeout")
+REQUEST_TIMEOUT_MAX = _env_float("REQUEST_TIMEOUT_MAX", 300)
+# Per-endpoint defaults (batch: per receipt), JSON overrides: {"vision": 60, "crop": 10}
+REQUEST_TIMEOUTS = {
+    "vision": 120, "surya": 120, "auto": 150, "crop": 30, "batch": 120,
+    **json.loads(os.environ.get("REQUEST_TIMEOUTS", "{}"))
+}
+DISCONNECT_POLL_SECONDS = _env_float("DISCONNECT_POLL_SECONDS", 0.5)
+
+# ==========================================
+# RESULT CACHE
+# ==========================================
+CACHE_MAX_ITEMS = _env_int("CACHE_MAX_ITEMS", 256)
+CACHE_MAX_BYTES = _env_int("CACHE_MAX_BYTES", 512 * 1024 * 1024)
+CACHE_DIR = os.environ.get("CACHE_DIR", "")  # empty = memory only
+CACHE_DISK_MAX_BYTES = _env_int("CACHE_DISK_MAX_BYTES", 20 * 1024 ** 3)  # least recently used files go first; 0 = unbounded
+CACHE_IMAGE_FORMAT = os.environ.get("CACHE_IMAGE_FORMAT", "png")  # crops on disk: png (lossless) | jpeg
+CACHE_IMAGE_QUALITY = _env_int("CACHE_IMAGE_QUALITY", 95)         # jpeg only
+
+# ==========================================
+# SURYA MICRO-BATCHING
+# ==========================================
+SURYA_MAX_BATCH = _env_int("SURYA_MAX_BATCH", 8)
+SURYA_MAX_WAIT_MS = _env_float("SURYA_MAX_WAIT_MS", 25)
+
+# Long receipts: crops taller than SURYA_TILE_MAX_ASPECT widths are OCR'd as
+# overlapping horizontal strips (heights and overlap in crop widths; 0 = never tile)
+SURYA_TILE_MAX_ASPECT = _env_float("SURYA_TILE_MAX_ASPECT", 3.0)
+SURYA_TILE_ASPECT = _env_float("SURYA_TILE_ASPECT", 2.0)
+SURYA_TILE_OVERLAP = _env_float("SURYA_TILE_OVERLAP", 0.15)
+
+# ==========================================
+# UPLOAD INGESTION
+# ==========================================
+UPLOAD_MAX_BYTES = _env_int("UPLOAD_MAX_BYTES", 25 * 1024 * 1024)        # per image
+UPLOAD_MAX_PIXELS = _env_int("UPLOAD_MAX_PIXELS", 100_000_000)          # from the header, before decoding
+BATCH_MAX_BYTES = _env_int("BATCH_MAX_BYTES", 1024 * 1024 * 1024)       # whole /ocr/batch request
+# Decode at 1/2, 1/4 or 1/8 scale while the long side stays >= this (0 = full resolution)
+DECODE_MAX_DIM = _env_int("DECODE_MAX_DIM", 3072)
+
+# ==========================================
+# QUALITY GATE (before any model runs)
+# ==========================================
+# Endpoints that reject unusable photos with 422 (any of vision, surya, auto, crop, batch, jobs).
+# Empty = observe only: every upload is scored (metrics, X-Image-Quality) but none is rejected
+QUALITY_GATE_ENDPOINTS = {e.strip() for e in os.environ.get("QUALITY_GATE_ENDPOINTS", "").split(",") if e.strip()}
+QUALITY_WORK_SIZE = _env_int("QUALITY_WORK_SIZE", 512)         # long side of the grayscale preview that is scored
+QUALITY_MIN_BLUR = _env_float("QUALITY_MIN_BLUR", 25)          # Laplacian variance on the preview
+QUALITY_MIN_BRIGHTNESS = _env_float("QUALITY_MIN_BRIGHTNESS", 35)
+QUALITY_MAX_BRIGHTNESS = _env_float("QUALITY_MAX_BRIGHTNESS", 235)
+QUALITY_MAX_GLARE = _env_float("QUALITY_MAX_GLARE", 0.3)       # share of blown-out pixels
+QUALITY_MIN_TEXT = _env_float("QUALITY_MIN_TEXT", 0.002)       # share of pixels on dark strokes
+# Per-endpoint threshold overrides, JSON: {"vision": {"max_glare": 0.5}, "surya": {"min_blur": 40}}
+QUALITY_OVERRIDES = json.loads(os.environ.get("QUALITY_OVERRIDES", "{}"))
+
+# ==========================================
+# BATCH ENDPOINT
+# ==========================================
+BATCH_MAX_FILES = _env_int("BATCH_MAX_FILES", 500)
+BATCH_CONCURRENCY = _env_int("BATCH_CONCURRENCY", 4)  # receipts in flight per /ocr/batch call
+
+# ==========================================
+# JOB QUEUE (/jobs)
+# ==========================================
+JOBS_DB = os.environ.get("JOBS_DB", "data/jobs.db")            # SQLite file; keep it on a persistent volume
+# Worker processes started with the API. Each loads its own cropper / Surya (0 = run them separately,
+# e.g. next to the shared model server, which they then use for the models)
+JOB_WORKERS = _env_int("JOB_WORKERS", 0)
+JOB_MAX_ATTEMPTS = _env_int("JOB_MAX_ATTEMPTS", 3)             # then dead-lettered
+JOB_LEASE_SECONDS = _env_float("JOB_LEASE_SECONDS", 120)       # a crashed worker's job is re-claimed after this
+JOB_BACKOFF_SECONDS = _env_float("JOB_BACKOFF_SECONDS", 5)     # retry delay: base * 2^(attempt-1)
+JOB_BACKOFF_MAX_SECONDS = _env_float("JOB_BACKOFF_MAX_SECONDS", 300)
+JOB_POLL_SECONDS = _env_float("JOB_POLL_SECONDS", 0.5)
+JOB_MAX_BACKLOG = _env_int("JOB_MAX_BACKLOG", 10000)           # queued + running before POST /jobs returns 503
+JOB_WEBHOOK_TIMEOUT = _env_float("JOB_WEBHOOK_TIMEOUT", 10)
+# Webhook hosts allowed (and their subdomains), comma-separated; empty = any host with a public address
+JOB_WEBHOOK_ALLOWED_HOSTS = [
+    h.strip().lower() for h in os.environ.get("JOB_WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()
+]
+
+# ==========================================
+# AUTO ENDPOINT (vision + Surya, hedged)
+# ==========================================
+AUTO_POLICY = os.environ.get("AUTO_POLICY", "hedge")        # cascade | hedge | race
+AUTO_PRIMARY = os.environ.get("AUTO_PRIMARY", "surya")      # path started first (cheaper: fast parser often skips the LLM)
+AUTO_HEDGE_DELAY_MS = _env_float("AUTO_HEDGE_DELAY_MS", 8000)  # until enough samples for the observed p95
+AUTO_HEDGE_MIN_SAMPLES = _env_int("AUTO_HEDGE_MIN_SAMPLES", 20)
+
+# ==========================================
+# CROPPER
+# ==========================================
+CROP_MODEL = os.environ.get("CROP_MODEL", "birefnet-general")
+CROP_PROXY_SIZE = _env_int("CROP_PROXY_SIZE", 1024)            # 0 = segment at full resolution
+CROP_ALPHA_MATTING = os.environ.get("CROP_ALPHA_MATTING", "0") == "1"
+# auto = classical OpenCV crop first, birefnet only when its checks fail | fast | model
+CROP_MODE = os.environ.get("CROP_MODE", "auto")
+CROP_FAST_WORK_SIZE = _env_int("CROP_FAST_WORK_SIZE", 640)                 # long side of the classical stage's copy
+CROP_FAST_MIN_AREA = _env_float("CROP_FAST_MIN_AREA", 0.08)                # receipt share of the frame
+CROP_FAST_MIN_RECTANGULARITY = _env_float("CROP_FAST_MIN_RECTANGULARITY", 0.85)  # blob area / min-area rectangle
+CROP_FAST_MIN_CONTRAST = _env_float("CROP_FAST_MIN_CONTRAST", 40)          # paper vs background, gray levels
+# CPU-only hosts: run the cropper in N worker processes (0 = in-process, shares gpu_slots)
+CROP_PROCESSES = _env_int("CROP_PROCESSES", 0)
+CROP_INTRA_OP_THREADS = _env_int("CROP_INTRA_OP_THREADS", 0)   # 0 = ORT default (with CROP_PROCESSES: cores / processes)
+CROP_INTER_OP_THREADS = _env_int("CROP_INTER_OP_THREADS", 1)   # >1 switches ORT to parallel execution mode
+CROP_GRAPH_OPTIMIZATION = os.environ.get("CROP_GRAPH_OPTIMIZATION", "all")  # disable | basic | extended | all
+
+# ==========================================
+# SHARED MODEL SERVER
+# ==========================================
+# Unix socket of `python -m app.services.model_server`: when set, the cropper and
+# Surya run there (one copy of the models) instead of in every API / job worker
+MODEL_SERVER_SOCKET = os.environ.get("MODEL_SERVER_SOCKET", "")
+MODEL_SERVER_METRICS_PORT = _env_int("MODEL_SERVER_METRICS_PORT", 9102)  # the server's own /metrics (0 = off)
+
+# ==========================================
+# VISION PAYLOAD
+# ==========================================
+# qwen2.5-VL works on ~1M pixels (28px patches); anything larger is resized server-side
+VISION_IMAGE_FORMAT = os.environ.get("VISION_IMAGE_FORMAT", "jpeg")   # jpeg | webp | png
+VISION_MAX_DIM = _env_int("VISION_MAX_DIM", 1568)
+VISION_IMAGE_QUALITY = _env_int("VISION_IMAGE_QUALITY", 90)
+
+# ==========================================
+# OLLAMA BACKENDS
+# ==========================================
+OLLAMA_HOSTS = [h.strip() for h in os.environ.get("OLLAMA_HOSTS", "http://173.209.56.38:11434").split(",") if h.strip()]
+OLLAMA_TIMEOUT = _env_float("OLLAMA_TIMEOUT", 120)              # seconds per call
+OLLAMA_MAX_ATTEMPTS = _env_int("OLLAMA_MAX_ATTEMPTS", 2)        # distinct backends tried per call
+OLLAMA_BREAKER_FAILURES = _env_int("OLLAMA_BREAKER_FAILURES", 3)
+OLLAMA_BREAKER_COOLDOWN = _env_float("OLLAMA_BREAKER_COOLDOWN", 30)
+OLLAMA_MAX_CONNECTIONS = _env_int("OLLAMA_MAX_CONNECTIONS", 16)  # keep-alive pool per backend
+# How long Ollama keeps a model loaded after a call ("30m", "-1" = forever, "" = server default 5m):
+# a resident model keeps the KV cache of the last prompt prefix it ran
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Stream completions and stop as soon as the receipt JSON object is complete and valid
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "1") == "1"
+# Constrained output: schema (receipt JSON schema) | json (any JSON) | none
+LLM_OUTPUT_FORMAT = os.environ.get("LLM_OUTPUT_FORMAT", "schema")
+# Classify each receipt (fuel / restaurant / retail / generic) and send the compact prompt for its type
+PROMPT_ROUTING = os.environ.get("PROMPT_ROUTING", "1") == "1"
+
+# ==========================================
+# ROLE & STARTUP
+# ==========================================
+# crop | vision | surya | all  - which pipelines (and therefore models) this replica serves
+SERVICE_ROLE = os.environ.get("SERVICE_ROLE", "all")
+WARMUP = os.environ.get("WARMUP", "1") == "1"                      # load role models in the background at startup
+WARMUP_INFERENCE = os.environ.get("WARMUP_INFERENCE", "0") == "1"  # ...and run one tiny inference
+
+# ==========================================
+# METRICS
+# ==========================================
+# Always add X-Stage-Timings (otherwise only when the request sends X-Debug-Timings: 1)
+TIMING_HEADER = os.environ.get("TIMING_HEADER", "0") == "1"
+
+# ==========================================
+# FAST-PATH PARSER
+# ==========================================
+FAST_PARSER_ENABLED = os.environ.get("FAST_PARSER_ENABLED", "1") == "1"
+FAST_PARSER_MIN_CONFIDENCE = _env_float("FAST_PARSER_MIN_CONFIDENCE", 0.8)
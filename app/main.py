@@ -1,13 +1,45 @@
-from fastapi import FastAPI, UploadFile, File, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.datastructures import MutableHeaders
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from typing import List, Optional
+from contextlib import asynccontextmanager
+import asyncio
+import functools
+import io
+import json
 import logging
+import os
+import threading
+import time
+import zipfile
 
 # 1. Import Workflow Functions
 from app.services.workflow import (
     workflow_vision_direct,
     workflow_surya_pipeline,
-    workflow_get_cropped_image
+    workflow_get_cropped_image,
+    workflow_quality_gate,
+    ImageRejected,
+    serves_pipeline,
+    warm_up,
+    readiness
 )
+from app.services.executor import PoolFullError, vision_pool, surya_pool, crop_pool
+from app.services.cache import result_cache
+from app.services.auto import auto_router
+from app.services.cancellation import DISCONNECTED, CancelToken, DeadlineExceeded, OperationCancelled, run_with_token
+from app.services.job_queue import get_job_queue
+from app.services.job_worker import JOB_PIPELINES, start_worker_processes, stop_worker_processes, webhook_url_error
+from app.services.metrics import register_job_queue
+from app.services.ollama_pool import get_ollama_pool
+from app.services.metrics import (
+    REQUEST_PEAK_RSS_GROWTH, REQUEST_SECONDS, format_memory, format_timings, peak_rss_bytes, rss_bytes,
+    start_request_timings
+)
+from app.services.ingest import BodySizeLimit, UploadTooLarge, check_pixels, read_upload
+from app.processors.image_io import IMAGE_EXTENSIONS
+from app import config
 
 # 2. Setup Logging
 logging.basicConfig(
@@ -24,23 +56,224 @@ app = FastAPI(
 )
 
 
+def _busy_response(e: PoolFullError):
+    # Fast rejection instead of letting requests pile up behind slow models
+    logger.warning(f"🚦 {e.pool_name} pool full, rejecting request")
+    return JSONResponse(
+        {"error": f"Server busy ({e.pool_name}), retry later"},
+        status_code=503,
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+def _too_large_response(e: UploadTooLarge):
+    logger.warning(f"📏 Upload rejected: {e}")
+    return JSONResponse({"error": str(e)}, status_code=413)
+
+
+def _rejected_response(e: ImageRejected):
+    # Unusable photo: answered from a small preview, no model has run
+    logger.info(f"🔍 Upload rejected by quality gate: {e}")
+    return JSONResponse(
+        {"error": "Image quality too low", "failed": e.report["failed"], "quality": e.report["scores"]},
+        status_code=422
+    )
+
+
+def _quality_headers(report: dict) -> dict:
+    # Scores on successful responses too, to tune the thresholds against real traffic
+    if not report["scores"]:
+        return {}
+    return {"X-Image-Quality": ";".join(f"{name}={value}" for name, value in report["scores"].items())}
+
+
+async def _quality_gate(data: bytes, endpoint: str) -> dict:
+    return await asyncio.to_thread(workflow_quality_gate, data, endpoint)
+
+
+def _cancelled_response(e: OperationCancelled):
+    if isinstance(e, DeadlineExceeded):
+        logger.warning(f"⏱️ Deadline exceeded: {e}")
+        return JSONResponse({"error": "Deadline exceeded", "detail": str(e)}, status_code=504)
+    # Client went away: nobody reads this (499 = client closed request)
+    logger.info(f"🔌 Request abandoned ({e}), remaining stages skipped")
+    return Response(status_code=499)
+
+
+def _request_timeout(request: Request, endpoint: str):
+    """Seconds this request may take: the timeout header (capped) or the endpoint default."""
+    header = request.headers.get(config.REQUEST_TIMEOUT_HEADER)
+    if header:
+        try:
+            return min(max(float(header), 0.0), config.REQUEST_TIMEOUT_MAX)
+        except ValueError:
+            logger.warning(f"Ignoring invalid {config.REQUEST_TIMEOUT_HEADER}: {header!r}")
+    return config.REQUEST_TIMEOUTS.get(endpoint)
+
+
+async def _watch_disconnect(request: Request, token: CancelToken):
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel(DISCONNECTED)
+            return
+        await asyncio.sleep(config.DISCONNECT_POLL_SECONDS)
+
+
+@asynccontextmanager
+async def _cancel_on_disconnect(request: Request, token: CancelToken):
+    """Cancels `token` if the client disconnects while the block runs."""
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    try:
+        yield
+    finally:
+        watcher.cancel()
+
+
+def _role_response(pipeline: str):
+    # This replica's SERVICE_ROLE doesn't load the models for `pipeline`
+    return JSONResponse(
+        {"error": f"Pipeline '{pipeline}' is not served by this replica (role={config.SERVICE_ROLE})"},
+        status_code=404
+    )
+
+
+class RecordTimings:
+    """
+    ASGI middleware: request latency / memory metrics and the optional
+    X-Stage-Timings / X-Memory headers. Plain ASGI rather than
+    @app.middleware("http"), whose wrapped receive hides client disconnects
+    from the endpoints.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        rss_start, peak_start = rss_bytes(), peak_rss_bytes()
+        timings = start_request_timings()
+        # Per-request stage breakdown, on demand or always via config
+        debug = config.TIMING_HEADER or (b"x-debug-timings", b"1") in scope["headers"]
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - start) * 1000
+                route = scope.get("route")
+                path = route.path if route else "unmatched"
+                REQUEST_SECONDS.labels(path, str(message["status"])).observe(total_ms / 1000)
+                # Process-wide high-water mark: growth during this request is what it (and its neighbours) cost
+                REQUEST_PEAK_RSS_GROWTH.labels(path).observe(peak_rss_bytes() - peak_start)
+                if debug:
+                    headers = MutableHeaders(scope=message)
+                    headers["X-Stage-Timings"] = format_timings({**timings, "total": total_ms})
+                    headers["X-Memory"] = format_memory(rss_start, peak_start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+app.add_middleware(RecordTimings)
+
+# Reject oversize bodies before the multipart parser spools them (64 KB for multipart framing)
+app.add_middleware(
+    BodySizeLimit,
+    max_bytes=config.UPLOAD_MAX_BYTES + 64 * 1024,
+    overrides={"/ocr/batch": config.BATCH_MAX_BYTES}
+)
+
+
+@app.on_event("startup")
+def start_warm_up():
+    if config.WARMUP:
+        threading.Thread(
+            target=warm_up, kwargs={"run_inference": config.WARMUP_INFERENCE}, name="warm-up", daemon=True
+        ).start()
+
+
+job_workers = []
+
+
+def _job_queue():
+    # Opened on first use: replicas that never see /jobs don't create the jobs DB
+    queue = get_job_queue()
+    register_job_queue(queue)
+    return queue
+
+
+@app.on_event("startup")
+def start_job_workers():
+    if config.JOB_WORKERS > 0:
+        # Opening the queue also creates the schema before workers race for it
+        _job_queue()
+        job_workers.extend(start_worker_processes(config.JOB_WORKERS))
+        logger.info(f"👷 Started {config.JOB_WORKERS} job worker process(es) on {config.JOBS_DB}")
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    stop_worker_processes(job_workers)
+
+
 # 4. Define Endpoints
 @app.get("/")
 def health_check():
-    return {"status": "online", "endpoints": ["/ocr/vision", "/ocr/surya", "/process/crop"]}
+    # Liveness only: answers even while models are still loading
+    return {"status": "online", "endpoints": ["/ocr/vision", "/ocr/surya", "/ocr/auto", "/ocr/batch", "/jobs", "/process/crop"]}
+
+
+@app.get("/ready")
+def ready_check():
+    status = readiness()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    return result_cache.stats()
+
+
+@app.get("/ollama/backends")
+def ollama_backends():
+    return get_ollama_pool().stats()
+
+
+@app.get("/auto/stats")
+def auto_stats():
+    return auto_router.stats()
 
 
 # --- ENDPOINT 1: VISION MODEL ---
 @app.post("/ocr/vision")
-async def endpoint_vision(file: UploadFile = File(...)):
+async def endpoint_vision(request: Request, file: UploadFile = File(...)):
+    if not serves_pipeline("vision"):
+        return _role_response("vision")
+    token = CancelToken.with_timeout(_request_timeout(request, "vision"))
     try:
         logger.info(f"👁️ Vision Request: {file.filename}")
-        data = await file.read()
-        result = workflow_vision_direct(data)
+        data = await read_upload(file)
+        quality = await _quality_gate(data, "vision")
+        async with _cancel_on_disconnect(request, token):
+            result = await vision_pool.submit(run_with_token, token, workflow_vision_direct, data)
 
         if "error" in result:
-            return JSONResponse(result, status_code=400)
-        return JSONResponse(result)
+            return JSONResponse(result, status_code=400, headers=_quality_headers(quality))
+        return JSONResponse(result, headers=_quality_headers(quality))
+    except UploadTooLarge as e:
+        return _too_large_response(e)
+    except ImageRejected as e:
+        return _rejected_response(e)
+    except PoolFullError as e:
+        return _busy_response(e)
+    except OperationCancelled as e:
+        return _cancelled_response(e)
     except Exception as e:
         logger.error(f"Vision Error: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
@@ -48,33 +281,308 @@ async def endpoint_vision(file: UploadFile = File(...)):
 
 # --- ENDPOINT 2: SURYA PIPELINE ---
 @app.post("/ocr/surya")
-async def endpoint_surya(file: UploadFile = File(...)):
+async def endpoint_surya(request: Request, file: UploadFile = File(...)):
+    if not serves_pipeline("surya"):
+        return _role_response("surya")
+    token = CancelToken.with_timeout(_request_timeout(request, "surya"))
     try:
         logger.info(f"🧠 Surya Request: {file.filename}")
-        data = await file.read()
-        result = workflow_surya_pipeline(data)
+        data = await read_upload(file)
+        quality = await _quality_gate(data, "surya")
+        async with _cancel_on_disconnect(request, token):
+            result = await surya_pool.submit(run_with_token, token, workflow_surya_pipeline, data)
 
         if "error" in result:
-            return JSONResponse(result, status_code=400)
-        return JSONResponse(result)
+            return JSONResponse(result, status_code=400, headers=_quality_headers(quality))
+        return JSONResponse(result, headers=_quality_headers(quality))
+    except UploadTooLarge as e:
+        return _too_large_response(e)
+    except ImageRejected as e:
+        return _rejected_response(e)
+    except PoolFullError as e:
+        return _busy_response(e)
+    except OperationCancelled as e:
+        return _cancelled_response(e)
     except Exception as e:
         logger.error(f"Surya Error: {e}")
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+# --- ENDPOINT 2b: AUTO (SURYA + VISION, HEDGED) ---
+@app.post("/ocr/auto")
+async def endpoint_auto(
+    request: Request,
+    file: UploadFile = File(...),
+    policy: Optional[str] = None,
+    primary: Optional[str] = None
+):
+    """
+    Crops once and runs Surya and/or vision on the crop (policy: cascade | hedge | race).
+    Returns {"winner", "policy", "started", "elapsed_ms", "result"}.
+    """
+    if not (serves_pipeline("vision") or serves_pipeline("surya")):
+        return _role_response("auto")
+    token = CancelToken.with_timeout(_request_timeout(request, "auto"))
+    try:
+        logger.info(f"🔀 Auto Request: {file.filename} (policy={policy or config.AUTO_POLICY})")
+        data = await read_upload(file)
+        quality = await _quality_gate(data, "auto")
+        async with _cancel_on_disconnect(request, token):
+            outcome = await auto_router.run(data, policy=policy, primary=primary, token=token)
+
+        status = 400 if outcome["winner"] is None else 200
+        headers = {"X-Pipeline-Winner": outcome["winner"] or "none", **_quality_headers(quality)}
+        return JSONResponse(outcome, status_code=status, headers=headers)
+    except UploadTooLarge as e:
+        return _too_large_response(e)
+    except ImageRejected as e:
+        return _rejected_response(e)
+    except PoolFullError as e:
+        return _busy_response(e)
+    except OperationCancelled as e:
+        return _cancelled_response(e)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        logger.error(f"Auto Error: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
 # --- ENDPOINT 3: CROP PREVIEW ---
 @app.post("/process/crop")
-async def endpoint_crop_preview(file: UploadFile = File(...)):
+async def endpoint_crop_preview(
+    request: Request,
+    file: UploadFile = File(...),
+    format: str = "png",
+    max_dim: int = 0,
+    quality: int = 90,
+    mode: str = None
+):
+    if not serves_pipeline("crop"):
+        return _role_response("crop")
+    token = CancelToken.with_timeout(_request_timeout(request, "crop"))
     try:
         logger.info(f"✂️ Crop Request: {file.filename}")
-        data = await file.read()
-        cropped_bytes = workflow_get_cropped_image(data)
+        data = await read_upload(file)
+        report = await _quality_gate(data, "crop")
+        async with _cancel_on_disconnect(request, token):
+            cropped = await crop_pool.submit(
+                run_with_token, token, workflow_get_cropped_image, data, fmt=format, max_dim=max_dim, quality=quality,
+                mode=mode
+            )
 
-        if not cropped_bytes:
+        if not cropped:
             return JSONResponse({"error": "Crop failed"}, status_code=400)
 
         # Return actual image
-        return Response(content=cropped_bytes, media_type="image/png")
+        return Response(
+            content=cropped.data,
+            media_type=cropped.media_type,
+            headers={
+                "X-Payload-Bytes": str(len(cropped.data)),
+                "X-Encode-Ms": f"{cropped.encode_ms:.1f}",
+                **_quality_headers(report)
+            }
+        )
+    except UploadTooLarge as e:
+        return _too_large_response(e)
+    except ImageRejected as e:
+        return _rejected_response(e)
+    except PoolFullError as e:
+        return _busy_response(e)
+    except OperationCancelled as e:
+        return _cancelled_response(e)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
     except Exception as e:
         logger.error(f"Crop Error: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
\ No newline at end of file
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+# --- ENDPOINT 4: BATCH (NDJSON STREAM) ---
+BATCH_PIPELINES = {
+    "vision": (workflow_vision_direct, vision_pool),
+    "surya": (workflow_surya_pipeline, surya_pool),
+}
+
+
+def _archive_entries(zf: zipfile.ZipFile) -> list:
+    """
+    Image entries of a zip archive, checked on their declared sizes before
+    any is inflated (zip bombs): each against the single-upload cap, all of
+    them together against BATCH_MAX_BYTES.
+    """
+    entries = [
+        info for info in zf.infolist()
+        if not info.is_dir() and os.path.splitext(info.filename)[1].lower() in IMAGE_EXTENSIONS
+    ]
+    total = 0
+    for info in entries:
+        if info.file_size > config.UPLOAD_MAX_BYTES:
+            raise UploadTooLarge(f"{info.filename} is {info.file_size} bytes (limit {config.UPLOAD_MAX_BYTES})",
+                                 config.UPLOAD_MAX_BYTES)
+        total += info.file_size
+    if total > config.BATCH_MAX_BYTES:
+        raise UploadTooLarge(f"Archive inflates to {total} bytes (limit {config.BATCH_MAX_BYTES})",
+                             config.BATCH_MAX_BYTES)
+    return entries
+
+
+def _inflate(zf: zipfile.ZipFile, info: zipfile.ZipInfo, lock: threading.Lock) -> bytes:
+    # zipfile inflates at most the declared size (a lying header fails its CRC check)
+    with lock:
+        data = zf.read(info)
+    check_pixels(data)
+    return data
+
+
+@app.post("/ocr/batch")
+async def endpoint_batch(
+    request: Request,
+    files: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    pipeline: str = Form("surya")
+):
+    """
+    Processes many receipts (multipart `files` and/or a zip `archive`) and
+    streams one JSON line per receipt as soon as it finishes.
+    """
+    if pipeline not in BATCH_PIPELINES:
+        return JSONResponse({"error": f"Unknown pipeline '{pipeline}'", "pipelines": list(BATCH_PIPELINES)}, status_code=400)
+    if not serves_pipeline(pipeline):
+        return _role_response(pipeline)
+    workflow_fn, pool = BATCH_PIPELINES[pipeline]
+
+    # (filename, load): uploads are read up front (their handles close once the
+    # response starts streaming); archive entries are inflated only when their turn comes
+    items = []
+    try:
+        entries = []
+        if archive is not None:
+            zf = zipfile.ZipFile(io.BytesIO(await read_upload(archive, max_bytes=config.BATCH_MAX_BYTES, max_pixels=0)))
+            entries = _archive_entries(zf)
+        count = len(files or []) + len(entries)
+        if count > config.BATCH_MAX_FILES:
+            return JSONResponse({"error": f"Too many files ({count} > {config.BATCH_MAX_FILES})"}, status_code=413)
+
+        for f in files or []:
+            data = await read_upload(f)
+            items.append((f.filename, lambda data=data: data))
+        lock = threading.Lock()
+        items.extend((info.filename, functools.partial(_inflate, zf, info, lock)) for info in entries)
+    except UploadTooLarge as e:
+        return _too_large_response(e)
+    except zipfile.BadZipFile:
+        return JSONResponse({"error": "Archive is not a valid zip file"}, status_code=400)
+
+    if not items:
+        return JSONResponse({"error": "No files provided"}, status_code=400)
+
+    logger.info(f"📦 Batch Request: {len(items)} receipts via {pipeline}")
+    timeout = _request_timeout(request, "batch")
+    return StreamingResponse(_stream_batch(items, workflow_fn, pool, timeout), media_type="application/x-ndjson")
+
+
+async def _stream_batch(items, workflow_fn, pool, timeout=None):
+    semaphore = asyncio.Semaphore(config.BATCH_CONCURRENCY)
+    tokens = []
+
+    async def run_one(index, filename, load):
+        async with semaphore:
+            # Each receipt gets the full timeout from when it starts
+            token = CancelToken.with_timeout(timeout)
+            tokens.append(token)
+            try:
+                # At most BATCH_CONCURRENCY receipts are held in memory at once
+                data = await asyncio.to_thread(load)
+            except (UploadTooLarge, zipfile.BadZipFile) as e:
+                return {"index": index, "filename": filename, "status": "error", "result": {"error": str(e)},
+                        "quality": None}
+            try:
+                quality = await _quality_gate(data, "batch")
+            except ImageRejected as e:
+                return {"index": index, "filename": filename, "status": "rejected",
+                        "result": {"error": "Image quality too low", "failed": e.report["failed"]},
+                        "quality": e.report["scores"]}
+            try:
+                # The semaphore bounds this batch, so skip per-request admission control
+                result = await pool.submit(run_with_token, token, workflow_fn, data, admit=False)
+            except DeadlineExceeded as e:
+                result = {"error": "Deadline exceeded", "detail": str(e)}
+            except Exception as e:
+                logger.error(f"Batch item {filename} Error: {e}")
+                result = {"error": str(e)}
+        status = "error" if "error" in result else "ok"
+        return {"index": index, "filename": filename, "status": status, "result": result, "quality": quality["scores"]}
+
+    tasks = [asyncio.create_task(run_one(i, name, load)) for i, (name, load) in enumerate(items)]
+    counts = {"ok": 0, "error": 0, "rejected": 0}
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            line = await next_done
+            counts[line["status"]] += 1
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"summary": {"total": len(items), "ok": counts["ok"], "errors": counts["error"],
+                                      "rejected": counts["rejected"]}}) + "\n"
+    finally:
+        # Client went away mid-stream: drop receipts that haven't started yet
+        # and stop the running ones at their next stage
+        for task in tasks:
+            task.cancel()
+        for token in tokens:
+            token.cancel(DISCONNECTED)
+
+
+# --- ENDPOINT 5: ASYNC JOBS ---
+@app.post("/jobs", status_code=202)
+async def endpoint_create_job(
+    file: UploadFile = File(...),
+    pipeline: str = Form("surya"),
+    webhook_url: Optional[str] = Form(None)
+):
+    """
+    Queues a receipt and returns its job id immediately. Poll GET /jobs/{id};
+    `webhook_url` (optional) receives the final job JSON as a POST.
+    """
+    if pipeline not in JOB_PIPELINES:
+        return JSONResponse({"error": f"Unknown pipeline '{pipeline}'", "pipelines": list(JOB_PIPELINES)}, status_code=400)
+    if not serves_pipeline(pipeline):
+        return _role_response(pipeline)
+    if webhook_url:
+        # Resolves the host: no webhooks into the private network
+        webhook_error = await asyncio.to_thread(webhook_url_error, webhook_url)
+        if webhook_error:
+            return JSONResponse({"error": webhook_error}, status_code=400)
+
+    queue = _job_queue()
+    if await asyncio.to_thread(queue.backlog) >= config.JOB_MAX_BACKLOG:
+        return _busy_response(PoolFullError("jobs", config.RETRY_AFTER_SECONDS))
+
+    try:
+        data = await read_upload(file)
+        # Checked now so an unusable photo never takes a queue slot or a worker
+        await _quality_gate(data, "jobs")
+    except UploadTooLarge as e:
+        return _too_large_response(e)
+    except ImageRejected as e:
+        return _rejected_response(e)
+    job_id = await asyncio.to_thread(queue.enqueue, pipeline, data, webhook_url)
+    logger.info(f"📥 Job {job_id}: {file.filename} via {pipeline}")
+    return JSONResponse(
+        {"id": job_id, "status": "queued", "poll": f"/jobs/{job_id}"},
+        status_code=202,
+        headers={"Location": f"/jobs/{job_id}"}
+    )
+
+
+@app.get("/jobs")
+async def endpoint_job_counts():
+    return await asyncio.to_thread(_job_queue().counts)
+
+
+@app.get("/jobs/{job_id}")
+async def endpoint_get_job(job_id: str):
+    job = await asyncio.to_thread(_job_queue().get, job_id)
+    if job is None:
+        return JSONResponse({"error": f"Unknown job '{job_id}'"}, status_code=404)
+    return job
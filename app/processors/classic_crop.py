@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# auto = classical first, segmentation model if it fails; fast / model = force one tier
+CROP_MODES = ("auto", "fast", "model")
+
+# box is (x, y, w, h) in the coordinates of an image `scale` times the original
+ClassicCrop = namedtuple("ClassicCrop", ["box", "scale", "area_ratio", "rectangularity", "contrast"])
+
+# A blob filling nearly the whole frame means the background wasn't separated
+_MAX_AREA_RATIO = 0.97
+
+
+class ClassicalCropper:
+    """
+    Model-free receipt finder for the easy case: light paper on a darker,
+    uncluttered background. Works on a small grayscale copy (Otsu threshold
+    + Canny edges, morphological close, largest quadrilateral-ish contour)
+    and returns None unless the result passes the quality checks, so the
+    caller can fall back to segmentation.
+    """
+
+    def __init__(self, work_size=640, min_area_ratio=0.08, min_rectangularity=0.85, min_contrast=40):
+        self.work_size = work_size
+        self.min_area_ratio = min_area_ratio
+        self.min_rectangularity = min_rectangularity
+        self.min_contrast = min_contrast
+
+    def _gray_proxy(self, image_bgr: np.ndarray):
+        h, w = image_bgr.shape[:2]
+        scale = min(1.0, self.work_size / max(h, w))
+        small = image_bgr
+        if scale < 1.0:
+            small = cv2.resize(image_bgr, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0), scale
+
+    def _candidate_mask(self, gray: np.ndarray) -> np.ndarray:
+        # Paper is the bright region; edges close gaps where it meets a light table
+        _, bright = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        edges = cv2.dilate(cv2.Canny(gray, 50, 150), None)
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (9, 9))
+        mask = cv2.morphologyEx(bright | edges, cv2.MORPH_CLOSE, kernel, iterations=2)
+        # Fill the receipt body (printed text punches holes in the threshold)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        filled = np.zeros_like(mask)
+        cv2.drawContours(filled, contours, -1, 255, cv2.FILLED)
+        return filled
+
+    def find(self, image_bgr: np.ndarray):
+        """Returns (ClassicCrop or None, reason); reason is "accepted" or the failed check."""
+        gray, scale = self._gray_proxy(image_bgr)
+        mask = self._candidate_mask(gray)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None, "no_contour"
+
+        # Score blobs by area x rectangularity: the biggest quadrilateral-like one wins
+        # over a larger but ragged region (glare, a sheet of paper under the receipt)
+        frame_area = gray.shape[0] * gray.shape[1]
+        scored = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            (_, _), (rw, rh), _ = cv2.minAreaRect(contour)
+            rectangularity = area / max(1.0, rw * rh)
+            scored.append((area * rectangularity, area, rectangularity, contour))
+        _, area, rectangularity, c = max(scored, key=lambda s: s[0])
+
+        # 1. Area: a receipt-sized blob, not noise and not the whole frame
+        area_ratio = area / frame_area
+        if not self.min_area_ratio <= area_ratio <= _MAX_AREA_RATIO:
+            return None, "area"
+
+        # 2. Rectangularity: how much of its minimum-area rectangle the blob fills
+        if rectangularity < self.min_rectangularity:
+            return None, "rectangularity"
+
+        # 3. Contrast: paper clearly brighter than its surroundings
+        region = np.zeros_like(mask)
+        cv2.drawContours(region, [c], -1, 255, cv2.FILLED)
+        inside = cv2.mean(gray, mask=region)[0]
+        outside = cv2.mean(gray, mask=cv2.bitwise_not(region))[0]
+        contrast = inside - outside
+        if contrast < self.min_contrast:
+            return None, "contrast"
+
+        return ClassicCrop(cv2.boundingRect(c), scale, area_ratio, rectangularity, contrast), "accepted"
@@ -1,11 +1,55 @@
+import math
+import time
+from collections import namedtuple
+
 import cv2
 import numpy as np
 import onnxruntime as ort
 from rembg import remove, new_session
 
+from app.processors.classic_crop import CROP_MODES, ClassicalCropper
+from app.processors.image_io import decode_image, read_header
+from app.services.metrics import INPUT_IMAGE_MEGAPIXELS, record_crop_outcome, stage
+
+# tier: fast | model | none; reason: classical outcome (None if it didn't run)
+CropOutcome = namedtuple("CropOutcome", ["image", "tier", "reason", "classic_seconds", "segment_seconds"])
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def make_session_options(intra_op_threads=0, inter_op_threads=0, graph_optimization="all"):
+    """ONNX Runtime options for the segmentation session (0 threads = ORT default: all cores)."""
+    if graph_optimization not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"Unknown graph optimization '{graph_optimization}' (expected one of {list(GRAPH_OPTIMIZATION_LEVELS)})")
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = intra_op_threads
+    opts.inter_op_num_threads = inter_op_threads
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL if inter_op_threads <= 1 else ort.ExecutionMode.ORT_PARALLEL
+    opts.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization]
+    return opts
+
 
 class ImageCropper:
-    def __init__(self, model_name="birefnet-general"):
+    def __init__(self, model_name="birefnet-general", proxy_size=1024, alpha_matting=False, session_options=None,
+                 decode_max_dim=0, mode="auto", classic=None):
+        if mode not in CROP_MODES:
+            raise ValueError(f"Unknown crop mode '{mode}' (expected one of {list(CROP_MODES)})")
+        self.model_name = model_name
+        # Default tier selection; callers can force one per request
+        self.mode = mode
+        self.classic = classic or ClassicalCropper()
+        # Uploads are decoded (reduced-resolution, EXIF-upright) to about this long side; 0 = full size
+        self.decode_max_dim = decode_max_dim
+        # Segmentation runs on a copy whose long side is at most `proxy_size` px
+        # (0 = full resolution). Only the box is mapped back to the original.
+        self.proxy_size = proxy_size
+        # Matting only refines soft edges; the bounding box rarely needs it
+        self.alpha_matting = alpha_matting
         # Check for GPU
         providers = ort.get_available_providers()
         if 'CUDAExecutionProvider' in providers:
@@ -15,7 +59,7 @@ class ImageCropper:
             self.providers = ['CPUExecutionProvider']
             print(f"⚠️ Cropper: GPU NOT found. Using CPU.")
 
-        self.session = new_session(model_name, providers=self.providers)
+        self.session = new_session(model_name, providers=self.providers, sess_opts=session_options or make_session_options())
 
     def order_points(self, pts):
         rect = np.zeros((4, 2), dtype="float32")
@@ -48,20 +92,82 @@ class ImageCropper:
         M = cv2.getPerspectiveTransform(rect, dst)
         return cv2.warpPerspective(image, M, (maxWidth, maxHeight))
 
-    def process(self, image_bytes: bytes) -> np.ndarray:
-        # 1. Decode Original
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        original = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    def make_proxy(self, image: np.ndarray):
+        """
+        Downscales to `proxy_size` on the long side.
+        Returns (proxy, scale) where proxy = original * scale.
+        """
+        h, w = image.shape[:2]
+        if not self.proxy_size or max(h, w) <= self.proxy_size:
+            return image, 1.0
+        scale = self.proxy_size / max(h, w)
+        proxy = cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+        return proxy, scale
+
+    def get_mask(self, image_bgr: np.ndarray) -> np.ndarray:
+        """birefnet foreground mask (uint8, HxW). NumPy in, NumPy out - no PNG round trip."""
+        rgb = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB)
+        mask = remove(rgb, session=self.session, only_mask=True, alpha_matting=self.alpha_matting)
+        return np.ascontiguousarray(mask, dtype=np.uint8)
+
+    def decode(self, image_bytes):
+        """
+        (upright BGR image at the working resolution, upload megapixels).
+        Any buffer works (bytes, shared memory).
+        """
+        with stage("crop.decode"):
+            header = read_header(image_bytes)
+            original = decode_image(image_bytes, max_dim=self.decode_max_dim, header=header)
+        if original is None:
+            return None, 0.0
+        h, w = (header.height, header.width) if header else original.shape[:2]
+        return original, h * w / 1e6
+
+    def process(self, image_bytes, mode=None) -> np.ndarray:
+        # 1. Decode Original (once, reduced to what the pipelines need)
+        original, megapixels = self.decode(image_bytes)
         if original is None: return None
-
-        # 2. Remove Background (Get Mask)
-        # using alpha_matting=True helps with edges on dark backgrounds
-        mask_bytes = remove(image_bytes, session=self.session, only_mask=True, alpha_matting=True)
-        mask_np = np.frombuffer(mask_bytes, np.uint8)
-        mask = cv2.imdecode(mask_np, cv2.IMREAD_GRAYSCALE)
-
+        INPUT_IMAGE_MEGAPIXELS.observe(megapixels)
+        return self.crop_array(original, mode)
+
+    def crop_array(self, original: np.ndarray, mode=None) -> np.ndarray:
+        """Steps 2-6 on an already decoded BGR image."""
+        mode = mode or self.mode
+        outcome = self.crop_tiered(original, mode)
+        record_crop_outcome(mode, outcome.tier, outcome.reason, outcome.classic_seconds, outcome.segment_seconds)
+        return outcome.image
+
+    def crop_tiered(self, original: np.ndarray, mode=None) -> CropOutcome:
+        """Classical fast path first (unless mode="model"), birefnet when it fails (unless mode="fast")."""
+        mode = mode or self.mode
+        if mode not in CROP_MODES:
+            raise ValueError(f"Unknown crop mode '{mode}' (expected one of {list(CROP_MODES)})")
+
+        # 2a. Classical crop: accepted only if area / rectangularity / contrast checks pass
+        classic_seconds, reason = 0.0, None
+        if mode != "model":
+            start = time.perf_counter()
+            with stage("crop.classic"):
+                found, reason = self.classic.find(original)
+            classic_seconds = time.perf_counter() - start
+            if found is not None:
+                return CropOutcome(self.crop_box(original, found.box, found.scale), "fast", reason, classic_seconds, 0.0)
+            if mode == "fast":
+                return CropOutcome(original, "none", reason, classic_seconds, 0.0)
+
+        # 2b. Remove Background on the proxy (Get Mask)
+        start = time.perf_counter()
+        with stage("crop.segment"):
+            proxy, scale = self.make_proxy(original)
+            mask = self.get_mask(proxy)
+        segment_seconds = time.perf_counter() - start
+        return CropOutcome(self.crop_mask(original, mask, scale), "model", reason, classic_seconds, segment_seconds)
+
+    def crop_mask(self, original: np.ndarray, mask: np.ndarray, scale=1.0) -> np.ndarray:
+        """Steps 3-6: box around the largest foreground blob of a proxy-space mask."""
         # 3. Find Contours
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        with stage("crop.contours"):
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
         if not contours:
             return original  # Fallback to original if Rembg fails completely
 
@@ -69,27 +175,38 @@ class ImageCropper:
         c = max(contours, key=cv2.contourArea)
 
         # 4. SAFETY CHECK: Is the contour big enough?
-        # If it's too small (noise), return original
-        if cv2.contourArea(c) < 5000:
+        # If it's too small (noise), return original. Area is measured in full-res pixels.
+        if cv2.contourArea(c) / (scale * scale) < 5000:
             return original
 
         # 5. NEW LOGIC: "Safe Crop" (Bounding Box) vs "Warp"
         # We prefer a simple bounding box crop for curved receipts
         # because warping creates distortion.
-        x, y, w, h = cv2.boundingRect(c)
+        return self.crop_box(original, cv2.boundingRect(c), scale)
 
-        # Add a small padding (10px) to not cut edge text
+    def crop_box(self, original: np.ndarray, box, scale=1.0) -> np.ndarray:
+        """Crops a proxy-space (x, y, w, h) box out of the full-resolution original."""
+        x, y, w, h = box
+
+        # Map proxy coordinates back to the original (round outwards)
         h_img, w_img = original.shape[:2]
-        x = max(0, x - 10)
-        y = max(0, y - 10)
-        w = min(w_img - x, w + 20)
-        h = min(h_img - y, h + 20)
+        x0 = math.floor(x / scale)
+        y0 = math.floor(y / scale)
+        x1 = math.ceil((x + w) / scale)
+        y1 = math.ceil((y + h) / scale)
+
+        # Add a small padding (10px) to not cut edge text
+        x0 = max(0, x0 - 10)
+        y0 = max(0, y0 - 10)
+        x1 = min(w_img, x1 + 10)
+        y1 = min(h_img, y1 + 10)
 
-        cropped = original[y:y + h, x:x + w]
+        # A copy, not a view: a cached crop must not keep the whole decoded original alive
+        cropped = original[y0:y1, x0:x1].copy()
 
         # 6. Rotate if Landscape (Make it tall)
         h_c, w_c = cropped.shape[:2]
         if w_c > h_c:
             cropped = cv2.rotate(cropped, cv2.ROTATE_90_CLOCKWISE)
 
-        return cropped
\ No newline at end of file
+        return cropped
@@ -0,0 +1,197 @@
+import re
+from collections import namedtuple
+from datetime import date
+
+# Bump when the rules change (part of the Surya JSON cache version)
+FAST_PARSER_VERSION = "2"
+
+# result: same shape as the LLM result (TEXT_SCHEMA); confidence: per-field scores, kept out of the result
+FastParse = namedtuple("FastParse", ["result", "confidence", "confident"])
+
+# Amounts always carry exactly two decimals on POS receipts ("12.34", "12,34", "-1.00")
+AMOUNT = r"-?\$?\s?\d{1,6}[.,]\d{2}(?!\d)"
+_AMOUNT_RE = re.compile(AMOUNT)
+
+_TOTAL_RE = re.compile(r"^\s*(GRAND\s+TOTAL|MONTANT\s+TOTAL|TOTAL\s+(A|À)\s+PAYER|TOTAL)\b(?!\s*(DES|PARTIEL))", re.I)
+_SUBTOTAL_RE = re.compile(r"^\s*(SOUS[\s-]?TOTAL|SUB[\s-]?TOTAL)\b", re.I)
+_TAX_RES = {
+    "tps": re.compile(r"^\s*(TPS|GST)\b", re.I),
+    "tvq": re.compile(r"^\s*(TVQ|QST)\b", re.I),
+    "hst": re.compile(r"^\s*(HST|TVH)\b", re.I),
+}
+# Lines that are never products
+_FINANCIAL_RE = re.compile(
+    r"\b(SOUS[\s-]?TOTAL|SUB[\s-]?TOTAL|TOTAL|TPS|TVQ|GST|HST|QST|TVH|TAXE?S?|BALANCE|CHANGE|MONNAIE|"
+    r"PAYMENT|PAIEMENT|COMPTANT|CASH|VISA|MASTERCARD|DEBIT|DÉBIT|INTERAC|REMISE|RENDU|POURBOIRE|TIP)\b",
+    re.I,
+)
+# Fuel receipts need the unit-price rules only the LLM prompt implements (also routes them to the fuel prompt)
+FUEL_RE = re.compile(r"\b(PUMP|POMPE|DIESEL|FUEL|ESSENCE|CARBURANT|LITRES?|\d+[.,]\d{3}\s?L)\b|/\s?L\b", re.I)
+_GENERIC_HEADERS = re.compile(r"^(TRANSACTION RECORD|MERCHANT COPY|CUSTOMER COPY|ORIGINAL|WELCOME|BIENVENUE|COPIE)", re.I)
+
+_ISO_DATE_RE = re.compile(r"\b(20\d{2})[-/.](\d{1,2})[-/.](\d{1,2})\b")
+_DMY_DATE_RE = re.compile(r"\b(\d{1,2})[-/.](\d{1,2})[-/.](20\d{2}|\d{2})\b")
+_TIME_RE = re.compile(r"\b([01]?\d|2[0-3]):([0-5]\d)(?::[0-5]\d)?\s*(AM|PM)?\b", re.I)
+_ITEM_RE = re.compile(
+    r"^\s*(?:(?P<qty>\d{1,3}(?:[.,]\d+)?)\s*[xX@]\s+)?(?P<desc>.*?[A-Za-zÀ-ÿ].*?)\s+(?P<price>" + AMOUNT + r")\s*[A-Z*]{0,2}\s*$"
+)
+
+TOLERANCE = 0.02
+
+
+def _to_float(text):
+    return float(text.replace("$", "").replace(" ", "").replace(",", "."))
+
+
+def _amounts(line):
+    return [_to_float(a) for a in _AMOUNT_RE.findall(line)]
+
+
+class FastReceiptParser:
+    """
+    Deterministic extractor for printed POS receipts (Surya text -> receipt JSON).
+    Produces exactly the SuryaParser schema, a per-field confidence map next to
+    it, and says whether the result is trustworthy enough to skip the LLM.
+    """
+
+    def __init__(self, min_confidence=0.8):
+        self.min_confidence = min_confidence
+
+    # ---------- field extractors ----------
+    def _labelled_amount(self, lines, pattern):
+        """
+        Last amount on the last line matching `pattern`, or on the next line when
+        that line is a bare amount (label and value split by OCR).
+        Label lines without a value (e.g. "TPS # 123456789 RT0001") are skipped.
+        """
+        for i in range(len(lines) - 1, -1, -1):
+            if not pattern.search(lines[i]):
+                continue
+            found = _amounts(lines[i])
+            if found:
+                return found[-1], 0.95
+            if i + 1 < len(lines) and not re.search(r"[A-Za-z]", lines[i + 1]):
+                found = _amounts(lines[i + 1])
+                if found:
+                    return found[-1], 0.75
+        return None, 0.0
+
+    def _store_name(self, lines):
+        for i, line in enumerate(lines[:5]):
+            text = line.strip()
+            if _GENERIC_HEADERS.match(text):
+                continue
+            letters = sum(c.isalpha() for c in text)
+            if letters >= 3 and letters >= 0.6 * len(text.replace(" ", "")) and not _AMOUNT_RE.search(text):
+                # First distinct name near the top; upper-case banners are the usual brand line
+                return text, 0.9 if (i <= 1 and text.isupper()) else 0.6
+        return None, 0.0
+
+    def _date(self, text):
+        m = _ISO_DATE_RE.search(text)
+        if m:
+            y, mo, d = int(m.group(1)), int(m.group(2)), int(m.group(3))
+            return self._valid_date(y, mo, d, 0.95)
+
+        m = _DMY_DATE_RE.search(text)
+        if m:
+            a, b, y = int(m.group(1)), int(m.group(2)), m.group(3)
+            y = int(y) + 2000 if len(y) == 2 else int(y)
+            if a > 12 >= b:
+                return self._valid_date(y, b, a, 0.9)      # DD/MM
+            if b > 12 >= a:
+                return self._valid_date(y, a, b, 0.9)      # MM/DD
+            return self._valid_date(y, b, a, 0.5)          # ambiguous: assume DD/MM (Quebec)
+        return None, 0.0
+
+    @staticmethod
+    def _valid_date(y, mo, d, confidence):
+        try:
+            return date(y, mo, d).isoformat(), confidence
+        except ValueError:
+            return None, 0.0
+
+    def _time(self, text):
+        m = _TIME_RE.search(text)
+        if not m:
+            return None, 0.0
+        hour, minute, ampm = int(m.group(1)), m.group(2), (m.group(3) or "").upper()
+        if ampm == "PM" and hour < 12:
+            hour += 12
+        if ampm == "AM" and hour == 12:
+            hour = 0
+        return f"{hour:02d}:{minute}", 0.9
+
+    def _items(self, lines):
+        # Products sit between the header block and the first subtotal/total line
+        end = len(lines)
+        for i, line in enumerate(lines):
+            if _SUBTOTAL_RE.search(line) or _TOTAL_RE.search(line):
+                end = i
+                break
+
+        items = []
+        for line in lines[:end]:
+            if _FINANCIAL_RE.search(line):
+                continue
+            m = _ITEM_RE.match(line)
+            if not m:
+                continue
+            qty = _to_float(m.group("qty")) if m.group("qty") else 1.0
+            items.append({"qty": qty, "desc": m.group("desc").strip(), "price": _to_float(m.group("price"))})
+        return items
+
+    # ---------- public API ----------
+    def parse(self, text_content: str) -> FastParse:
+        """
+        `confident` is True only when every key field passes `min_confidence`
+        and the amounts add up.
+        """
+        lines = [l for l in (text_content or "").splitlines() if l.strip()]
+        if not lines or FUEL_RE.search(text_content):
+            return FastParse(None, {}, False)
+
+        total, c_total = self._labelled_amount(lines, _TOTAL_RE)
+        subtotal, _ = self._labelled_amount(lines, _SUBTOTAL_RE)
+        taxes, c_taxes = {}, {}
+        for name, pattern in _TAX_RES.items():
+            value, conf = self._labelled_amount(lines, pattern)
+            if value is not None:
+                taxes[name], c_taxes[name] = value, conf
+        store_name, c_store = self._store_name(lines)
+        receipt_date, c_date = self._date(text_content)
+        receipt_time, c_time = self._time(text_content)
+        items = self._items(lines)
+
+        # --- Cross-checks: the numbers must add up ---
+        tax_sum = round(sum(taxes.values()), 2)
+        items_sum = round(sum(i["price"] for i in items), 2)
+        totals_ok = False
+        if total is not None:
+            base = subtotal if subtotal is not None else items_sum
+            totals_ok = abs(base + tax_sum - total) <= TOLERANCE
+        items_ok = bool(items) and subtotal is not None and abs(items_sum - subtotal) <= TOLERANCE
+
+        confidence = {
+            "store_name": c_store,
+            "date": c_date,
+            "time": c_time,
+            "total_amount": c_total if totals_ok else min(c_total, 0.4),
+            # No tax lines at all is fine (zero-rated groceries) as long as the total adds up
+            "taxes": (min(c_taxes.values()) if c_taxes else 0.9) if totals_ok else 0.0,
+            "items": 0.9 if items_ok else 0.3,
+        }
+        result = {
+            "store_name": store_name,
+            "date": receipt_date,
+            "time": receipt_time,
+            "total_amount": total,
+            "taxes": {"tps": taxes.get("tps", 0.0), "tvq": taxes.get("tvq", 0.0)},
+            "items": items,
+        }
+
+        # Time is optional on many receipts; everything else must be solid.
+        # HST has no field in the schema: those receipts go to the LLM.
+        required = ("store_name", "date", "total_amount", "taxes", "items")
+        confident = "hst" not in taxes and all(confidence[f] >= self.min_confidence for f in required)
+        return FastParse(result, confidence, confident)
@@ -0,0 +1,139 @@
+import io
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+EncodedImage = namedtuple("EncodedImage", ["data", "media_type", "encode_ms", "width", "height"])
+ImageHeader = namedtuple("ImageHeader", ["width", "height", "orientation"])
+
+# Files picked out of zip archives and bulk input directories: what cv2.imdecode can read
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+
+_FORMATS = {
+    "png": (".png", "image/png"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "jpg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp"),
+}
+
+
+def limit_size(image: np.ndarray, max_dim: int) -> np.ndarray:
+    """Downscales so the long side is at most `max_dim` (0 = unchanged)."""
+    h, w = image.shape[:2]
+    if not max_dim or max(h, w) <= max_dim:
+        return image
+    scale = max_dim / max(h, w)
+    return cv2.resize(image, (max(1, round(w * scale)), max(1, round(h * scale))), interpolation=cv2.INTER_AREA)
+
+
+def encode_image(image_bgr: np.ndarray, fmt="png", max_dim=0, quality=90) -> EncodedImage:
+    """
+    OpenCV (BGR) -> compressed bytes, straight from the array (no PIL copy).
+    `quality` applies to JPEG/WebP only.
+    """
+    fmt = fmt.lower()
+    if fmt not in _FORMATS:
+        raise ValueError(f"Unsupported image format '{fmt}'")
+    ext, media_type = _FORMATS[fmt]
+
+    start = time.perf_counter()
+    resized = limit_size(image_bgr, max_dim)
+    if ext == ".jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality]
+    elif ext == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        params = []
+    ok, buf = cv2.imencode(ext, resized, params)
+    if not ok:
+        raise ValueError(f"Encoding to {fmt} failed")
+    encode_ms = (time.perf_counter() - start) * 1000
+
+    h, w = resized.shape[:2]
+    return EncodedImage(buf.tobytes(), media_type, encode_ms, w, h)
+
+
+# ==========================================
+# DECODING
+# ==========================================
+_EXIF_ORIENTATION = 0x0112
+# EXIF orientation -> ops on the stored pixels to get the upright image
+_ORIENT_OPS = {
+    2: [("flip", 1)],
+    3: [("rotate", cv2.ROTATE_180)],
+    4: [("flip", 0)],
+    5: [("rotate", cv2.ROTATE_90_CLOCKWISE), ("flip", 1)],
+    6: [("rotate", cv2.ROTATE_90_CLOCKWISE)],
+    7: [("rotate", cv2.ROTATE_90_COUNTERCLOCKWISE), ("flip", 1)],
+    8: [("rotate", cv2.ROTATE_90_COUNTERCLOCKWISE)],
+}
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+_REDUCED_GRAY_FLAGS = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8
+}
+
+
+def read_header(data) -> ImageHeader:
+    """Stored size and EXIF orientation from the header only (no pixel decode). None if unreadable."""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            orientation = im.getexif().get(_EXIF_ORIENTATION, 1)
+            return ImageHeader(im.width, im.height, orientation if orientation in _ORIENT_OPS else 1)
+    except Exception:
+        return None
+
+
+def reduction_factor(width: int, height: int, max_dim: int) -> int:
+    """Largest of 1/2/4/8 that keeps the long side at or above `max_dim` (0 = full size)."""
+    factor = 1
+    if max_dim:
+        for candidate in (2, 4, 8):
+            if max(width, height) / candidate >= max_dim:
+                factor = candidate
+    return factor
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    for op, arg in _ORIENT_OPS.get(orientation, []):
+        image = cv2.rotate(image, arg) if op == "rotate" else cv2.flip(image, arg)
+    return image
+
+
+def decode_image(data, max_dim=0, header=None, grayscale=False) -> np.ndarray:
+    """
+    Bytes -> upright BGR image whose long side is about `max_dim` (never below it).
+    JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg itself (IMREAD_REDUCED_*),
+    so a 50 MP photo never exists in memory at full size. EXIF orientation is
+    applied explicitly (the stored pixels are decoded as-is).
+    `grayscale` returns a single-channel image instead (cheaper previews).
+    Returns None for empty or undecodable bytes.
+    """
+    if not data:
+        return None
+    header = header or read_header(data)
+    buf = np.frombuffer(data, np.uint8)
+    full_flag = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    try:
+        if header is None:
+            # Unknown to PIL: plain full decode, OpenCV may still manage
+            image = cv2.imdecode(buf, full_flag)
+            return None if image is None else limit_size(image, max_dim)
+
+        factor = reduction_factor(header.width, header.height, max_dim)
+        reduced = _REDUCED_GRAY_FLAGS if grayscale else _REDUCED_FLAGS
+        flags = reduced.get(factor, full_flag) | cv2.IMREAD_IGNORE_ORIENTATION
+        image = cv2.imdecode(buf, flags)
+    except cv2.error:
+        return None  # truncated / corrupt data OpenCV asserts on
+    if image is None:
+        return None
+    image = limit_size(image, max_dim)
+    return apply_orientation(image, header.orientation)
+
+
+def to_pil(image_bgr: np.ndarray) -> Image.Image:
+    """OpenCV (BGR) -> PIL (RGB)."""
+    return Image.fromarray(cv2.cvtColor(image_bgr, cv2.COLOR_BGR2RGB))
@@ -0,0 +1,223 @@
+import ast
+import json
+import operator
+import re
+
+from app.processors.receipt_schema import matches
+
+# Arithmetic the models like to leave in values: "price": 5*2, "total": 4.99 + 1.50.
+# Only * and a spaced +: "-" and "/" also join the parts of dates and phone numbers
+_NUM = r"-?\d+(?:\.\d+)?"
+_ARITHMETIC_RE = re.compile(rf"(?<![\w.\-/]){_NUM}(?:(?:\s*\*\s*|\s+\+\s+){_NUM})+(?![\w.\-/])")
+# Unquoted values that only look like arithmetic: quoted as strings, never evaluated
+_BARE_TEXT_RE = re.compile(
+    r"(?<![\w.\"])("
+    r"\d{4}[-/.]\d{1,2}[-/.]\d{1,2}"                                    # 2024-5-12
+    r"|\d{1,2}[-/.]\d{1,2}[-/.]\d{2,4}"                                 # 12/05/24
+    r"|\d{1,2}:\d{2}(?::\d{2})?"                                        # 18:32
+    r"|(?:\+?1[-.\s])?(?:\(\d{3}\)\s?|\d{3}[-.])\d{3}[-.]\d{4}"         # 514-555-1234
+    r")(?![\w.\"])"
+)
+_TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+_PY_LITERALS = {"None": "null", "True": "true", "False": "false"}
+_PY_LITERAL_RE = re.compile(r"\b(None|True|False)\b")
+_LINE_COMMENT_RE = re.compile(r"//[^\n]*")
+_BLOCK_COMMENT_RE = re.compile(r"/\*.*?\*/", re.DOTALL)
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|$)", re.DOTALL | re.I)
+
+_OPS = {ast.Add: operator.add, ast.Mult: operator.mul, ast.USub: operator.neg}
+
+
+def _safe_eval(expr: str):
+    """Evaluates + and * on numeric literals only (no names, calls or attributes)."""
+
+    def walk(node):
+        if isinstance(node, ast.Expression):
+            return walk(node.body)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+            return node.value
+        if isinstance(node, ast.BinOp) and type(node.op) in _OPS:
+            return _OPS[type(node.op)](walk(node.left), walk(node.right))
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _OPS:
+            return _OPS[type(node.op)](walk(node.operand))
+        raise ValueError("unsupported expression")
+
+    return walk(ast.parse(expr.strip(), mode="eval"))
+
+
+def _format_number(value):
+    value = round(value, 6)
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def _eval_arithmetic(match):
+    text = match.group(0)
+    try:
+        return _format_number(_safe_eval(text))
+    except (ValueError, SyntaxError):
+        return text
+
+
+def _is_apostrophe(text: str, i: int) -> bool:
+    # A ' between letters (Tim Horton's, l'Épicerie) is part of a word, not a quote
+    return 0 < i < len(text) - 1 and text[i - 1].isalnum() and text[i + 1].isalnum()
+
+
+def _slice_object(text: str) -> str:
+    """From the first '{' to its matching '}' (or to the end if the output was truncated)."""
+    start = text.find("{")
+    if start == -1:
+        return None
+    depth, quote, escaped = 0, None, False
+    for i in range(start, len(text)):
+        ch = text[i]
+        if quote:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == quote and not (quote == "'" and _is_apostrophe(text, i)):
+                quote = None
+        elif ch == '"' or (ch == "'" and not _is_apostrophe(text, i)):
+            quote = ch
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    return text[start:]
+
+
+def _tokenize(text: str):
+    """
+    Splits into [(is_string, chunk)]. Single-quoted strings are rewritten as
+    JSON double-quoted strings. An unterminated string runs to the end.
+    """
+    tokens, buf, i = [], [], 0
+    while i < len(text):
+        ch = text[i]
+        is_quote = ch == '"' or (ch == "'" and not _is_apostrophe(text, i))
+        if not is_quote:
+            buf.append(ch)
+            i += 1
+            continue
+
+        if buf:
+            tokens.append((False, "".join(buf)))
+            buf = []
+        quote, j, out = ch, i + 1, []
+        while j < len(text):
+            c = text[j]
+            if c == "\\" and j + 1 < len(text):
+                out.append(text[j:j + 2])
+                j += 2
+                continue
+            if c == quote and not (quote == "'" and _is_apostrophe(text, j)):
+                break
+            out.append('\\"' if (c == '"' and quote == "'") else ("\\n" if c == "\n" else c))
+            j += 1
+        tokens.append((True, '"' + "".join(out) + ('"' if j < len(text) else "")))
+        i = j + 1
+    if buf:
+        tokens.append((False, "".join(buf)))
+    return tokens
+
+
+def _fix_structure(chunk: str) -> str:
+    chunk = _BLOCK_COMMENT_RE.sub("", _LINE_COMMENT_RE.sub("", chunk))
+    chunk = _PY_LITERAL_RE.sub(lambda m: _PY_LITERALS[m.group(1)], chunk)
+    chunk = _BARE_TEXT_RE.sub(lambda m: f'"{m.group(1)}"', chunk)
+    chunk = _ARITHMETIC_RE.sub(_eval_arithmetic, chunk)
+    return chunk
+
+
+def _close_truncated(text: str) -> str:
+    """Drops a dangling key/comma and appends the missing closers."""
+    stack, in_string, escaped = [], False, False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+
+    if in_string:
+        text += '"'
+    if not stack:
+        return text
+
+    text = text.rstrip()
+    # Value cut mid-token: `3.` -> `3`, `tru` -> null
+    text = re.sub(r"(\d)\.$", r"\1", text)
+    text = re.sub(r":\s*(t|tr|tru|f|fa|fal|fals|n|nu|nul)$", ": null", text)
+    # `"key":` or `"key": ` with no value, or a trailing comma
+    text = re.sub(r',?\s*"[^"]*"\s*:\s*$', "", text)
+    text = re.sub(r",\s*$", "", text)
+    return text + "".join(reversed(stack))
+
+
+def repair_json(text: str, schema=None):
+    """
+    Tolerant JSON object recovery for LLM output.
+    Returns (obj, path) where path is "strict" (parsed as-is), "repaired"
+    (needed local fixes), or (None, None) when nothing usable was found.
+    Handles markdown fences, prose around the object, trailing commas,
+    single quotes, comments, Python literals, arithmetic like 5*2, bare
+    dates / times / phone numbers (quoted, not evaluated), missing commas
+    between lines and truncated (unclosed) structures.
+    With `schema`, an object whose present keys have the wrong types counts
+    as a failure, parsed strictly or repaired alike (missing keys are left
+    to the caller, so a reply without e.g. a time doesn't cost a repair call).
+    """
+    if not text:
+        return None, None
+
+    fenced = _FENCE_RE.search(text)
+    candidate = _slice_object(fenced.group(1) if fenced and "{" in fenced.group(1) else text)
+    if candidate is None:
+        return None, None
+
+    try:
+        obj = json.loads(candidate)
+        if isinstance(obj, dict):
+            return (obj, "strict") if _fits(obj, schema) else (None, None)
+    except json.JSONDecodeError:
+        pass
+
+    tokens = _tokenize(candidate)
+    parts = []
+    for idx, (is_string, chunk) in enumerate(tokens):
+        if is_string:
+            parts.append(chunk)
+            continue
+        chunk = _fix_structure(chunk)
+        # Missing comma between a value and the next key on a new line
+        next_is_string = idx + 1 < len(tokens) and tokens[idx + 1][0]
+        if next_is_string and "\n" in chunk:
+            if chunk.strip() == "" and idx > 0:
+                chunk = "," + chunk  # "value"\n"key"
+            else:
+                chunk = re.sub(r"([\d}\]]|true|false|null)(\s*\n\s*)$", r"\1,\2", chunk)
+        parts.append(chunk)
+
+    fixed = _TRAILING_COMMA_RE.sub(r"\1", _close_truncated("".join(parts)))
+    try:
+        obj = json.loads(fixed)
+    except json.JSONDecodeError:
+        return None, None
+    if not isinstance(obj, dict) or not _fits(obj, schema):
+        return None, None
+    return obj, "repaired"
+
+
+def _fits(obj: dict, schema) -> bool:
+    return schema is None or matches(obj, schema, require=False)
@@ -0,0 +1,104 @@
+import json
+
+from app.processors.json_repair import repair_json
+from app.processors.receipt_schema import matches, output_format
+from app.services.cancellation import OperationCancelled, cancel_reason, check_cancelled, current_token
+from app.services.metrics import record_abandoned
+
+
+class JsonObjectStream:
+    """
+    Incremental scanner for streamed LLM output.
+
+    `feed(chunk)` tracks string/escape state and brace depth character by
+    character (O(1) per character, nothing is re-scanned). Each time a
+    top-level `{...}` closes, it is decoded and checked with `accept(obj)`;
+    the first accepted object is kept in `result` and `feed` returns True so
+    the caller can stop generation. Rejected objects (an example, a partial
+    first attempt) are skipped and scanning continues with the next one.
+    """
+
+    def __init__(self, accept=None):
+        self.accept = accept or (lambda obj: isinstance(obj, dict))
+        self.result = None
+        self.objects_seen = 0
+        self._buf = []          # characters of the current top-level object
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def feed(self, chunk: str) -> bool:
+        if self.done:
+            return True
+        for ch in chunk:
+            if self._depth == 0:
+                if ch == "{":
+                    self._buf = [ch]
+                    self._depth = 1
+                continue
+
+            self._buf.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0 and self._complete("".join(self._buf)):
+                    return True
+        return False
+
+    def _complete(self, text: str) -> bool:
+        self.objects_seen += 1
+        try:
+            obj = json.loads(text)
+        except json.JSONDecodeError:
+            return False
+        if self.accept(obj):
+            self.result = obj
+            return True
+        return False
+
+
+def chat_json(client, schema, stream=True, **chat_kwargs):
+    """
+    One chat call that yields receipt JSON. Returns (parsed, path, content);
+    path is "strict" or "repaired" (see `repair_json`), parsed is None on failure.
+
+    With `stream`, generation stops as soon as an object matching `schema` has
+    been produced (or the current CancelToken fires: client gone, deadline passed); the full-text repair
+    pass only runs when no object matched.
+    """
+    chat_kwargs.setdefault("format", output_format(schema))
+    check_cancelled()
+    if stream and hasattr(client, "stream_chat"):
+        scanner = JsonObjectStream(accept=lambda obj: matches(obj, schema))
+        token = current_token()
+        on_content = scanner.feed if token is None else (lambda piece: scanner.feed(piece) or token.cancelled)
+        response = client.stream_chat(on_content=on_content, **chat_kwargs)
+        content = response["message"]["content"]
+        if scanner.done:
+            return scanner.result, "strict", content
+        try:
+            check_cancelled()
+        except OperationCancelled as e:
+            # Generation was stopped mid-stream for a request nobody is waiting on
+            record_abandoned("ollama.stream", cancel_reason(e), skipped=False)
+            raise
+    else:
+        response = client.chat(**chat_kwargs)
+        content = response["message"]["content"]
+
+    parsed, path = repair_json(content, schema)
+    return parsed, path, content
@@ -0,0 +1,95 @@
+from collections import namedtuple
+from difflib import SequenceMatcher
+
+# One recognised line; bbox is (x0, y0, x1, y1) in the coordinates of the image it came from
+OcrLine = namedtuple("OcrLine", ["text", "bbox", "confidence"])
+
+
+# ==========================================
+# 1. SPLITTING
+# ==========================================
+def plan_strips(height: int, width: int, max_aspect=3.0, strip_aspect=2.0, overlap=0.15):
+    """
+    Row ranges [(y0, y1), ...] covering a `height` x `width` crop with
+    overlapping horizontal strips. Crops no taller than `max_aspect` widths
+    come back as a single strip (no tiling). Strips are about `strip_aspect`
+    widths tall and overlap by `overlap` widths, so any line shorter than
+    half the overlap lies whole inside the strip that owns it.
+    """
+    if not max_aspect or height <= width * max_aspect:
+        return [(0, height)]
+
+    strip_h = max(1, round(width * strip_aspect))
+    overlap_px = min(round(width * overlap), strip_h // 2)
+    step = strip_h - overlap_px
+
+    # Even out the strips instead of leaving a sliver at the bottom
+    count = max(1, -(-(height - overlap_px) // step))
+    step = -(-(height - overlap_px) // count)
+    strip_h = step + overlap_px
+
+    strips = []
+    for i in range(count):
+        y0 = i * step
+        strips.append((y0, min(height, y0 + strip_h)))
+    return strips
+
+
+def split_strips(image, strips):
+    """Views (no copies) of `image` for each (y0, y1) of `plan_strips`."""
+    return [image[y0:y1] for y0, y1 in strips]
+
+
+# ==========================================
+# 2. MERGING
+# ==========================================
+def _owned_ranges(strips):
+    # Each overlap is split at its middle: a line belongs to the strip its centre falls in
+    ranges = []
+    for i, (y0, y1) in enumerate(strips):
+        start = 0 if i == 0 else (y0 + strips[i - 1][1]) / 2
+        end = float("inf") if i == len(strips) - 1 else (strips[i + 1][0] + y1) / 2
+        ranges.append((start, end))
+    return ranges
+
+
+def _is_duplicate(a: OcrLine, b: OcrLine, min_similarity=0.8) -> bool:
+    # Same place on the page (mostly the same rows and columns) and nearly the same text
+    ax0, ay0, ax1, ay1 = a.bbox
+    bx0, by0, bx1, by1 = b.bbox
+    v_overlap = min(ay1, by1) - max(ay0, by0)
+    h_overlap = min(ax1, bx1) - max(ax0, bx0)
+    if v_overlap <= 0 or h_overlap <= 0:
+        return False
+    if v_overlap < 0.5 * min(ay1 - ay0, by1 - by0) or h_overlap < 0.5 * min(ax1 - ax0, bx1 - bx0):
+        return False
+    return SequenceMatcher(None, a.text, b.text).ratio() >= min_similarity
+
+
+def merge_strip_lines(strips, strip_lines) -> list:
+    """
+    Lines of every strip (`strip_lines[i]` in strip i's coordinates) ->
+    one list in page coordinates and reading order, each line once.
+
+    A line is kept by the strip its centre falls in (that strip sees it
+    whole). Lines within half a line height of the cut are kept by both
+    strips, so one whose boxes jittered to opposite sides isn't lost, and
+    the second copy is dropped when it matches a line the previous strip kept.
+    """
+    merged, previous = [], []
+    for (y0, _), (own_start, own_end), lines in zip(strips, _owned_ranges(strips), strip_lines):
+        kept = []
+        for line in lines:
+            x0, ly0, x1, ly1 = line.bbox
+            page_line = OcrLine(line.text, (x0, ly0 + y0, x1, ly1 + y0), line.confidence)
+            centre = (page_line.bbox[1] + page_line.bbox[3]) / 2
+            slack = (ly1 - ly0) / 2
+            if not own_start - slack <= centre < own_end + slack:
+                continue
+            if any(_is_duplicate(page_line, other) for other in previous):
+                continue
+            kept.append(page_line)
+        # Surya already returns each strip's lines in reading order
+        merged.extend(kept)
+        previous = kept
+    return merged
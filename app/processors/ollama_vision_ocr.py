@@ -1,6 +1,9 @@
-from ollama import Client
-import json
-import re
+from app.services.ollama_pool import get_ollama_pool
+from app.services.metrics import OLLAMA_PAYLOAD_BYTES, PARSE_ATTEMPTS, llm_call, stage
+from app.processors.json_stream import chat_json
+from app.services.cancellation import OperationCancelled
+from app.processors.receipt_schema import VISION_SCHEMA
+from app import config
 
 # --- MERGED PROMPT: VISION CAPABILITIES + BUSINESS LOGIC ---
 VISION_PROMPT = """
@@ -43,46 +46,76 @@ JSON STRUCTURE:
 }
 """
 
+# --- COMPACT PROMPTS (retail / generic, picked from the crop layout) ---
+# Sent as the system message ahead of the image, so the text prefix is the same
+# for every receipt of a type and a warm Ollama runner reuses it.
+_VISION_CORE = """Extract this receipt into JSON. Output only the JSON object; null for missing fields.
+- store_name: largest brand text near the top; skip "Transaction Record", "Merchant Copy", "Original", "Welcome".
+- date YYYY-MM-DD (ambiguous year: prefer 2024), time HH:MM.
+- tax_tps_amount / tax_tvq_amount: TPS/GST and TVQ/QST amounts ($), not registration numbers.
+- items: never subtotal, tax, total, balance or change lines.
+{rules}
+JSON: {{"store_name": str, "date": str, "time": str, "total_amount": num, "subtotal": num, "tax_tps_amount": num, "tax_tvq_amount": num, "items": [{{"desc": str, "qty": num, "price": num}}]}}"""
+
+_VISION_RULES = {
+    "retail": "- Long receipt: read every product line top to bottom, list repeated lines again. "
+              "price = line total, qty 1 unless shown. Discount lines are not items.",
+    "generic": "- price = line total, qty 1 unless shown. Fuel (Pump, Regular, Diesel): desc = grade, "
+               "qty = litres, price = price per litre.",
+}
+VISION_PROMPTS = {kind: _VISION_CORE.format(rules=rules) for kind, rules in _VISION_RULES.items()}
+
+
+# Ensure this matches the tag you pulled on the server
+VISION_MODEL = "qwen2.5vl:7b"
+
 
 class OllamaVisionOCR:
-    def __init__(self, host="http://173.209.56.38:11434"):
-        self.client = Client(host=host)
-        # Ensure this matches the tag you pulled on the server
-        self.model = "qwen2.5vl:7b"
+    def __init__(self, client=None, model=VISION_MODEL, stream=None):
+        # Shared, load-balanced pool of Ollama backends
+        self.client = client or get_ollama_pool()
+        self.model = model
+        self.stream = config.LLM_STREAMING if stream is None else stream
         print(f"👁️ Vision Engine: Connected to Ollama ({self.model})")
 
-    def parse(self, image_bytes: bytes) -> dict:
+    @staticmethod
+    def messages(image_bytes: bytes, receipt_type=None) -> list:
+        """Chat messages: the compact prompt for `receipt_type` (retail / generic), or the full one (None)."""
+        if receipt_type is None:
+            return [{'role': 'user', 'content': VISION_PROMPT, 'images': [image_bytes]}]
+        return [
+            {'role': 'system', 'content': VISION_PROMPTS[receipt_type]},
+            {'role': 'user', 'content': "Extract this receipt.", 'images': [image_bytes]}
+        ]
+
+    def parse(self, image_bytes: bytes, receipt_type=None) -> dict:
         """
         Sends image bytes directly to the Vision Model (Qwen-VL).
         """
         try:
-            response = self.client.chat(
-                model=self.model,
-                messages=[{
-                    'role': 'user',
-                    'content': VISION_PROMPT,
-                    'images': [image_bytes]
-                }]
-            )
-
-            content = response['message']['content']
-
-            # --- Robust JSON Extraction ---
-            # 1. Try finding JSON between code blocks
-            match = re.search(r'```json\s*(.*?)\s*```', content, re.DOTALL)
-            if match:
-                return json.loads(match.group(1))
-
-            # 2. Try finding raw JSON structure { ... }
-            match = re.search(r'(\{.*\})', content, re.DOTALL)
-            if match:
-                return json.loads(match.group(1))
-
-            # 3. Fail gracefully
+            OLLAMA_PAYLOAD_BYTES.observe(len(image_bytes))
+            messages = self.messages(image_bytes, receipt_type)
+            # --- Streamed generation, stopped once a schema-valid object is out ---
+            # Otherwise: code fences, prose, trailing commas, truncation... repaired locally
+            with stage("vision.llm"), llm_call("vision", receipt_type or "full", messages):
+                parsed, path, content = chat_json(
+                    self.client, VISION_SCHEMA, stream=self.stream,
+                    model=self.model,
+                    messages=messages
+                )
+
+            if parsed:
+                PARSE_ATTEMPTS.labels("vision", "strict" if path == "strict" else "local_repair").inc()
+                return parsed
+
+            # Fail gracefully
+            PARSE_ATTEMPTS.labels("vision", "failed").inc()
             return {
                 "error": "Vision Parsing Failed",
                 "raw_response": content
             }
 
+        except OperationCancelled:
+            raise
         except Exception as e:
             return {"error": f"System Error: {str(e)}"}
\ No newline at end of file
@@ -1,6 +1,6 @@
-from ollama import Client
-import json
-import re
+from app.services.ollama_pool import get_ollama_pool
+from app.services.metrics import PARSE_ATTEMPTS
+from app.processors.json_repair import repair_json
 
 # Strict Prompt for Receipt parsing
 SYSTEM_PROMPT = """
@@ -18,10 +18,11 @@ Return ONLY valid JSON.
 
 
 class ReceiptParser:
-    def __init__(self, host="http://173.209.56.38:11434", model="qwen2.5:7b-instruct-q4_K_M"):
-        self.client = Client(host=host)
+    def __init__(self, client=None, model="qwen2.5:7b-instruct-q4_K_M"):
+        # Shared, load-balanced pool of Ollama backends
+        self.client = client or get_ollama_pool()
         self.model = model
-        print(f"🤖 Parser connected to Ollama at {host}")
+        print(f"🤖 Parser connected to Ollama ({model})")
 
     def parse(self, ocr_text: str) -> dict:
         try:
@@ -34,10 +35,12 @@ class ReceiptParser:
             )
             content = response['message']['content']
 
-            # Robust JSON extraction
-            match = re.search(r'(\{.*\})', content, re.DOTALL)
-            if match:
-                return json.loads(match.group(1))
+            # Robust JSON extraction (with local repair)
+            parsed, path = repair_json(content)
+            if parsed:
+                PARSE_ATTEMPTS.labels("receipt", "strict" if path == "strict" else "local_repair").inc()
+                return parsed
+            PARSE_ATTEMPTS.labels("receipt", "failed").inc()
             return {"error": "JSON Parsing Failed", "raw": content}
         except Exception as e:
             return {"error": f"Ollama Error: {str(e)}"}
\ No newline at end of file
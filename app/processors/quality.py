@@ -0,0 +1,42 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+# All scores are measured on a grayscale copy whose long side is QUALITY_WORK_SIZE:
+#   blur       variance of the Laplacian (higher = sharper)
+#   brightness mean gray level, 0-255
+#   glare      share of pixels blown out to near-white
+#   text       share of pixels on thin dark strokes (printed characters)
+QualityScores = namedtuple("QualityScores", ["blur", "brightness", "glare", "text"])
+QualityThresholds = namedtuple(
+    "QualityThresholds", ["min_blur", "min_brightness", "max_brightness", "max_glare", "min_text"]
+)
+
+_GLARE_LEVEL = 254
+# Dark strokes a few pixels thick stand out of the black-hat transform by this much
+_STROKE_CONTRAST = 40
+
+
+def assess(gray: np.ndarray) -> QualityScores:
+    """Scores one grayscale preview (a few ms at 512 px)."""
+    blur = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+    brightness = float(gray.mean())
+    glare = float(np.count_nonzero(gray >= _GLARE_LEVEL)) / gray.size
+
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (7, 7))
+    strokes = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, kernel)
+    text = float(np.count_nonzero(strokes >= _STROKE_CONTRAST)) / gray.size
+    return QualityScores(round(blur, 1), round(brightness, 1), round(glare, 4), round(text, 4))
+
+
+def failed_checks(scores: QualityScores, thresholds: QualityThresholds) -> list:
+    """[{"check", "score", "limit"}] for every threshold the scores miss (empty = usable)."""
+    checks = [
+        ("blur", scores.blur, thresholds.min_blur, scores.blur < thresholds.min_blur),
+        ("too_dark", scores.brightness, thresholds.min_brightness, scores.brightness < thresholds.min_brightness),
+        ("too_bright", scores.brightness, thresholds.max_brightness, scores.brightness > thresholds.max_brightness),
+        ("glare", scores.glare, thresholds.max_glare, scores.glare > thresholds.max_glare),
+        ("no_text", scores.text, thresholds.min_text, scores.text < thresholds.min_text),
+    ]
+    return [{"check": name, "score": score, "limit": limit} for name, score, limit, failed in checks if failed]
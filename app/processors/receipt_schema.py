@@ -0,0 +1,91 @@
+from app import config
+
+# JSON schemas of the two LLM output shapes. Sent to Ollama as `format` so the
+# model is grammar-constrained, and used locally to decide when a streamed
+# object is complete enough to stop generation.
+_NUMBER = {"type": ["number", "null"]}
+_STRING = {"type": ["string", "null"]}
+
+_ITEM = {
+    "type": "object",
+    "properties": {"qty": _NUMBER, "desc": {"type": "string"}, "price": _NUMBER},
+    "required": ["desc", "price"],
+}
+
+TEXT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "store_name": _STRING,
+        "date": _STRING,
+        "time": _STRING,
+        "total_amount": _NUMBER,
+        "taxes": {
+            "type": "object",
+            "properties": {"tps": _NUMBER, "tvq": _NUMBER},
+            "required": ["tps", "tvq"],
+        },
+        "items": {"type": "array", "items": _ITEM},
+    },
+    "required": ["store_name", "date", "time", "total_amount", "taxes", "items"],
+}
+
+VISION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "store_name": _STRING,
+        "date": _STRING,
+        "time": _STRING,
+        "total_amount": _NUMBER,
+        "subtotal": _NUMBER,
+        "tax_tps_amount": _NUMBER,
+        "tax_tvq_amount": _NUMBER,
+        "items": {"type": "array", "items": _ITEM},
+    },
+    "required": ["store_name", "date", "total_amount", "items"],
+}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def matches(value, schema, require=True) -> bool:
+    """
+    Small subset of JSON Schema: type (single or list), properties, required, items.
+    Extra keys are allowed - the model may add fields we simply ignore.
+    With `require=False` only the keys that are present are checked.
+    """
+    types = schema.get("type")
+    if types:
+        types = types if isinstance(types, list) else [types]
+        # bool is an int subclass; never let true/false pass as a number
+        if isinstance(value, bool) and "boolean" not in types:
+            return False
+        if not any(isinstance(value, _TYPES[t]) for t in types):
+            return False
+
+    if isinstance(value, dict):
+        if require and any(key not in value for key in schema.get("required", ())):
+            return False
+        for key, sub in schema.get("properties", {}).items():
+            if key in value and not matches(value[key], sub, require):
+                return False
+
+    if isinstance(value, list) and "items" in schema:
+        return all(matches(v, schema["items"], require) for v in value)
+    return True
+
+
+def output_format(schema):
+    """The Ollama `format` argument for the configured LLM_OUTPUT_FORMAT."""
+    if config.LLM_OUTPUT_FORMAT == "schema":
+        return schema
+    if config.LLM_OUTPUT_FORMAT == "json":
+        return "json"
+    return None
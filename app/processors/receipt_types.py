@@ -0,0 +1,74 @@
+import re
+
+import cv2
+import numpy as np
+
+from app.processors.fast_parser import AMOUNT, FUEL_RE
+
+# Bump when the rules change (part of the LLM result cache versions)
+RECEIPT_TYPES_VERSION = "1"
+RECEIPT_TYPES = ("fuel", "restaurant", "retail", "generic")
+
+# Served at a table / counter: tips, servers, table or check numbers
+_RESTAURANT_STRONG_RE = re.compile(
+    r"\b(POURBOIRE|TIP|GRATUITY|SERVEURS?|SERVEUSES?|SERVER|TABLE\s*#?\s*\d+|CHECK\s*#|COUVERTS?|GUESTS?)\b", re.I
+)
+_RESTAURANT_RE = re.compile(
+    r"\b(RESTAURANT|BISTRO|BRASSERIE|PIZZERIA|SUSHI|GRILL|DINE[\s-]?IN|TAKE[\s-]?OUT|POUR EMPORTER|SUR PLACE)\b", re.I
+)
+# Store receipts: product codes, item counts, loyalty and return policy footers
+_RETAIL_RE = re.compile(
+    r"\b(UPC|SKU|NB\s+ARTICLES|ARTICLES?\s+VENDUS|ITEMS?\s+SOLD|RETOURS?|RETURNS?|ÉCHANGES?|ECHANGES?|"
+    r"MEMBRE|MEMBER|POINTS|ÉCONOMIES|ECONOMIES|SAVINGS|RABAIS)\b",
+    re.I,
+)
+_PRICED_LINE_RE = re.compile(AMOUNT + r"\s*[A-Z*]{0,2}\s*$")
+# Priced lines that are not items
+_FINANCIAL_RE = re.compile(
+    r"\b(SOUS[\s-]?TOTAL|SUB[\s-]?TOTAL|TOTAL|TPS|TVQ|GST|HST|QST|TAXES?|BALANCE|CHANGE|MONNAIE|"
+    r"VISA|MASTERCARD|DEBIT|COMPTANT|CASH)\b", re.I
+)
+
+# Itemised store receipts have at least this many priced lines
+_RETAIL_MIN_PRICED_LINES = 6
+# Vision path: a crop with this many text rows is a long itemised receipt
+_RETAIL_MIN_ROWS = 28
+_LAYOUT_WIDTH = 256
+
+
+def classify_text(text: str) -> str:
+    """
+    Receipt type from keyword and layout rules on the OCR text (microseconds).
+    Fuel wins on any evidence: its unit-price rules are the costly ones to miss.
+    """
+    text = text or ""
+    if FUEL_RE.search(text):
+        return "fuel"
+    if _RESTAURANT_STRONG_RE.search(text) or len(_RESTAURANT_RE.findall(text)) >= 2:
+        return "restaurant"
+    priced = sum(
+        1 for line in text.splitlines() if _PRICED_LINE_RE.search(line) and not _FINANCIAL_RE.search(line)
+    )
+    if _RETAIL_RE.search(text) or priced >= _RETAIL_MIN_PRICED_LINES:
+        return "retail"
+    return "generic"
+
+
+def count_text_rows(image_bgr: np.ndarray) -> int:
+    """Printed lines on a receipt crop: runs of pixel rows holding dark strokes, at 256 px wide."""
+    gray = cv2.cvtColor(image_bgr, cv2.COLOR_BGR2GRAY) if image_bgr.ndim == 3 else image_bgr
+    h, w = gray.shape[:2]
+    small = cv2.resize(gray, (_LAYOUT_WIDTH, max(1, round(h * _LAYOUT_WIDTH / w))), interpolation=cv2.INTER_AREA)
+    strokes = cv2.morphologyEx(small, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5)))
+    inked = (np.count_nonzero(strokes >= 40, axis=1) >= 3).astype(np.int8)
+    # Each 0 -> 1 transition starts a text row
+    return int(np.count_nonzero(np.diff(inked, prepend=0) == 1))
+
+
+def classify_layout(image_bgr: np.ndarray) -> str:
+    """
+    Receipt type for the vision path, where there is no text yet: only the
+    layout is cheap to read, so long itemised receipts get the retail prompt
+    and everything else the generic one.
+    """
+    return "retail" if count_text_rows(image_bgr) >= _RETAIL_MIN_ROWS else "generic"
@@ -5,6 +5,8 @@ from surya.detection import DetectionPredictor
 from surya.foundation import FoundationPredictor
 from PIL import Image
 
+from app.processors.ocr_tiling import OcrLine
+
 
 class SuryaOCR:
     def __init__(self):
@@ -47,24 +49,37 @@ class SuryaOCR:
 
     def run(self, image_pil: Image.Image) -> str:
         """
-        Takes a PIL Image -> Returns Raw Text String
+        Takes a PIL Image -> Returns Raw Text String ("" if Surya fails on it)
         """
         try:
-            # Run Detection + Recognition
-            # We pass [None] as the second argument because we don't have language hints
-            predictions = self.rec_predictor([image_pil], [None], det_predictor=self.det_predictor)
+            return self.run_batch([image_pil])[0]
+        except Exception as e:
+            print(f"❌ Surya OCR Failed: {e}")
+            return ""
+
+    def run_batch(self, images: list) -> list:
+        """
+        Takes a list of PIL Images -> Returns one Raw Text String per image.
+        One detection + recognition pass for the whole batch.
+        """
+        # Join with newlines to preserve receipt structure
+        return ["\n".join(line.text for line in lines) for lines in self.run_lines_batch(images)]
 
-            result = predictions[0]
+    def run_lines_batch(self, images: list) -> list:
+        """
+        Takes a list of PIL Images -> Returns one list of OcrLine (text, bbox,
+        confidence) per image, in reading order. Used to stitch tiled strips.
+        """
+        # Run Detection + Recognition (raises: the batcher retries a failed batch image by image)
+        # We pass [None] per image because we don't have language hints
+        predictions = self.rec_predictor(images, [None] * len(images), det_predictor=self.det_predictor)
 
+        results = []
+        for result in predictions:
             # Extract and filter text lines
             lines = []
             for line in result.text_lines:
                 if self.is_valid_line(line.text):
-                    lines.append(line.text)
-
-            # Join with newlines to preserve receipt structure
-            return "\n".join(lines)
-
-        except Exception as e:
-            print(f"❌ Surya OCR Failed: {e}")
-            return ""
\ No newline at end of file
+                    lines.append(OcrLine(line.text, tuple(line.bbox), line.confidence))
+            results.append(lines)
+        return results
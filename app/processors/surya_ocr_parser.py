@@ -1,6 +1,11 @@
-from ollama import Client
-import json
-import re
+from app.services.ollama_pool import get_ollama_pool
+from app.services.metrics import PARSE_ATTEMPTS, llm_call, stage
+from app.processors.json_repair import repair_json
+from app.processors.json_stream import chat_json
+from app.services.cancellation import OperationCancelled
+from app.processors.receipt_schema import TEXT_SCHEMA
+from app.processors.receipt_types import classify_text
+from app import config
 
 # --- V6 SYSTEM PROMPT (Optimized for Text Input) ---
 SYSTEM_PROMPT = """
@@ -40,56 +45,94 @@ You are a specialized Receipt OCR Engine. Convert the raw text into strict JSON.
 }
 """
 
+# --- COMPACT PROMPTS (one per receipt type, see receipt_types) ---
+# Shared core + the one rule block that type needs: about a third of the
+# prompt tokens above. Each prompt is a fixed prefix, so a warm Ollama runner
+# reuses its KV cache for every receipt of the same type.
+_TEXT_CORE = """Convert the receipt OCR text into JSON.
+- store_name: first business name in the top lines; skip "Transaction Record", "Merchant Copy", "Original", "Welcome".
+- date YYYY-MM-DD (ambiguous year: prefer 2024), time HH:MM, null when missing.
+- taxes: TPS/GST and TVQ/QST amounts, not registration numbers.
+- items: products only, never subtotal, tax, total, payment or change lines.
+{rules}
+JSON: {{"store_name": str, "date": str, "time": str, "total_amount": num, "taxes": {{"tps": num, "tvq": num}}, "items": [{{"qty": num, "desc": str, "price": num}}]}}"""
+
+_TEXT_RULES = {
+    "fuel": "- Fuel line: desc = grade (Regular, Diesel), qty = litres (42.619L -> 42.619), "
+            "price = unit price per litre (1.619/L -> 1.619); qty * price ~ line total.",
+    "restaurant": "- Dishes and drinks are items (qty from a leading count). Tip / pourboire is not an item; "
+                  "total_amount includes it when printed.",
+    "retail": "- One item per product line, repeated lines listed again. price = line total; qty from "
+              "\"2 @ 3.49\" or \"2 x\" lines, else 1. Discount lines are not items.",
+    "generic": "- price = line total, qty 1 unless shown. Fuel: qty = litres, price = price per litre.",
+}
+TEXT_PROMPTS = {kind: _TEXT_CORE.format(rules=rules) for kind, rules in _TEXT_RULES.items()}
+
+# Using the standard Text model for parsing text input
+TEXT_MODEL = "qwen2.5:7b-instruct-q4_K_M"
+
+
 class SuryaParser:
-    def __init__(self, host="http://173.209.56.38:11434"):
-        self.client = Client(host=host)
-        # Using the standard Text model for parsing text input
-        self.model = "qwen2.5:7b-instruct-q4_K_M"
+    def __init__(self, client=None, model=TEXT_MODEL, stream=None, routing=None):
+        # Shared, load-balanced pool of Ollama backends
+        self.client = client or get_ollama_pool()
+        self.model = model
+        self.stream = config.LLM_STREAMING if stream is None else stream
+        self.routing = config.PROMPT_ROUTING if routing is None else routing
         print(f"🧠 Text Parser: Connected to Ollama ({self.model})")
 
     def extract_json(self, text):
         """
-        Robustly finds the first { and the last } to extract JSON
-        ignoring all intro/outro text.
+        Finds the JSON object in the model output, ignoring intro/outro text,
+        and repairs it locally if needed. Returns (parsed, path).
         """
-        try:
-            match = re.search(r'(\{.*\})', text, re.DOTALL)
-            if match:
-                return json.loads(match.group(1))
-            return None
-        except:
-            return None
+        return repair_json(text)
+
+    def messages(self, text_content: str):
+        """(receipt type, chat messages): the compact prompt for the text's type, or the full one ("full")."""
+        if not self.routing:
+            return "full", [
+                {'role': 'system', 'content': SYSTEM_PROMPT},
+                {'role': 'user', 'content': f"RAW TEXT:\n{text_content}"}
+            ]
+        receipt_type = classify_text(text_content)
+        return receipt_type, [
+            {'role': 'system', 'content': TEXT_PROMPTS[receipt_type]},
+            {'role': 'user', 'content': text_content}
+        ]
 
     def parse(self, text_content: str) -> dict:
         """
-        Pipeline: Raw Text -> LLM (Attempt 1) -> LLM Repair (Attempt 2) -> JSON
+        Pipeline: Raw Text -> LLM (Attempt 1) -> Local Repair -> LLM Repair (last resort) -> JSON
         """
         if not text_content or len(text_content.strip()) < 5:
             return {"error": "OCR Text is empty or too short"}
 
         try:
-            # --- ATTEMPT 1: Main Extraction ---
-            response = self.client.chat(
-                model=self.model,
-                messages=[
-                    {'role': 'system', 'content': SYSTEM_PROMPT},
-                    {'role': 'user', 'content': f"RAW TEXT:\n{text_content}"}
-                ]
-            )
-            content = response['message']['content']
-            parsed = self.extract_json(content)
-
-            # --- ATTEMPT 2: Repair if Failed ---
-            if not parsed:
-                print("⚠️ Text Parser: JSON invalid. Attempting repair...")
-                repair_resp = self.client.chat(
+            # --- ATTEMPT 1: Main Extraction (streamed, stops once the object is complete) ---
+            receipt_type, messages = self.messages(text_content)
+            with stage("surya_parser.llm"), llm_call("surya", receipt_type, messages):
+                parsed, path, content = chat_json(
+                    self.client, TEXT_SCHEMA, stream=self.stream,
                     model=self.model,
-                    messages=[
-                        {'role': 'system', 'content': "You are a code fixer. Fix the following invalid JSON. Remove any math expressions (e.g. '5*2' -> '10'). Return ONLY JSON."},
-                        {'role': 'user', 'content': content}
-                    ]
+                    messages=messages
                 )
-                parsed = self.extract_json(repair_resp['message']['content'])
+
+            # --- ATTEMPT 2: LLM Repair only if local recovery failed ---
+            if not parsed:
+                print("⚠️ Text Parser: JSON unrecoverable locally. Attempting LLM repair...")
+                with stage("surya_parser.repair"):
+                    parsed, _, _ = chat_json(
+                        self.client, TEXT_SCHEMA, stream=self.stream,
+                        model=self.model,
+                        messages=[
+                            {'role': 'system', 'content': "You are a code fixer. Fix the following invalid JSON. Remove any math expressions (e.g. '5*2' -> '10'). Return ONLY JSON."},
+                            {'role': 'user', 'content': content}
+                        ]
+                    )
+                PARSE_ATTEMPTS.labels("surya", "llm_repair" if parsed else "failed").inc()
+            else:
+                PARSE_ATTEMPTS.labels("surya", "strict" if path == "strict" else "local_repair").inc()
 
             if parsed:
                 return parsed
@@ -99,5 +142,7 @@ class SuryaParser:
                     "raw_response": content
                 }
 
+        except OperationCancelled:
+            raise
         except Exception as e:
             return {"error": f"Ollama Error: {str(e)}"}
\ No newline at end of file
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from app.processors.receipt_schema import TEXT_SCHEMA, VISION_SCHEMA, matches
+from app.services.cancellation import CancelToken, DeadlineExceeded, OperationCancelled, run_with_token
+from app.services.executor import crop_pool, surya_pool, vision_pool
+from app.services.metrics import AUTO_SECONDARY, AUTO_WINNER
+from app.services.workflow import (
+    serves_pipeline,
+    workflow_shared_crop,
+    workflow_surya_from_crop,
+    workflow_vision_from_crop,
+)
+from app import config
+
+AUTO_POLICIES = ("cascade", "hedge", "race")
+
+# pipeline -> (workflow on a shared crop, worker pool, schema a usable result must match)
+AUTO_PATHS = {
+    "surya": (workflow_surya_from_crop, surya_pool, TEXT_SCHEMA),
+    "vision": (workflow_vision_from_crop, vision_pool, VISION_SCHEMA),
+}
+
+
+class LatencyTracker:
+    """Sliding window of successful path latencies; hedging waits for their p95."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q, min_samples, default):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return default
+        return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+class AutoRouter:
+    """
+    /ocr/auto: crops once, then runs the Surya and vision pipelines on that crop
+    under one of three policies:
+    - cascade: primary first, secondary only if it errors or fails the schema
+    - hedge:   secondary also starts if the primary hasn't finished by its p95
+    - race:    both start at once
+    The first schema-valid result wins; the other path is cancelled.
+    """
+
+    def __init__(self):
+        self.latency = {name: LatencyTracker() for name in AUTO_PATHS}
+        self._wins = {}
+        self._lock = threading.Lock()
+
+    # ---------- stats ----------
+    def _count(self, policy, winner):
+        AUTO_WINNER.labels(policy, winner or "none").inc()
+        with self._lock:
+            per_policy = self._wins.setdefault(policy, {})
+            per_policy[winner or "none"] = per_policy.get(winner or "none", 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            wins = {policy: dict(counts) for policy, counts in self._wins.items()}
+        return {
+            "wins": wins,
+            "hedge_delay_ms": {
+                name: round(self._hedge_delay(name) * 1000, 1) for name in AUTO_PATHS
+            },
+        }
+
+    def _hedge_delay(self, name):
+        return self.latency[name].percentile(
+            0.95, config.AUTO_HEDGE_MIN_SAMPLES, config.AUTO_HEDGE_DELAY_MS / 1000
+        )
+
+    # ---------- one path ----------
+    async def _run_path(self, name, token, digest, cropped):
+        workflow_fn, pool, schema = AUTO_PATHS[name]
+        start = time.perf_counter()
+        try:
+            # Admission was decided by the crop step; never 503 half-way through a request
+            result = await pool.submit(run_with_token, token, workflow_fn, digest, cropped, admit=False)
+        except DeadlineExceeded as e:
+            return name, {"error": "Deadline exceeded", "detail": str(e)}, False
+        except OperationCancelled:
+            return name, {"error": "cancelled"}, False
+        except Exception as e:
+            print(f"⚠️ Auto: {name} path failed: {e}")
+            return name, {"error": str(e)}, False
+
+        valid = "error" not in result and matches(result, schema)
+        if valid:
+            self.latency[name].record(time.perf_counter() - start)
+        return name, result, valid
+
+    # ---------- public API ----------
+    async def run(self, image_bytes: bytes, policy=None, primary=None, token=None) -> dict:
+        """
+        `token` (optional) carries the request's deadline and disconnect: both
+        paths get child tokens of it, so they stop with the request.
+        """
+        policy = policy or config.AUTO_POLICY
+        primary = primary or config.AUTO_PRIMARY
+        if policy not in AUTO_POLICIES:
+            raise ValueError(f"Unknown policy '{policy}' (expected one of {list(AUTO_POLICIES)})")
+        if primary not in AUTO_PATHS:
+            raise ValueError(f"Unknown primary '{primary}' (expected one of {list(AUTO_PATHS)})")
+
+        order = [primary] + [name for name in AUTO_PATHS if name != primary]
+        order = [name for name in order if serves_pipeline(name)]
+        if not order:
+            raise ValueError("Neither the vision nor the Surya pipeline is served by this replica")
+        started_at = time.perf_counter()
+
+        # Step 1: One crop shared by both paths (this is where admission control applies)
+        digest, cropped = await crop_pool.submit(run_with_token, token, workflow_shared_crop, image_bytes)
+        if cropped is None:
+            self._count(policy, None)
+            return {"winner": None, "policy": policy, "started": [],
+                    "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1),
+                    "result": {"error": "Cropping failed - could not detect receipt"}}
+
+        # Step 2: cascade never hedges, race hedges immediately, hedge waits for the primary's p95
+        delay = {"cascade": None, "race": 0.0}.get(policy, self._hedge_delay(order[0]))
+        tokens = {name: token.child() if token is not None else CancelToken() for name in order}
+        tasks, started, failures = {}, [], []
+
+        def launch(name):
+            started.append(name)
+            task = asyncio.create_task(self._run_path(name, tokens[name], digest, cropped))
+            tasks[task] = name
+            return task
+
+        pending = {launch(order[0])}
+        remaining = order[1:]
+        winner, result = None, None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(
+                    pending, timeout=delay if remaining else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name, path_result, valid = task.result()
+                    if valid and winner is None:
+                        winner, result = name, path_result
+                    elif not valid:
+                        failures.append((name, path_result))
+
+                if winner is None and remaining:
+                    if done:
+                        reason = "error" if "error" in failures[-1][1] else "invalid"
+                    else:
+                        reason = "race" if policy == "race" else "slow"
+                    AUTO_SECONDARY.labels(policy, reason).inc()
+                    pending.add(launch(remaining.pop(0)))
+        finally:
+            # Losers stop at their next checkpoint / stream chunk; don't wait for them
+            for task in pending:
+                tokens[tasks[task]].cancel("lost_race" if winner else "abandoned")
+                task.add_done_callback(lambda t: t.exception() if not t.cancelled() else None)
+
+        if winner is None and token is not None:
+            # The request itself was cancelled or timed out: not a pipeline failure
+            token.check()
+            if all(f[1].get("error") == "Deadline exceeded" for f in failures):
+                raise DeadlineExceeded(failures[0][1]["detail"])
+        self._count(policy, winner)
+        if winner is None:
+            # Every started path failed: surface the primary's error
+            result = min(failures, key=lambda f: order.index(f[0]))[1]
+        return {
+            "winner": winner,
+            "policy": policy,
+            "started": started,
+            "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1),
+            "result": result,
+        }
+
+
+auto_router = AutoRouter()
@@ -0,0 +1,316 @@
+"""
+Offline bulk (re)processing of a receipt archive.
+
+    python -m app.services.bulk ./archive --out data/results.jsonl
+    python -m app.services.bulk manifest.txt --pipeline vision --out data/vision.jsonl --llm-workers 16
+
+Runs the workflow as overlapping stages joined by bounded queues (a full
+queue blocks the stage that feeds it, so memory stays flat):
+
+    read -> crop (process pool on CPU hosts) -> Surya (micro-batched) -> LLM (concurrent) -> JSONL
+
+The crop stage uses CROP_PROCESSES worker processes when that is set, else
+one per core on a CPU-only host and the in-process cropper on a GPU.
+
+Every stage output goes to the result cache's disk tier (--artifacts), keyed
+by content digest and the version of whatever produced it (crops as PNG, or
+JPEG with CACHE_IMAGE_FORMAT=jpeg; CACHE_DISK_MAX_BYTES caps the directory).
+Each receipt enters at the latest stage whose artifact is still valid: after
+a prompt change only the LLM stage runs again.
+
+The output file is the checkpoint: receipts already in it are skipped, so an
+interrupted run resumes where it stopped. With --retry-errors failed
+receipts run again and the last line per path wins.
+"""
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+
+from app.processors.image_io import IMAGE_EXTENSIONS
+from app.services.cache import content_digest, result_cache
+from app import config
+
+_DONE = object()  # end-of-input marker, one per stage worker
+
+
+def list_inputs(source: str) -> list:
+    """Image paths under a directory (recursive, sorted) or listed in a manifest (one per line, # comments)."""
+    if os.path.isdir(source):
+        paths = []
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            paths.extend(
+                os.path.join(root, name) for name in sorted(files)
+                if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+            )
+        return paths
+
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source) as f:
+        lines = [line.strip() for line in f]
+    return [line if os.path.isabs(line) else os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+
+def default_crop_processes() -> int:
+    """CROP_PROCESSES if configured; otherwise one per core on CPU-only hosts, 0 (in-process) on a GPU."""
+    if "CROP_PROCESSES" in os.environ:
+        return config.CROP_PROCESSES
+    try:
+        import onnxruntime as ort
+        if "CUDAExecutionProvider" in ort.get_available_providers():
+            return 0
+    except ImportError:
+        pass
+    return os.cpu_count() or 1
+
+
+def load_checkpoint(out_path: str, retry_errors=False) -> set:
+    """Paths already in the output file (only successful ones with `retry_errors`)."""
+    if not os.path.exists(out_path):
+        return set()
+    with open(out_path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            # Killed mid-write: drop the partial line so appends start clean
+            data = data[:data.rfind(b"\n") + 1]
+            f.truncate(len(data))
+
+    status = {}
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        status[record["path"]] = record["status"]
+    return {path for path, s in status.items() if s == "ok" or not retry_errors}
+
+
+class _Stage:
+    """`workers` threads applying `fn` to items from `inbox`; `on_close` runs once the last one stops."""
+
+    def __init__(self, name, fn, workers, inbox, on_close):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.on_close = on_close
+        self._running = self.workers
+        self._lock = threading.Lock()
+
+    def start(self):
+        for i in range(self.workers):
+            threading.Thread(target=self._run, name=f"bulk-{self.name}-{i}", daemon=True).start()
+
+    def close(self):
+        for _ in range(self.workers):
+            self.inbox.put(_DONE)
+
+    def _run(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                break
+            self.fn(item)
+        with self._lock:
+            self._running -= 1
+            last = self._running == 0
+        if last:
+            self.on_close()
+
+
+def _per_item(fn):
+    # A failing receipt becomes an error line; its stage keeps going
+    def run(self, item):
+        try:
+            fn(self, item)
+        except Exception as e:
+            self._emit(item, error=f"{type(e).__name__}: {e}")
+    return run
+
+
+class BulkRun:
+    """One pass over `paths` for `pipeline` (surya | vision), appending results to `out_path`."""
+
+    def __init__(self, pipeline, out_path, crop_workers, ocr_workers, llm_workers, queue_size=64, progress_every=10.0,
+                 read_workers=4):
+        from app.services import workflow
+        self.workflow = workflow
+        self.pipeline = pipeline
+        self.final_stage = f"{pipeline}_json"
+        self.out_path = out_path
+        self.progress_every = progress_every
+
+        self.read_queue = queue.Queue(queue_size)
+        self.crop_queue = queue.Queue(queue_size)
+        self.ocr_queue = queue.Queue(queue_size)
+        self.llm_queue = queue.Queue(queue_size)
+        self.out_queue = queue.Queue(queue_size)
+
+        self.llm_stage = _Stage("llm", self._llm, llm_workers, self.llm_queue, lambda: self.out_queue.put(_DONE))
+        if pipeline == "surya":
+            self.ocr_stage = _Stage("ocr", self._ocr, ocr_workers, self.ocr_queue, self.llm_stage.close)
+            self.crop_stage = _Stage("crop", self._crop, crop_workers, self.crop_queue, self.ocr_stage.close)
+        else:
+            self.ocr_stage = None
+            self.crop_stage = _Stage("crop", self._crop, crop_workers, self.crop_queue, self.llm_stage.close)
+        # Reading and hashing overlap with the other stages (sha256 releases the GIL)
+        self.read_stage = _Stage("read", self._enter, read_workers, self.read_queue, self.crop_stage.close)
+
+        self.counts = {"ok": 0, "error": 0}
+        self.entries = {"read": 0, "crop": 0, "ocr": 0, "llm": 0, "stored": 0}
+
+    # ---------- stages ----------
+    def _emit(self, item, result=None, error=None):
+        if error is not None:
+            result = {"error": error}
+        status = "error" if "error" in result else "ok"
+        self.out_queue.put({
+            "path": item["path"],
+            "digest": item["digest"],
+            "status": status,
+            "entry": item["entry"],
+            "seconds": round(time.perf_counter() - item["start"], 3),
+            "result": result,
+        })
+
+    @_per_item
+    def _enter(self, item):
+        """Routes a receipt to the latest stage whose input is already stored."""
+        with open(item["path"], "rb") as f:
+            data = f.read()
+        item["digest"] = digest = content_digest(data)
+
+        stored = self.workflow.workflow_artifact(self.final_stage, digest)
+        if stored is not None:
+            item["entry"] = "stored"
+            self._emit(item, stored)
+            return
+        if self.pipeline == "surya":
+            text = self.workflow.workflow_artifact("surya_text", digest)
+            if text is not None:
+                item["entry"], item["text"] = "llm", text
+                self.llm_queue.put(item)
+                return
+        crop = self.workflow.workflow_artifact("crop", digest)
+        if crop is not None:
+            item["entry"], item["crop"] = ("ocr" if self.ocr_stage else "llm"), crop
+            (self.ocr_queue if self.ocr_stage else self.llm_queue).put(item)
+            return
+        item["entry"], item["data"] = "crop", data
+        self.crop_queue.put(item)
+
+    @_per_item
+    def _crop(self, item):
+        crop = self.workflow.workflow_crop(item.pop("data"), item["digest"])
+        if crop is None:
+            self._emit(item, error="Cropping failed - could not detect receipt")
+            return
+        item["crop"] = crop
+        (self.ocr_queue if self.ocr_stage else self.llm_queue).put(item)
+
+    @_per_item
+    def _ocr(self, item):
+        item["text"] = self.workflow.workflow_surya_text(item["digest"], item.pop("crop"))
+        self.llm_queue.put(item)
+
+    @_per_item
+    def _llm(self, item):
+        if self.pipeline == "surya":
+            result = self.workflow.workflow_surya_parse(item["digest"], item["text"])
+        else:
+            result = self.workflow.workflow_vision_from_crop(item["digest"], item.pop("crop"))
+        self._emit(item, result)
+
+    # ---------- output ----------
+    def _write(self, total):
+        started = last_report = time.perf_counter()
+        written = 0
+        with open(self.out_path, "a") as out:
+            while True:
+                record = self.out_queue.get()
+                if record is _DONE:
+                    break
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                written += 1
+                self.counts[record["status"]] += 1
+                self.entries[record["entry"]] += 1
+                if written % 100 == 0:
+                    os.fsync(out.fileno())
+
+                now = time.perf_counter()
+                if now - last_report >= self.progress_every:
+                    last_report = now
+                    print(f"📦 Bulk: {written}/{total} ({written / (now - started):.1f}/s) "
+                          f"queues read={self.read_queue.qsize()} crop={self.crop_queue.qsize()} ocr={self.ocr_queue.qsize()} "
+                          f"llm={self.llm_queue.qsize()}")
+            os.fsync(out.fileno())
+
+    def run(self, paths: list) -> dict:
+        stages = [self.read_stage, self.crop_stage, self.ocr_stage, self.llm_stage]
+        for s in stages:
+            if s is not None:
+                s.start()
+        writer = threading.Thread(target=self._write, args=(len(paths),), name="bulk-writer", daemon=True)
+        writer.start()
+
+        started = time.perf_counter()
+        # A full read queue blocks here, a full crop / OCR / LLM queue blocks the readers
+        for path in paths:
+            self.read_queue.put({"path": path, "digest": None, "entry": "read", "start": time.perf_counter()})
+        self.read_stage.close()
+        writer.join()
+
+        elapsed = time.perf_counter() - started
+        return {"receipts": len(paths), **self.counts, "entered_at": dict(self.entries),
+                "seconds": round(elapsed, 1), "per_second": round(len(paths) / elapsed, 2) if elapsed else None}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("source", help="directory of receipt images or a manifest file (one path per line)")
+    ap.add_argument("--out", required=True, help="JSONL output; also the resume checkpoint")
+    ap.add_argument("--pipeline", choices=["surya", "vision"], default="surya")
+    ap.add_argument("--artifacts", default=config.CACHE_DIR or "data/artifacts",
+                    help="where crops, OCR text and results are stored for later runs")
+    ap.add_argument("--crop-processes", type=int, default=None,
+                    help="cropper worker processes (default: CROP_PROCESSES if set, else one per core "
+                         "on CPU-only hosts; 0 = in-process, e.g. on a GPU)")
+    ap.add_argument("--read-workers", type=int, default=4, help="threads reading and hashing input files")
+    ap.add_argument("--ocr-workers", type=int, default=2 * config.SURYA_MAX_BATCH,
+                    help="receipts in flight to Surya (enough to keep its batches full)")
+    ap.add_argument("--llm-workers", type=int, default=config.NETWORK_STAGE_CONCURRENCY,
+                    help="concurrent Ollama calls (also capped by NETWORK_STAGE_CONCURRENCY)")
+    ap.add_argument("--queue-size", type=int, default=64, help="receipts buffered between two stages")
+    ap.add_argument("--retry-errors", action="store_true", help="re-run receipts whose last result was an error")
+    args = ap.parse_args()
+
+    # Before the first component loads: the cropper reads this when it is built
+    config.CROP_PROCESSES = default_crop_processes() if args.crop_processes is None else args.crop_processes
+    result_cache.enable_disk(args.artifacts)
+
+    paths = list_inputs(args.source)
+    done = load_checkpoint(args.out, args.retry_errors)
+    todo = [path for path in paths if path not in done]
+    print(f"📦 Bulk: {len(paths)} receipts, {len(paths) - len(todo)} already in {args.out}, {len(todo)} to run "
+          f"({args.pipeline}, artifacts in {args.artifacts})")
+    if not todo:
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    crop_workers = config.CROP_PROCESSES or config.GPU_STAGE_CONCURRENCY
+    run = BulkRun(args.pipeline, args.out, crop_workers, args.ocr_workers, args.llm_workers, args.queue_size,
+                  read_workers=args.read_workers)
+    try:
+        summary = run.run(todo)
+    except KeyboardInterrupt:
+        print(f"⏹️ Bulk: interrupted; run the same command again to resume from {args.out}")
+        return
+    print(f"✅ Bulk: {json.dumps(summary)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import cv2
+import numpy as np
+
+from app import config
+from app.processors.image_io import encode_image
+from app.services.cancellation import OperationCancelled, check_cancelled, current_token
+from app.services.metrics import register_cache
+
+
+def content_digest(data: bytes) -> str:
+    """SHA-256 of the uploaded bytes (the content address)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def version_tag(*parts) -> str:
+    """Short, stable tag for model names / prompt text that affect a stage output."""
+    h = hashlib.sha256("|".join(str(p) for p in parts).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, np.ndarray):
+        # A view keeps its whole base array alive: count that
+        return value.base.nbytes if isinstance(value.base, np.ndarray) else value.nbytes
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+# Disk entries: pickles, or crops stored as images (whichever CACHE_IMAGE_FORMAT was current)
+_DISK_EXTENSIONS = (".pkl", ".png", ".jpg")
+
+
+def _decode_array(data: bytes) -> np.ndarray:
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_UNCHANGED)
+    if image is None:
+        raise ValueError("not a decodable image")
+    return image
+
+
+# Followers re-check their own request this often while waiting on a leader
+_FOLLOWER_POLL_SECONDS = 0.1
+# Times a follower takes over from a cancelled leader before computing on its own
+_MAX_TAKEOVERS = 2
+
+
+def _wait_for(leader: Future):
+    """The leader's value; raises OperationCancelled as soon as the caller's own token is cancelled."""
+    token = current_token()
+    while True:
+        if token is not None:
+            token.check()
+        try:
+            return leader.result(timeout=_FOLLOWER_POLL_SECONDS)
+        except FutureTimeout:
+            continue
+
+
+def _cacheable(value) -> bool:
+    # Never cache failures: a retry should get a fresh attempt
+    if value is None:
+        return False
+    if isinstance(value, dict):
+        return "error" not in value
+    if isinstance(value, str):
+        return bool(value.strip())
+    return True
+
+
+class ResultCache:
+    """
+    Two-tier (memory LRU + optional disk) cache with single-flight.
+    Keys are `stage/<content digest>-<version tag>`.
+    Concurrent callers asking for the same key wait on one computation.
+    """
+
+    def __init__(self, max_items=256, max_bytes=512 * 1024 * 1024, disk_dir=None, disk_max_bytes=0):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir or None
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None        # counted on the first write
+        self._disk_lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> (value, size)
+        self._memory_bytes = 0
+        self._inflight = {}            # key -> Future
+        self._lock = threading.Lock()
+        self._stats = {}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # ---------- stats ----------
+    def _count(self, stage, field):
+        stage_stats = self._stats.setdefault(stage, {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0})
+        stage_stats[field] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_enabled": self.disk_dir is not None,
+                "disk_bytes": self._disk_bytes,
+                "stages": {stage: dict(s) for stage, s in self._stats.items()},
+            }
+
+    # ---------- memory tier ----------
+    def _memory_put(self, key, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        self._memory[key] = (value, size)
+        self._memory_bytes += size
+
+        while len(self._memory) > self.max_items or self._memory_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+
+    # ---------- disk tier ----------
+    def _disk_path(self, key, ext=".pkl"):
+        stage, name = key.split("/", 1)
+        return os.path.join(self.disk_dir, stage, name[:2], f"{name}{ext}")
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+        for ext in _DISK_EXTENSIONS:
+            path = self._disk_path(key, ext)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            try:
+                value = pickle.loads(data) if ext == ".pkl" else _decode_array(data)
+                os.utime(path)  # mtime = last use, for the size cap
+                return value
+            except Exception as e:
+                print(f"⚠️ Cache: Dropping unreadable entry {path}: {e}")
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                return None
+        return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+        try:
+            if isinstance(value, np.ndarray):
+                # Crops: a compressed image, not a pickled raw array
+                ext = ".jpg" if config.CACHE_IMAGE_FORMAT in ("jpg", "jpeg") else ".png"
+                data = encode_image(value, fmt=ext[1:], quality=config.CACHE_IMAGE_QUALITY).data
+            else:
+                ext = ".pkl"
+                data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            path = self._disk_path(key, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)  # atomic: readers never see half a file
+        except Exception as e:
+            print(f"⚠️ Cache: Disk write failed for {key}: {e}")
+            return
+
+        if self.disk_max_bytes:
+            with self._disk_lock:
+                if self._disk_bytes is None:
+                    self._disk_bytes = sum(size for _, size, _ in self._disk_files())
+                else:
+                    self._disk_bytes += len(data)
+                if self._disk_bytes > self.disk_max_bytes:
+                    self._disk_trim()
+
+    def _disk_files(self):
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue  # removed by another process
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def _disk_trim(self):
+        # Least recently used first, down to 90% so the next writes don't trim again.
+        # Rescanning also picks up what other processes sharing the directory wrote.
+        files = sorted(self._disk_files())
+        total = sum(size for _, size, _ in files)
+        target = self.disk_max_bytes * 0.9
+        removed = 0
+        for _, size, path in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._disk_bytes = total
+        print(f"🧹 Cache: Trimmed {removed} disk entries to {total / 1024 ** 2:.0f} MB")
+
+    # ---------- public API ----------
+    def enable_disk(self, disk_dir: str):
+        """Adds (or moves) the disk tier, e.g. to the bulk CLI's artifact directory."""
+        os.makedirs(disk_dir, exist_ok=True)
+        with self._disk_lock:
+            self.disk_dir = disk_dir
+            self._disk_bytes = None
+
+    def peek(self, stage: str, key: str):
+        """The stored value for `stage/key` (memory, then disk) or None; never computes."""
+        full_key = f"{stage}/{key}"
+        with self._lock:
+            if full_key in self._memory:
+                return self._memory[full_key][0]
+        return self._disk_get(full_key)
+
+    def get_or_compute(self, stage: str, key: str, compute):
+        """
+        Returns the cached value for `stage/key`, or runs `compute()` once
+        (even with many concurrent callers) and stores a successful result.
+        """
+        full_key = f"{stage}/{key}"
+
+        future = None
+        for _ in range(_MAX_TAKEOVERS + 1):
+            with self._lock:
+                if full_key in self._memory:
+                    self._memory.move_to_end(full_key)
+                    self._count(stage, "hits")
+                    return self._memory[full_key][0]
+
+                leader = self._inflight.get(full_key)
+                if leader is None:
+                    future = Future()
+                    self._inflight[full_key] = future
+                    break
+                self._count(stage, "coalesced")
+
+            # Follower: wait for the identical in-flight request
+            try:
+                return _wait_for(leader)
+            except OperationCancelled:
+                # Ours was cancelled: stop here. The leader's was: take over (loop)
+                check_cancelled()
+        # Leaders kept giving up (e.g. a run of disconnecting clients): compute
+        # alongside whichever is in flight instead of queueing behind it again
+        try:
+            value = self._disk_get(full_key)
+            if value is not None:
+                with self._lock:
+                    self._count(stage, "disk_hits")
+                    self._memory_put(full_key, value)
+            else:
+                with self._lock:
+                    self._count(stage, "misses")
+                value = compute()
+                if _cacheable(value):
+                    with self._lock:
+                        self._memory_put(full_key, value)
+                    self._disk_put(full_key, value)
+            if future is not None:
+                future.set_result(value)
+            return value
+        except BaseException as e:
+            if future is not None:
+                future.set_exception(e)
+            raise
+        finally:
+            if future is not None:
+                with self._lock:
+                    self._inflight.pop(full_key, None)
+
+
+result_cache = ResultCache(
+    max_items=config.CACHE_MAX_ITEMS,
+    max_bytes=config.CACHE_MAX_BYTES,
+    disk_dir=config.CACHE_DIR,
+    disk_max_bytes=config.CACHE_DISK_MAX_BYTES,
+)
+register_cache(result_cache)
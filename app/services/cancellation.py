@@ -0,0 +1,120 @@
+import contextvars
+import threading
+import time
+
+# Reasons a token is cancelled with (also the `reason` label of the abandoned-work metrics)
+DEADLINE = "deadline"
+DISCONNECTED = "disconnected"
+
+
+class OperationCancelled(Exception):
+    """The work was abandoned (e.g. it lost a race); raised at the next checkpoint."""
+
+
+class DeadlineExceeded(OperationCancelled):
+    """The request's deadline passed, or the next stage can't finish before it."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for the threaded workflow code.
+    Blocking stages can't be interrupted, so long-running steps call
+    `check_cancelled()` between stages and streamed LLM calls poll `cancelled`
+    to close the stream early.
+
+    `deadline` (a time.monotonic() value) cancels the token once it passes.
+    """
+
+    def __init__(self, deadline=None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._children = []
+        self.deadline = deadline
+        self.reason = None
+
+    @classmethod
+    def with_timeout(cls, seconds):
+        return cls(None if seconds is None else time.monotonic() + seconds)
+
+    def child(self) -> "CancelToken":
+        """Token with the same deadline, cancelled with this one but also cancellable on its own."""
+        child = CancelToken(self.deadline)
+        with self._lock:
+            self._children.append(child)
+        if self._event.is_set():
+            child.cancel(self.reason)
+        return child
+
+    def cancel(self, reason="cancelled"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            children = list(self._children)
+        for child in children:
+            child.cancel(reason)
+
+    def remaining(self):
+        """Seconds left before the deadline (None = no deadline)."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE)
+        return self._event.is_set()
+
+    def check(self):
+        if self.cancelled:
+            if self.reason == DEADLINE:
+                raise DeadlineExceeded("deadline passed")
+            raise OperationCancelled(self.reason)
+
+    def check_budget(self, seconds: float, what: str):
+        """Checkpoint before a step expected to take `seconds`: raises if it can't finish in time."""
+        self.check()
+        remaining = self.remaining()
+        if remaining is not None and seconds > remaining:
+            raise DeadlineExceeded(f"{what} needs ~{seconds:.1f}s, {max(remaining, 0.0):.1f}s left")
+
+
+# Token of the work running in this context (copied into WorkerPool threads)
+_current_token = contextvars.ContextVar("cancel_token", default=None)
+
+
+def current_token():
+    return _current_token.get()
+
+
+def check_cancelled():
+    """Checkpoint: raises OperationCancelled if the current work was cancelled."""
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+def check_budget(seconds: float, what: str):
+    """Checkpoint: like `check_cancelled`, and raises DeadlineExceeded if `what` can't finish in time."""
+    token = _current_token.get()
+    if token is not None:
+        token.check_budget(seconds, what)
+
+
+def cancel_reason(error: OperationCancelled) -> str:
+    """Metric label for why the work was abandoned."""
+    if isinstance(error, DeadlineExceeded):
+        return DEADLINE
+    token = _current_token.get()
+    return (token.reason if token is not None else None) or "cancelled"
+
+
+def run_with_token(token, fn, *args, **kwargs):
+    """Runs `fn` with `token` as the current token (use as the WorkerPool job)."""
+    reset = _current_token.set(token)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _current_token.reset(reset)
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+
+from app.services import shm
+from app.services.metrics import INPUT_IMAGE_MEGAPIXELS, record_crop_outcome, record_stage, start_request_timings
+
+# ==========================================
+# 1. WORKER PROCESS SIDE
+# ==========================================
+_cropper = None
+
+
+def _init_worker(model_name, proxy_size, alpha_matting, intra_op_threads, inter_op_threads, graph_optimization,
+                 decode_max_dim, mode, classic):
+    global _cropper
+    import cv2
+    from app.processors.cropper import ImageCropper, make_session_options
+
+    # ORT already gets this process's share of the cores; OpenCV must not fan out on top
+    cv2.setNumThreads(1)
+    _cropper = ImageCropper(
+        model_name=model_name,
+        proxy_size=proxy_size,
+        alpha_matting=alpha_matting,
+        session_options=make_session_options(intra_op_threads, inter_op_threads, graph_optimization),
+        decode_max_dim=decode_max_dim,
+        mode=mode,
+        classic=classic,
+    )
+
+
+def _ping(delay):
+    # Used by warm-up: occupies a worker so the next ping lands on another one
+    time.sleep(delay)
+    return os.getpid()
+
+
+def _crop_in_worker(name, size, mode):
+    """
+    Decodes straight out of the parent's shared-memory block and returns the
+    crop as a new block (descriptor only) plus the stage timings and which
+    tier cropped it (metrics are recorded by the parent).
+    """
+    import numpy as np
+
+    timings = start_request_timings()
+    block = shm.attach(name)
+    view = block.buf[:size]
+    try:
+        original, megapixels = _cropper.decode(view)
+    finally:
+        view.release()
+        block.close()
+    if original is None:
+        return None, timings, 0.0, None
+
+    outcome = _cropper.crop_tiered(original, mode)
+    # Plain tuple: unpickling CropOutcome would import the cropper (rembg, ORT) into the parent
+    tier = (outcome.tier, outcome.reason, outcome.classic_seconds, outcome.segment_seconds)
+    return shm.put_array(np.ascontiguousarray(outcome.image)), timings, megapixels, tier
+
+
+# ==========================================
+# 2. PARENT SIDE
+# ==========================================
+class CropperProcessPool:
+    """
+    `ImageCropper.process` spread over N processes, each with its own ONNX
+    Runtime session (own threads, no shared GIL). Uploads and crops move
+    through shared memory; only block names are pickled.
+    """
+
+    def __init__(self, processes, model_name="birefnet-general", proxy_size=1024, alpha_matting=False,
+                 intra_op_threads=0, inter_op_threads=1, graph_optimization="all", decode_max_dim=0,
+                 mode="auto", classic=None):
+        self.processes = processes
+        self.model_name = model_name
+        if not intra_op_threads:
+            # Split the cores between the workers instead of each one grabbing all of them
+            intra_op_threads = max(1, (os.cpu_count() or 1) // processes)
+        self.mode = mode
+        self._initargs = (model_name, proxy_size, alpha_matting, intra_op_threads, inter_op_threads, graph_optimization,
+                          decode_max_dim, mode, classic)
+        self._lock = threading.Lock()
+        self._executor = self._start()
+        print(f"✅ Cropper: {processes} worker processes x {intra_op_threads} intra-op threads "
+              f"(inter-op {inter_op_threads}, graph optimization '{graph_optimization}')")
+
+    def _start(self):
+        executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=self._initargs,
+        )
+        # Load a session in every worker now rather than on the first requests
+        list(executor.map(_ping, [0.5] * self.processes))
+        return executor
+
+    def _restart(self, broken):
+        with self._lock:
+            if self._executor is broken:
+                print("⚠️ Cropper: worker process died, restarting the pool")
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._start()
+
+    def process(self, image_bytes: bytes, mode=None):
+        mode = mode or self.mode
+        block = shm.put_bytes(image_bytes)
+        executor = self._executor
+        try:
+            descriptor, timings, megapixels, tier = executor.submit(
+                _crop_in_worker, block.name, len(image_bytes), mode
+            ).result()
+        except BrokenProcessPool:
+            self._restart(executor)
+            raise
+        finally:
+            block.close()
+            block.unlink()
+
+        # Stage timings were taken in the worker; replay them here for /metrics and X-Stage-Timings
+        for name, ms in timings.items():
+            record_stage(name, ms / 1000)
+        if descriptor is None:
+            return None
+        INPUT_IMAGE_MEGAPIXELS.observe(megapixels)
+        record_crop_outcome(mode, *tier)
+        return shm.take_array(descriptor)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,72 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import config
+from app.services.metrics import QUEUE_DEPTH
+
+
+class PoolFullError(Exception):
+    """Raised when a pool already holds `workers + queue` requests."""
+
+    def __init__(self, pool_name, retry_after):
+        super().__init__(f"{pool_name} pool is at capacity")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+
+class WorkerPool:
+    """
+    Bounded executor for the blocking workflow functions.
+    Keeps the event loop free and rejects new work instead of queueing forever.
+    """
+
+    def __init__(self, name, max_workers, max_queue):
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._pending = 0
+        self._lock = threading.Lock()
+        QUEUE_DEPTH.labels(name).set_function(lambda: self._pending)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    async def submit(self, fn, *args, admit=True, **kwargs):
+        """
+        Runs `fn` on the pool. With `admit=False` the capacity check is skipped
+        (for callers like /ocr/batch that bound their own concurrency).
+        """
+        with self._lock:
+            if admit and self._pending >= self.capacity:
+                raise PoolFullError(self.name, config.RETRY_AFTER_SECONDS)
+            self._pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            # Carry the request context (e.g. stage timings) into the worker thread
+            ctx = contextvars.copy_context()
+            return await loop.run_in_executor(self.executor, ctx.run, functools.partial(fn, *args, **kwargs))
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+
+# ==========================================
+# POOLS (one per pipeline)
+# ==========================================
+vision_pool = WorkerPool("vision", config.VISION_POOL_WORKERS, config.VISION_POOL_QUEUE)
+surya_pool = WorkerPool("surya", config.SURYA_POOL_WORKERS, config.SURYA_POOL_QUEUE)
+crop_pool = WorkerPool("crop", config.CROP_POOL_WORKERS, config.CROP_POOL_QUEUE)
+
+# ==========================================
+# STAGE LIMITS (shared across pipelines)
+# ==========================================
+# GPU stages: birefnet cropper, Surya OCR
+gpu_slots = threading.BoundedSemaphore(config.GPU_STAGE_CONCURRENCY)
+# Network stages: Ollama calls
+network_slots = threading.BoundedSemaphore(config.NETWORK_STAGE_CONCURRENCY)
@@ -0,0 +1,134 @@
+import json
+
+from app.processors.image_io import read_header
+from app import config
+
+_CHUNK = 1024 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Upload (or its decoded pixel count) is over the configured cap."""
+
+    def __init__(self, message, limit):
+        super().__init__(message)
+        self.limit = limit
+
+
+# ==========================================
+# 1. REQUEST BODY CAP (before multipart parsing)
+# ==========================================
+class BodySizeLimit:
+    """
+    ASGI middleware: rejects a request body over `max_bytes` with 413 as soon
+    as Content-Length says so, or once that many bytes have streamed in
+    (chunked uploads), instead of letting the multipart parser spool it all.
+    `overrides` maps path -> cap for endpoints that take many files.
+    """
+
+    def __init__(self, app, max_bytes, overrides=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.overrides = overrides or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+
+        limit = self.overrides.get(scope["path"], self.max_bytes)
+        declared = dict(scope["headers"]).get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await _reject(send, limit)
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            # Past the cap the 413 goes out from here and the app only sees a
+            # disconnect, so it never gets a chance to answer with its own error.
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    rejected = True
+                    if not response_started:
+                        await _reject(send, limit)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            response_started = response_started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except Exception:
+            # e.g. ClientDisconnect from the form parser, after the 413 was sent
+            if not rejected:
+                raise
+
+
+def _format_bytes(n):
+    if n >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.0f} MB"
+    if n >= 1024:
+        return f"{n / 1024:.0f} KB"
+    return f"{n} bytes"
+
+
+async def _reject(send, limit):
+    body = json.dumps({"error": f"Upload too large (limit {_format_bytes(limit)})"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": 413,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close")],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+# ==========================================
+# 2. PER-FILE READ
+# ==========================================
+def check_pixels(data: bytes, max_pixels=None):
+    """Rejects decompression bombs from the header alone (nothing is decoded)."""
+    max_pixels = config.UPLOAD_MAX_PIXELS if max_pixels is None else max_pixels
+    header = read_header(data)
+    if header is not None and max_pixels and header.width * header.height > max_pixels:
+        raise UploadTooLarge(
+            f"Image is {header.width}x{header.height} ({header.width * header.height / 1e6:.0f} MP), "
+            f"limit {max_pixels / 1e6:.0f} MP", max_pixels
+        )
+    return header
+
+
+async def read_upload(file, max_bytes=None, max_pixels=None) -> bytes:
+    """
+    Reads an UploadFile in chunks with a byte cap (the multipart parser has
+    already spooled it to disk past 1 MB), then checks the pixel count
+    (`max_pixels=0` skips that, e.g. for zip archives).
+    """
+    max_bytes = max_bytes or config.UPLOAD_MAX_BYTES
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"{file.filename} is {file.size} bytes (limit {max_bytes})", max_bytes)
+
+    chunks, total = [], 0
+    while True:
+        chunk = await file.read(_CHUNK)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLarge(f"{file.filename} is over {max_bytes} bytes", max_bytes)
+        chunks.append(chunk)
+
+    data = b"".join(chunks)
+    if max_pixels != 0:
+        check_pixels(data, max_pixels)
+    return data
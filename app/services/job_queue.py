@@ -0,0 +1,229 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from app import config
+
+# queued -> running -> done
+#              |-> queued (retry, after backoff) -> ... -> dead (dead letter)
+JOB_STATUSES = ("queued", "running", "done", "dead")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id           TEXT PRIMARY KEY,
+    pipeline     TEXT NOT NULL,
+    status       TEXT NOT NULL,
+    payload      BLOB,
+    webhook_url  TEXT,
+    result       TEXT,
+    error        TEXT,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_run_at  REAL NOT NULL,
+    lease_until  REAL,
+    worker       TEXT,
+    webhook_status TEXT,
+    created_at   REAL NOT NULL,
+    updated_at   REAL NOT NULL,
+    finished_at  REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, next_run_at);
+"""
+
+# Columns returned by get() (never the upload itself)
+_PUBLIC_COLUMNS = (
+    "id", "pipeline", "status", "webhook_url", "result", "error", "attempts", "max_attempts",
+    "next_run_at", "worker", "webhook_status", "created_at", "updated_at", "finished_at",
+)
+
+
+class JobQueue:
+    """
+    Persistent job queue in one SQLite file (WAL), shared by the API process
+    and any number of worker processes.
+
+    Workers hold a lease on a running job and renew it while working; a job
+    whose lease expired (worker crashed, pod restarted) is claimed again.
+    Attempts are counted at claim time so a receipt that kills its worker
+    still ends up dead-lettered instead of looping forever. complete / fail
+    only apply while the caller still holds the lease: a worker whose lease
+    ran out can't overwrite the job another worker has re-claimed.
+    """
+
+    def __init__(self, path, max_attempts=3, lease_seconds=120.0, backoff_base=5.0, backoff_max=300.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._local = threading.local()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        # One connection per thread (sqlite3 connections aren't shareable across threads)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- producer side ----------
+    def enqueue(self, pipeline: str, payload: bytes, webhook_url=None) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, pipeline, status, payload, webhook_url, max_attempts, next_run_at, created_at, updated_at) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, pipeline, payload, webhook_url, self.max_attempts, now, now, now),
+        )
+        return job_id
+
+    def get(self, job_id: str):
+        row = self._conn().execute(
+            f"SELECT {', '.join(_PUBLIC_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def counts(self) -> dict:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def backlog(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+    # ---------- worker side ----------
+    def claim(self, worker: str):
+        """
+        Atomically takes the oldest runnable job: queued and due, or running
+        with an expired lease. Returns (job_id, pipeline, payload, webhook_url) or None.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT id, pipeline, payload, webhook_url, attempts, max_attempts FROM jobs "
+                "WHERE (status = 'queued' AND next_run_at <= ?) OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY next_run_at LIMIT 1",
+                (now, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            if row["attempts"] >= row["max_attempts"]:
+                # Its last attempt died with the worker
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', payload = NULL, error = 'worker lost during final attempt', "
+                    "lease_until = NULL, updated_at = ?, finished_at = ? WHERE id = ?",
+                    (now, now, row["id"]),
+                )
+                conn.execute("COMMIT")
+                print(f"☠️ Jobs: {row['id']} dead-lettered (worker lost on final attempt)")
+                return self.claim(worker)
+
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, lease_until = ?, updated_at = ? "
+                "WHERE id = ?",
+                (worker, now + self.lease_seconds, now, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return row["id"], row["pipeline"], row["payload"], row["webhook_url"]
+
+    def renew(self, job_id: str, worker: str):
+        self._conn().execute(
+            "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, time.time(), job_id, worker),
+        )
+
+    def complete(self, job_id: str, worker: str, result: dict) -> bool:
+        """Stores the result; False if `worker` no longer holds the job (lease lost)."""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE jobs SET status = 'done', result = ?, error = NULL, payload = NULL, lease_until = NULL, "
+            "updated_at = ?, finished_at = ? WHERE id = ? AND status = 'running' AND worker = ?",
+            (json.dumps(result), now, now, job_id, worker),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker: str, error: str, result=None, retryable=True):
+        """
+        Schedules a retry with exponential backoff, or dead-letters (at once when
+        not `retryable`). Returns the new status, or None if `worker` no longer
+        holds the job (lease lost).
+        """
+        conn = self._conn()
+        now = time.time()
+        result_json = json.dumps(result) if result is not None else None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND worker = ?",
+                (job_id, worker),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            if not retryable or row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', error = ?, result = ?, payload = NULL, lease_until = NULL, "
+                    "updated_at = ?, finished_at = ? WHERE id = ?",
+                    (error, result_json, now, now, job_id),
+                )
+                conn.execute("COMMIT")
+                return "dead"
+
+            delay = min(self.backoff_max, self.backoff_base * 2 ** (row["attempts"] - 1))
+            delay *= random.uniform(0.8, 1.2)  # jitter: don't retry a whole outage's worth in lockstep
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', error = ?, result = ?, next_run_at = ?, lease_until = NULL, "
+                "updated_at = ? WHERE id = ?",
+                (error, result_json, now + delay, now, job_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return "queued"
+
+    def set_webhook_status(self, job_id: str, status: str):
+        self._conn().execute("UPDATE jobs SET webhook_status = ? WHERE id = ?", (status, job_id))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide queue handle, built from config on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(
+                config.JOBS_DB,
+                max_attempts=config.JOB_MAX_ATTEMPTS,
+                lease_seconds=config.JOB_LEASE_SECONDS,
+                backoff_base=config.JOB_BACKOFF_SECONDS,
+                backoff_max=config.JOB_BACKOFF_MAX_SECONDS,
+            )
+        return _queue
@@ -0,0 +1,198 @@
+"""
+Job worker processes for the /jobs API.
+
+    python -m app.services.job_worker --workers 2
+
+Each process claims jobs from the SQLite queue, runs the same workflow
+functions as the synchronous endpoints, stores the result and calls the
+job's webhook. The API process also starts JOB_WORKERS of these at startup
+(default 0: each worker loads its own models, so run them next to the model
+server with `python -m app.services.model_server --http-workers N` instead).
+"""
+import argparse
+import ipaddress
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from app.services.job_queue import get_job_queue
+from app import config
+
+
+def _pipelines():
+    # Imported here: loading workflow pulls in the (lazily built) model components
+    from app.services.workflow import workflow_surya_pipeline, workflow_vision_direct
+    return {"vision": workflow_vision_direct, "surya": workflow_surya_pipeline}
+
+
+JOB_PIPELINES = ("vision", "surya")
+
+# Failures caused by the receipt itself: a retry would fail the same way, so they are dead-lettered at once
+NON_RETRYABLE_ERRORS = ("Cropping failed", "OCR Text is empty")
+
+
+def webhook_url_error(url: str):
+    """
+    Why `url` can't be a webhook target, or None. Only http(s); with
+    JOB_WEBHOOK_ALLOWED_HOSTS set the host must be one of them (or a
+    subdomain), otherwise it must not resolve to a private, loopback,
+    link-local or reserved address.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        return "webhook_url must be an http(s) URL"
+    host = parts.hostname.lower().rstrip(".")
+
+    if config.JOB_WEBHOOK_ALLOWED_HOSTS:
+        if any(host == allowed or host.endswith("." + allowed) for allowed in config.JOB_WEBHOOK_ALLOWED_HOSTS):
+            return None
+        return f"webhook host '{host}' is not in JOB_WEBHOOK_ALLOWED_HOSTS"
+
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        return f"webhook host '{host}' does not resolve"
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%")[0])
+        if not ip.is_global or ip.is_multicast:
+            return f"webhook host '{host}' resolves to a non-public address ({ip})"
+    return None
+
+
+def send_webhook(url: str, payload: dict, attempts=3) -> str:
+    """POSTs the job outcome; returns "delivered" or the last error."""
+    # Checked again at send time: the name may resolve elsewhere now
+    blocked = webhook_url_error(url)
+    if blocked:
+        return f"blocked ({blocked})"
+    last_error = None
+    for attempt in range(attempts):
+        try:
+            response = httpx.post(url, json=payload, timeout=config.JOB_WEBHOOK_TIMEOUT)
+            if response.status_code < 400:
+                return "delivered"
+            last_error = f"HTTP {response.status_code}"
+        except httpx.HTTPError as e:
+            last_error = f"{type(e).__name__}: {e}"
+        if attempt < attempts - 1:
+            time.sleep(2 ** attempt)
+    return f"failed ({last_error})"
+
+
+class _LeaseKeeper:
+    """Renews the job lease in the background while the workflow runs."""
+
+    def __init__(self, queue, job_id, worker):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(queue, job_id, worker), daemon=True)
+
+    def _run(self, queue, job_id, worker):
+        while not self._stop.wait(queue.lease_seconds / 3):
+            queue.renew(job_id, worker)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+
+def run_worker(worker_name=None, stop_event=None):
+    """Claim -> run -> complete / retry / dead-letter, until `stop_event` is set."""
+    queue = get_job_queue()
+    pipelines = _pipelines()
+    worker = worker_name or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    print(f"👷 Job Worker {worker}: polling {config.JOBS_DB}")
+
+    while not stop_event.is_set():
+        claimed = queue.claim(worker)
+        if claimed is None:
+            stop_event.wait(config.JOB_POLL_SECONDS)
+            continue
+
+        job_id, pipeline, payload, webhook_url = claimed
+        print(f"👷 Job Worker {worker}: running {job_id} ({pipeline})")
+        try:
+            with _LeaseKeeper(queue, job_id, worker):
+                result = pipelines[pipeline](payload)
+            error = result.get("error") if isinstance(result, dict) else None
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+
+        if error is None:
+            status = "done" if queue.complete(job_id, worker, result) else None
+        else:
+            status = queue.fail(job_id, worker, error, result, retryable=not error.startswith(NON_RETRYABLE_ERRORS))
+            if status:
+                print(f"⚠️ Job Worker {worker}: {job_id} failed ({error}) -> {status}")
+        if status is None:
+            # The lease ran out and another worker owns the job now: its outcome counts
+            print(f"⏱️ Job Worker {worker}: lost the lease on {job_id}, outcome dropped")
+            continue
+
+        # Webhook only on a final outcome (done or dead), never on a scheduled retry
+        if webhook_url and status != "queued":
+            job = queue.get(job_id)
+            queue.set_webhook_status(job_id, send_webhook(webhook_url, {
+                "id": job_id, "status": status, "pipeline": pipeline,
+                "result": job["result"], "error": job["error"], "attempts": job["attempts"],
+            }))
+
+
+def _process_main(index):
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    run_worker(f"{socket.gethostname()}-{os.getpid()}-w{index}", stop_event)
+
+
+def start_worker_processes(count: int):
+    """Spawns `count` worker processes (spawn: no CUDA / thread state inherited)."""
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for i in range(count):
+        p = ctx.Process(target=_process_main, args=(i,), name=f"job-worker-{i}", daemon=True)
+        p.start()
+        processes.append(p)
+    return processes
+
+
+def stop_worker_processes(processes, timeout=10.0):
+    # SIGTERM lets the current job finish; an unfinished one is re-claimed after its lease
+    for p in processes:
+        p.terminate()
+    for p in processes:
+        p.join(timeout)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=1)
+    args = ap.parse_args()
+
+    if args.workers == 1:
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+        try:
+            run_worker(stop_event=stop_event)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    processes = start_worker_processes(args.workers)
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        stop_worker_processes(processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+import contextvars
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# ==========================================
+# 1. METRIC DEFINITIONS
+# ==========================================
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+_BYTES_BUCKETS = (16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6, 32e6)
+_TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+REQUEST_SECONDS = Histogram(
+    "receipt_request_seconds", "End-to-end HTTP request latency", ["path", "status"], buckets=_LATENCY_BUCKETS
+)
+STAGE_SECONDS = Histogram(
+    "receipt_stage_seconds", "Time spent in each workflow stage", ["stage"], buckets=_LATENCY_BUCKETS
+)
+INPUT_IMAGE_BYTES = Histogram(
+    "receipt_input_image_bytes", "Size of uploaded images", buckets=_BYTES_BUCKETS
+)
+INPUT_IMAGE_MEGAPIXELS = Histogram(
+    "receipt_input_image_megapixels", "Decoded size of uploaded images", buckets=(0.5, 1, 2, 4, 8, 12, 16, 24, 32, 48, 64)
+)
+OLLAMA_PAYLOAD_BYTES = Histogram(
+    "receipt_ollama_payload_bytes", "Image bytes sent to Ollama per call", buckets=_BYTES_BUCKETS
+)
+LLM_PROMPT_TOKENS = Histogram(
+    "receipt_llm_prompt_tokens", "Prompt tokens per Ollama call", ["model"], buckets=_TOKEN_BUCKETS
+)
+LLM_COMPLETION_TOKENS = Histogram(
+    "receipt_llm_completion_tokens", "Generated tokens per Ollama call", ["model"], buckets=_TOKEN_BUCKETS
+)
+LLM_PROMPT_EVAL_SECONDS = Histogram(
+    "receipt_llm_prompt_eval_seconds", "Ollama-reported prompt (prefill) time", ["model"], buckets=_LATENCY_BUCKETS
+)
+LLM_EVAL_SECONDS = Histogram(
+    "receipt_llm_eval_seconds", "Ollama-reported generation time", ["model"], buckets=_LATENCY_BUCKETS
+)
+PARSE_ATTEMPTS = Counter(
+    "receipt_parse_attempts_total", "LLM output parse path (strict / local_repair / llm_repair / failed)", ["parser", "outcome"]
+)
+QUEUE_DEPTH = Gauge(
+    "receipt_queue_depth", "Requests pending on a worker pool or scheduler", ["queue"]
+)
+FAST_PATH = Counter(
+    "receipt_fast_path_total", "Rule-based parser outcomes (hit = LLM skipped)", ["outcome"]
+)
+FAST_PATH_CONFIDENCE = Histogram(
+    "receipt_fast_path_confidence", "Rule-based parser confidence per field", ["field"],
+    buckets=(0.1, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0)
+)
+LLM_STREAMS = Counter(
+    "receipt_llm_streams_total", "Streamed Ollama calls by how they ended (early_stop / complete)", ["model", "outcome"]
+)
+LLM_TIME_TO_RESULT = Histogram(
+    "receipt_llm_time_to_result_seconds", "Streamed call start -> usable JSON (or end of stream)", ["model"],
+    buckets=_LATENCY_BUCKETS
+)
+AUTO_WINNER = Counter(
+    "receipt_auto_winner_total", "/ocr/auto outcomes by policy and winning pipeline (none = both failed)", ["policy", "winner"]
+)
+AUTO_SECONDARY = Counter(
+    "receipt_auto_secondary_total", "/ocr/auto second-path launches by reason (error / invalid / slow / race)", ["policy", "reason"]
+)
+REQUEST_PEAK_RSS_GROWTH = Histogram(
+    "receipt_request_peak_rss_growth_bytes", "How much a request raised the process RSS high-water mark",
+    ["path"], buckets=(0, 1e6, 8e6, 32e6, 64e6, 128e6, 256e6, 512e6, 1e9, 2e9)
+)
+CROP_TIER = Counter(
+    "receipt_crop_tier_total", "Cropper tier that produced each crop (fast = classical, model = birefnet, "
+    "none = forced fast path failed)", ["mode", "tier"]
+)
+CROP_FAST_CHECKS = Counter(
+    "receipt_crop_fast_checks_total", "Classical crop outcomes (accepted or the quality check that failed)", ["outcome"]
+)
+CROP_FAST_SECONDS = Counter(
+    "receipt_crop_fast_seconds_total", "Classical crop time effect: saved = recent mean segmentation time minus the "
+    "classical time on accepted crops, wasted = classical time before a fallback (net = saved - wasted)", ["kind"]
+)
+QUALITY_GATE = Counter(
+    "receipt_quality_gate_total", "Quality gate outcomes per endpoint (passed or each failed check)", ["endpoint", "outcome"]
+)
+SURYA_BATCH_SIZE = Histogram(
+    "receipt_surya_batch_size", "Images per batched Surya pass", buckets=(1, 2, 4, 8, 16, 32)
+)
+SURYA_STRIPS = Histogram(
+    "receipt_surya_strips", "Strips per receipt sent to Surya (1 = not tiled)", buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+ABANDONED_WORK = Counter(
+    "receipt_abandoned_work_total", "Stages skipped, queued Surya images dropped and Ollama calls stopped because the "
+    "request was cancelled (reason: deadline / disconnected / lost_race / abandoned)", ["stage", "reason"]
+)
+LLM_PROMPT_CHARS = Histogram(
+    "receipt_llm_prompt_chars", "Text sent per parser LLM call (prompt + OCR text; ~4 chars per token, images "
+    "excluded) by receipt type (full = routing off)", ["pipeline", "receipt_type"],
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000)
+)
+LLM_CALL_SECONDS = Histogram(
+    "receipt_llm_call_seconds", "Parser LLM call latency by receipt type (full = routing off)",
+    ["pipeline", "receipt_type"], buckets=_LATENCY_BUCKETS
+)
+ABANDONED_SECONDS = Counter(
+    "receipt_abandoned_seconds_total", "Estimated work saved: recent mean duration of each stage skipped for a "
+    "cancelled request", ["stage", "reason"]
+)
+
+
+# ==========================================
+# 2. PER-REQUEST TIMING BREAKDOWN
+# ==========================================
+# Dict of stage -> ms for the current request. Shared (not copied) with worker
+# threads because WorkerPool runs jobs inside a copy of the request context.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+# Running mean per stage: what the next run is expected to take (deadline checks, abandoned-work savings)
+_stage_means = {}
+
+
+def start_request_timings() -> dict:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def record_stage(name: str, seconds: float, completed=True):
+    """
+    Adds one stage duration to the histogram and the current request breakdown
+    (and, if the stage `completed`, to its running mean).
+    """
+    STAGE_SECONDS.labels(name).observe(seconds)
+    if completed:
+        mean = _stage_means.get(name)
+        _stage_means[name] = seconds if mean is None else 0.9 * mean + 0.1 * seconds
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds * 1000
+
+
+def merge_request_timings(timings_ms: dict):
+    """
+    Adds stage times measured in another process (the model server, which
+    exports its own histograms) to the current request breakdown only.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        for name, ms in timings_ms.items():
+            timings[name] = timings.get(name, 0.0) + ms
+
+
+def expected_stage_seconds(name: str) -> float:
+    """Recent mean duration of a stage (0 until it has run once)."""
+    return _stage_means.get(name, 0.0)
+
+
+def record_abandoned(stage_name: str, reason: str, skipped=True):
+    """Counts work dropped for a cancelled request; `skipped` stages also add their expected time."""
+    ABANDONED_WORK.labels(stage_name, reason).inc()
+    if skipped:
+        ABANDONED_SECONDS.labels(stage_name, reason).inc(expected_stage_seconds(stage_name))
+
+
+@contextmanager
+def stage(name: str):
+    """Times a workflow stage into the histogram and the request breakdown."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        # A stage cut short (cancelled, failed) would drag the expected duration down
+        record_stage(name, time.perf_counter() - start, completed=False)
+        raise
+    record_stage(name, time.perf_counter() - start)
+
+
+@contextmanager
+def llm_call(pipeline: str, receipt_type: str, messages: list):
+    """
+    Prompt size and latency of one parser LLM call per receipt type. Sizes are
+    counted here: an early-stopped stream never gets Ollama's prompt_eval_count.
+    """
+    LLM_PROMPT_CHARS.labels(pipeline, receipt_type).observe(sum(len(m.get("content", "")) for m in messages))
+    start = time.perf_counter()
+    yield
+    LLM_CALL_SECONDS.labels(pipeline, receipt_type).observe(time.perf_counter() - start)
+
+
+def format_timings(timings: dict) -> str:
+    """`stage=ms;stage=ms` for the X-Stage-Timings response header."""
+    return ";".join(f"{name}={ms:.1f}" for name, ms in timings.items())
+
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux /proc; 0 elsewhere)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def peak_rss_bytes() -> int:
+    """Process RSS high-water mark (ru_maxrss is KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def format_memory(rss_start: int, peak_start: int) -> str:
+    """`rss_mb=..;peak_mb=..;peak_growth_mb=..` for the X-Memory response header."""
+    mb = 1024 * 1024
+    peak = peak_rss_bytes()
+    return f"rss_mb={rss_bytes() / mb:.0f};rss_start_mb={rss_start / mb:.0f};peak_mb={peak / mb:.0f};peak_growth_mb={(peak - peak_start) / mb:.0f}"
+
+
+_segment_mean = None  # running mean of birefnet time, to price skipped segmentations
+
+
+def record_crop_outcome(mode: str, tier: str, reason, classic_seconds=0.0, segment_seconds=0.0):
+    """Counts which cropper tier ran and what the classical path saved (or cost)."""
+    global _segment_mean
+    CROP_TIER.labels(mode, tier).inc()
+    if reason:
+        CROP_FAST_CHECKS.labels(reason).inc()
+    if segment_seconds:
+        _segment_mean = segment_seconds if _segment_mean is None else 0.9 * _segment_mean + 0.1 * segment_seconds
+        if classic_seconds:
+            CROP_FAST_SECONDS.labels("wasted").inc(classic_seconds)
+    elif tier == "fast" and _segment_mean is not None:
+        CROP_FAST_SECONDS.labels("saved").inc(max(0.0, _segment_mean - classic_seconds))
+
+
+def observe_llm_response(model: str, response):
+    """Records token counts / durations Ollama reports on a finished chat."""
+    prompt_tokens = response.get("prompt_eval_count")
+    completion_tokens = response.get("eval_count")
+    if prompt_tokens:
+        LLM_PROMPT_TOKENS.labels(model).observe(prompt_tokens)
+    if completion_tokens:
+        LLM_COMPLETION_TOKENS.labels(model).observe(completion_tokens)
+    if response.get("prompt_eval_duration"):
+        LLM_PROMPT_EVAL_SECONDS.labels(model).observe(response.get("prompt_eval_duration") / 1e9)
+    if response.get("eval_duration"):
+        LLM_EVAL_SECONDS.labels(model).observe(response.get("eval_duration") / 1e9)
+
+
+# ==========================================
+# 3. CACHE COUNTERS
+# ==========================================
+class CacheCollector:
+    """Exports ResultCache.stats() at scrape time."""
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.stats()
+        lookups = CounterMetricFamily(
+            "receipt_cache_lookups", "Result cache lookups by stage and outcome", labels=["stage", "outcome"]
+        )
+        for stage_name, counts in stats["stages"].items():
+            for outcome, value in counts.items():
+                lookups.add_metric([stage_name, outcome], value)
+        yield lookups
+        yield GaugeMetricFamily("receipt_cache_memory_bytes", "Bytes held in the memory tier", value=stats["memory_bytes"])
+        yield GaugeMetricFamily("receipt_cache_memory_items", "Entries held in the memory tier", value=stats["memory_items"])
+
+
+def register_cache(cache):
+    REGISTRY.register(CacheCollector(cache))
+
+
+# ==========================================
+# 4. JOB QUEUE
+# ==========================================
+class JobQueueCollector:
+    """Exports job counts per status from the shared SQLite queue at scrape time."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def collect(self):
+        jobs = GaugeMetricFamily("receipt_jobs", "Jobs in the persistent queue by status", labels=["status"])
+        for status, count in self.queue.counts().items():
+            jobs.add_metric([status], count)
+        yield jobs
+
+
+_job_queue_collector = None
+_job_queue_lock = threading.Lock()
+
+
+def register_job_queue(queue):
+    """Exports `queue` once per process (later calls are no-ops)."""
+    global _job_queue_collector
+    with _job_queue_lock:
+        if _job_queue_collector is None:
+            _job_queue_collector = JobQueueCollector(queue)
+            REGISTRY.register(_job_queue_collector)
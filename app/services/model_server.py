@@ -0,0 +1,374 @@
+"""
+Shared model server: one process holds the cropper (birefnet) and Surya, and
+every uvicorn worker and job worker on the host uses them over a unix socket.
+
+    python -m app.services.model_server                     # models only
+    python -m app.services.model_server --http-workers 4    # models + the API on 4 uvicorn workers
+
+Processes started with MODEL_SERVER_SOCKET set (the launcher sets it) get
+socket-backed stand-ins from `get_cropper()` / `get_surya_batcher()` instead of
+loading the models themselves. Uploads, crops and OCR strips travel as memfd
+file descriptors passed over the socket: the receiver maps the sender's
+buffer, so pixels are never pickled or pushed through the socket. Only small
+headers (sizes, shapes, OCR lines, stage timings) are pickled.
+"""
+import argparse
+import multiprocessing
+import os
+import queue
+import socket
+import threading
+import time
+from contextlib import nullcontext
+from multiprocessing.connection import Client, Listener
+from multiprocessing.reduction import recvfds, sendfds
+
+import numpy as np
+
+from app.services import shm
+from app.services.cancellation import CancelToken, DeadlineExceeded, OperationCancelled, current_token, run_with_token
+from app.services.metrics import merge_request_timings, start_request_timings
+from app import config
+
+
+class ModelServerUnavailable(RuntimeError):
+    """The model server socket can't be reached (not started yet, or restarting)."""
+
+
+def _send_fds(conn, fds):
+    with socket.fromfd(conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        sendfds(s, fds)
+
+
+def _recv_fds(conn, count):
+    with socket.fromfd(conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        return recvfds(s, count)
+
+
+# ==========================================
+# 1. SERVER (the only process that loads the models)
+# ==========================================
+class ModelServer:
+    """
+    Protocol, one request at a time per connection:
+      -> (op, args, n_fds) [+ n_fds descriptors]
+      <- (status, payload, n_fds) [+ n_fds descriptors]
+    Received descriptors belong to the handler, which maps (and so closes) them first.
+    """
+
+    COMPONENTS = ("cropper", "surya_batcher")  # everything else stays in the workers
+
+    def __init__(self, address):
+        self.address = address
+        self.components = {}
+        self._loaded = threading.Event()
+        self._load_error = None
+
+    def _load(self):
+        # Same factories (and settings) as in-process mode; one failing model doesn't keep the other out
+        from app.services import workflow
+        factories = {"cropper": workflow.make_local_cropper, "surya_batcher": workflow.make_local_surya_batcher}
+        errors = []
+        try:
+            for name in self.COMPONENTS:
+                if name not in workflow.ROLE_COMPONENTS[config.SERVICE_ROLE]:
+                    continue
+                try:
+                    self.components[name] = factories[name]()
+                except Exception as e:
+                    errors.append(f"{name}: {type(e).__name__}: {e}")
+                    print(f"❌ Model Server: loading {name} failed ({type(e).__name__}: {e})")
+            self._load_error = "; ".join(errors) or None
+            print(f"✅ Model Server: {', '.join(sorted(self.components)) or 'no models'} loaded")
+        finally:
+            self._loaded.set()
+
+    def _component(self, name):
+        self._loaded.wait()
+        if name not in self.components:
+            reason = self._load_error or f"not part of role '{config.SERVICE_ROLE}'"
+            raise RuntimeError(f"{name} is not loaded on the model server ({reason})")
+        return self.components[name]
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            os.unlink(self.address)  # stale socket from a previous run
+        # Requests are pickled: only processes of the same user may connect.
+        # The socket is created owner-only (a chmod after bind leaves a window open);
+        # umask is process-wide, but the only other thread so far is the metrics server.
+        old_umask = os.umask(0o077)
+        try:
+            listener = Listener(self.address, family="AF_UNIX")
+        finally:
+            os.umask(old_umask)
+        # Listen first so clients can connect (and wait) while the models load
+        threading.Thread(target=self._load, name="model-load", daemon=True).start()
+        print(f"🧩 Model Server: listening on {self.address} (pid {os.getpid()})")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=self._serve_connection, args=(conn,), name="model-conn", daemon=True).start()
+
+    def _serve_connection(self, conn):
+        # One thread per client connection; concurrent clients meet in the Surya batcher and the GPU slots
+        with conn:
+            while True:
+                try:
+                    op, args, n_fds = conn.recv()
+                    fds = _recv_fds(conn, n_fds) if n_fds else []
+                except (EOFError, OSError):
+                    return
+
+                out_fds = []
+                try:
+                    handler = getattr(self, f"_op_{op}", None)
+                    if handler is None:
+                        for fd in fds:
+                            os.close(fd)
+                        raise ValueError(f"Unknown op '{op}'")
+                    payload, out_fds = handler(args, fds)
+                    response = ("ok", payload, len(out_fds))
+                except OperationCancelled as e:
+                    response = ("cancelled", str(e), 0)
+                except Exception as e:
+                    response = ("error", f"{type(e).__name__}: {e}", 0)
+
+                try:
+                    conn.send(response)
+                    if out_fds:
+                        _send_fds(conn, out_fds)
+                except (EOFError, OSError):
+                    return
+                finally:
+                    for fd in out_fds:
+                        os.close(fd)
+
+    def _op_ping(self, args, fds):
+        return {
+            "pid": os.getpid(),
+            "loaded": self._loaded.is_set(),
+            "components": sorted(self.components),
+            "error": self._load_error,
+        }, []
+
+    def _op_crop(self, args, fds):
+        size, mode = args
+        mapped = shm.map_fd(fds[0], size) if fds else None
+        try:
+            cropper = self._component("cropper")
+            timings = start_request_timings()
+            # The process pool queues on its own workers instead of the GPU slots
+            from app.services.executor import gpu_slots
+            slots = nullcontext() if config.CROP_PROCESSES > 0 else gpu_slots
+            with slots:
+                if mapped is None:
+                    cropped = cropper.process(b"", mode=mode)
+                else:
+                    with memoryview(mapped) as view:
+                        cropped = cropper.process(view, mode=mode)
+        finally:
+            if mapped is not None:
+                mapped.close()
+
+        if cropped is None:
+            return {"crop": None, "timings": timings}, []
+        fd, shape, dtype = shm.memfd_from_array(cropped, "receipt-crop")
+        return {"crop": (shape, dtype), "timings": timings}, [fd]
+
+    def _op_ocr_lines(self, args, fds):
+        from PIL import Image
+
+        specs, remaining = args
+        arrays = [shm.array_from_fd(fd, shape, dtype) for fd, (shape, dtype) in zip(fds, specs)]
+        images = [Image.fromarray(array) for array in arrays]
+        # The caller's deadline, so strips still queued when it passes are dropped here too
+        token = CancelToken.with_timeout(remaining)
+        return run_with_token(token, self._component("surya_batcher").run_lines, images), []
+
+
+def _serve(address, metrics_port=0):
+    if metrics_port:
+        # This process's stage / crop / Surya metrics (the HTTP workers only see request totals)
+        from prometheus_client import start_http_server
+        start_http_server(metrics_port)
+    ModelServer(address).serve_forever()
+
+
+# ==========================================
+# 2. CLIENT (in the HTTP and job workers)
+# ==========================================
+class ModelClient:
+    """Pool of connections to the model server; each carries one request at a time."""
+
+    def __init__(self, address, max_idle=32):
+        self.address = address
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return Client(self.address, family="AF_UNIX")
+
+    def _checkin(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _drop_idle(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def call(self, op, args=(), fds=()):
+        """
+        -> (payload, received fds). Retries once on a fresh connection when the
+        server went away (restart); the caller keeps ownership of `fds`.
+        """
+        for attempt in range(2):
+            conn = None
+            try:
+                conn = self._checkout()
+                conn.send((op, args, len(fds)))
+                if fds:
+                    _send_fds(conn, list(fds))
+                status, payload, n_fds = conn.recv()
+                out_fds = _recv_fds(conn, n_fds) if n_fds else []
+            except (EOFError, OSError) as e:
+                if conn is not None:
+                    conn.close()
+                # The other idle connections went to the same (dead) server
+                self._drop_idle()
+                if attempt == 1:
+                    raise ModelServerUnavailable(f"Model server at {self.address}: {type(e).__name__}: {e}") from e
+                continue
+
+            self._checkin(conn)
+            if status == "cancelled":
+                # Only the forwarded deadline cancels work on the server
+                raise DeadlineExceeded(payload)
+            if status == "error":
+                raise RuntimeError(f"Model server: {payload}")
+            return payload, out_fds
+
+    def ping(self) -> dict:
+        return self.call("ping")[0]
+
+
+class RemoteCropper:
+    """`ImageCropper.process` running on the model server."""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def process(self, image_bytes, mode=None):
+        fds = [shm.memfd_from_bytes(image_bytes)] if len(image_bytes) else []
+        try:
+            payload, out_fds = self.client.call("crop", (len(image_bytes), mode), fds)
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+        # Sub-stages were timed on the server; show them in this request's X-Stage-Timings
+        merge_request_timings(payload["timings"])
+        if payload["crop"] is None:
+            return None
+        shape, dtype = payload["crop"]
+        # Backed by the server-written buffer: no copy on this side
+        return shm.array_from_fd(out_fds[0], shape, dtype)
+
+
+class RemoteSuryaBatcher:
+    """`SuryaBatcher.run` / `run_lines` on the model server (batched with every other worker's requests)."""
+
+    def __init__(self, client: ModelClient):
+        self.client = client
+
+    def run(self, image_pil) -> str:
+        return "\n".join(line.text for line in self.run_lines([image_pil])[0])
+
+    def run_lines(self, images: list) -> list:
+        token = current_token()
+        remaining = token.remaining() if token is not None else None
+        shared = []
+        try:
+            for image in images:
+                shared.append(shm.memfd_from_array(np.asarray(image), "receipt-ocr"))
+            lines, _ = self.client.call(
+                "ocr_lines", ([(shape, dtype) for _, shape, dtype in shared], remaining), [fd for fd, _, _ in shared]
+            )
+        finally:
+            for fd, _, _ in shared:
+                os.close(fd)
+        return lines
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_model_client() -> ModelClient:
+    """Process-wide client for MODEL_SERVER_SOCKET."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ModelClient(config.MODEL_SERVER_SOCKET)
+        return _client
+
+
+# ==========================================
+# 3. LAUNCHER
+# ==========================================
+def _wait_for_server(address, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    client = ModelClient(address)
+    while True:
+        try:
+            return client.ping()
+        except ModelServerUnavailable:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--socket", default=config.MODEL_SERVER_SOCKET or "/tmp/receipt-models.sock")
+    ap.add_argument("--metrics-port", type=int, default=config.MODEL_SERVER_METRICS_PORT)
+    ap.add_argument("--http-workers", type=int, default=0, help="also run the API with this many uvicorn workers")
+    ap.add_argument("--job-workers", type=int, default=max(1, config.JOB_WORKERS),
+                    help="/jobs worker processes started with the API (they use this server's models)")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=8002)
+    args = ap.parse_args()
+
+    if not args.http_workers:
+        _serve(args.socket, args.metrics_port)
+        return
+
+    import uvicorn
+    from app.services.job_worker import start_worker_processes, stop_worker_processes
+
+    # Everything spawned from here on (uvicorn and job workers) uses the server
+    os.environ["MODEL_SERVER_SOCKET"] = args.socket
+    server = multiprocessing.get_context("spawn").Process(
+        target=_serve, args=(args.socket, args.metrics_port), name="model-server", daemon=True
+    )
+    server.start()
+    _wait_for_server(args.socket)
+
+    # Job workers are started once here rather than by every uvicorn worker
+    job_workers = start_worker_processes(args.job_workers)
+    os.environ["JOB_WORKERS"] = "0"
+    try:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, workers=args.http_workers)
+    finally:
+        stop_worker_processes(job_workers)
+        server.terminate()
+        server.join(10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import asyncio
+import concurrent.futures
+import threading
+import time
+
+import httpx
+from ollama import AsyncClient, ResponseError
+
+from app import config
+from app.services.cancellation import OperationCancelled, cancel_reason, current_token
+from app.services.metrics import (
+    LLM_COMPLETION_TOKENS, LLM_STREAMS, LLM_TIME_TO_RESULT, observe_llm_response, record_abandoned
+)
+
+# How often a blocked caller checks its CancelToken while an Ollama call is in flight
+_CANCEL_POLL_SECONDS = 0.1
+
+
+class OllamaUnavailableError(Exception):
+    """Every backend failed or is currently circuit-broken."""
+
+
+class OllamaStreamError(Exception):
+    """A streamed call failed after output had arrived (not retried: the caller's parser state can't be rewound)."""
+
+
+class Backend:
+    """One Ollama host: keep-alive client + load and circuit-breaker state."""
+
+    def __init__(self, host, timeout, max_connections):
+        self.host = host
+        self.client = AsyncClient(
+            host=host,
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self.outstanding = 0
+        self.failures = 0          # consecutive
+        self.open_until = 0.0      # circuit open (skipped) until this monotonic time
+        self.probing = False       # half-open: the one trial call is in flight
+        self.total_requests = 0
+        self.total_failures = 0
+
+    def is_available(self, now):
+        # After the cooldown the breaker is half-open: one probe call decides, the others skip it
+        if now < self.open_until:
+            return False
+        return not (self.open_until and self.probing)
+
+    def record_success(self):
+        self.failures = 0
+        self.open_until = 0.0
+
+    def record_failure(self, threshold, cooldown):
+        self.failures += 1
+        self.total_failures += 1
+        if self.failures >= threshold:
+            self.open_until = time.monotonic() + cooldown
+            print(f"🔌 Ollama: Circuit opened for {self.host} ({self.failures} consecutive failures)")
+
+    def stats(self):
+        return {
+            "host": self.host,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.failures,
+            "circuit_open": not self.is_available(time.monotonic()),
+            "requests": self.total_requests,
+            "failures": self.total_failures,
+        }
+
+
+class OllamaPool:
+    """
+    Shared async client for all Ollama callers.
+    - least-outstanding-requests balancing across `hosts`
+    - keep-alive connection pool per host
+    - per-call timeout, circuit breaker, retry on another healthy host
+    - `keep_alive` on every call, so models (and their cached prompt prefix) stay loaded
+
+    Runs its own event loop thread so the blocking workflow code can call
+    `chat(...)` while async callers use `achat(...)`.
+    """
+
+    def __init__(self, hosts, timeout=120.0, max_attempts=2, failure_threshold=3,
+                 cooldown=30.0, max_connections=16, keep_alive=None):
+        if not hosts:
+            raise ValueError("OllamaPool needs at least one host")
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.keep_alive = keep_alive or None
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ollama-pool", daemon=True)
+        self._thread.start()
+
+        self.backends = [Backend(h, timeout, max_connections) for h in hosts]
+
+    def _pick(self, tried):
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b not in tried and b.is_available(now)]
+        if not candidates:
+            return None
+        backend = min(candidates, key=lambda b: b.outstanding)
+        if backend.open_until:
+            backend.probing = True
+        return backend
+
+    @staticmethod
+    def _is_retryable(error):
+        # 4xx (bad request, bad model options) would fail on every host alike;
+        # 404 is usually "model not pulled on this host" so another host may work.
+        if isinstance(error, ResponseError):
+            return error.status_code >= 500 or error.status_code in (404, 429)
+        return True
+
+    async def _call(self, method, timeout=None, **kwargs):
+        if self.keep_alive and method == "chat":
+            kwargs.setdefault("keep_alive", self.keep_alive)
+        tried = set()
+        last_error = None
+
+        for _ in range(self.max_attempts):
+            backend = self._pick(tried)
+            if backend is None:
+                break
+            tried.add(backend)
+            probe = backend.probing
+
+            backend.outstanding += 1
+            backend.total_requests += 1
+            try:
+                response = await asyncio.wait_for(
+                    getattr(backend.client, method)(**kwargs), timeout or self.timeout
+                )
+                backend.record_success()
+                if method == "chat":
+                    observe_llm_response(kwargs.get("model", ""), response)
+                return response
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_error = e
+                if not self._is_retryable(e):
+                    raise
+                backend.record_failure(self.failure_threshold, self.cooldown)
+                print(f"⚠️ Ollama: {backend.host} failed ({type(e).__name__}: {e}), trying next backend")
+            finally:
+                backend.outstanding -= 1
+                if probe:
+                    backend.probing = False
+
+        raise OllamaUnavailableError(f"No healthy Ollama backend (last error: {type(last_error).__name__}: {last_error})")
+
+    async def _stream(self, on_content, timeout=None, **kwargs):
+        """
+        Streaming chat. Each content chunk goes to `on_content(text)`; when it
+        returns True the stream is closed, which makes Ollama stop generating.
+        Retried on another backend only while nothing has been received yet
+        (the caller's parser state can't be rewound).
+        """
+        if self.keep_alive:
+            kwargs.setdefault("keep_alive", self.keep_alive)
+        tried = set()
+        last_error = None
+        model = kwargs.get("model", "")
+
+        for _ in range(self.max_attempts):
+            backend = self._pick(tried)
+            if backend is None:
+                break
+            tried.add(backend)
+            probe = backend.probing
+
+            backend.outstanding += 1
+            backend.total_requests += 1
+            parts, final, stopped = [], None, False
+            start = time.perf_counter()
+
+            async def consume():
+                nonlocal final, stopped
+                stream = await backend.client.chat(stream=True, **kwargs)
+                try:
+                    async for chunk in stream:
+                        piece = chunk["message"]["content"] or ""
+                        parts.append(piece)
+                        if chunk.get("done"):
+                            final = chunk
+                            break
+                        if piece and on_content(piece):
+                            stopped = True
+                            break
+                finally:
+                    # Closes the HTTP response: Ollama cancels the generation
+                    await stream.aclose()
+
+            try:
+                await asyncio.wait_for(consume(), timeout or self.timeout)
+                backend.record_success()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                last_error = e
+                if parts:
+                    backend.record_failure(self.failure_threshold, self.cooldown)
+                    raise OllamaStreamError(
+                        f"{backend.host} failed after {len(parts)} chunks ({type(e).__name__}: {e})"
+                    ) from e
+                if not self._is_retryable(e):
+                    raise
+                backend.record_failure(self.failure_threshold, self.cooldown)
+                print(f"⚠️ Ollama: {backend.host} failed ({type(e).__name__}: {e}), trying next backend")
+                continue
+            finally:
+                backend.outstanding -= 1
+                if probe:
+                    backend.probing = False
+
+            LLM_TIME_TO_RESULT.labels(model).observe(time.perf_counter() - start)
+            LLM_STREAMS.labels(model, "early_stop" if stopped else "complete").inc()
+            if final is not None:
+                observe_llm_response(model, final)
+            else:
+                # One chunk per generated token; the final stats chunk never came
+                LLM_COMPLETION_TOKENS.labels(model).observe(len(parts))
+            return {
+                "model": model,
+                "message": {"role": "assistant", "content": "".join(parts)},
+                "done_reason": "early_stop" if stopped else (final.get("done_reason") if final else None),
+                "eval_count": final.get("eval_count") if final else len(parts),
+            }
+
+        raise OllamaUnavailableError(f"No healthy Ollama backend (last error: {type(last_error).__name__}: {last_error})")
+
+    async def achat(self, timeout=None, **kwargs):
+        """Async chat; same keyword arguments as `ollama.AsyncClient.chat`."""
+        # Balancing state lives on the pool loop; hop over if called from another loop
+        if asyncio.get_running_loop() is self._loop:
+            return await self._call("chat", timeout=timeout, **kwargs)
+        future = asyncio.run_coroutine_threadsafe(self._call("chat", timeout=timeout, **kwargs), self._loop)
+        return await asyncio.wrap_future(future)
+
+    def _wait(self, future, kind):
+        """
+        Blocks on a call running on the pool loop. If the caller's CancelToken
+        fires meanwhile (client gone, deadline passed) the call is cancelled,
+        which closes its HTTP request so Ollama stops, even during prefill.
+        """
+        token = current_token()
+        if token is None:
+            return future.result()
+        while True:
+            done, _ = concurrent.futures.wait([future], timeout=_CANCEL_POLL_SECONDS)
+            if done:
+                return future.result()
+            if token.cancelled:
+                future.cancel()
+                try:
+                    token.check()
+                except OperationCancelled as e:
+                    record_abandoned(f"ollama.{kind}", cancel_reason(e), skipped=False)
+                    raise
+
+    def chat(self, timeout=None, **kwargs):
+        """Blocking chat for the (threaded) workflow code."""
+        future = asyncio.run_coroutine_threadsafe(self._call("chat", timeout=timeout, **kwargs), self._loop)
+        return self._wait(future, "chat")
+
+    def stream_chat(self, on_content, timeout=None, **kwargs):
+        """Blocking streaming chat; see `_stream`. Returns a chat-shaped dict."""
+        future = asyncio.run_coroutine_threadsafe(self._stream(on_content, timeout=timeout, **kwargs), self._loop)
+        return self._wait(future, "stream")
+
+    def stats(self):
+        return [b.stats() for b in self.backends]
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_ollama_pool() -> OllamaPool:
+    """Process-wide shared pool, built from config on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = OllamaPool(
+                hosts=config.OLLAMA_HOSTS,
+                timeout=config.OLLAMA_TIMEOUT,
+                max_attempts=config.OLLAMA_MAX_ATTEMPTS,
+                failure_threshold=config.OLLAMA_BREAKER_FAILURES,
+                cooldown=config.OLLAMA_BREAKER_COOLDOWN,
+                max_connections=config.OLLAMA_MAX_CONNECTIONS,
+                keep_alive=config.OLLAMA_KEEP_ALIVE,
+            )
+            print(f"🔗 Ollama Pool: {len(_pool.backends)} backend(s) {config.OLLAMA_HOSTS}")
+        return _pool
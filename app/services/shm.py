@@ -0,0 +1,98 @@
+import mmap
+import os
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# What crosses the process boundary instead of the pixels themselves
+ShmArray = namedtuple("ShmArray", ["name", "shape", "dtype"])
+
+# Blocks are registered with the multiprocessing resource tracker, which the
+# spawned workers share with the parent: whoever unlinks a block unregisters
+# it, and anything leaked by a crashed worker is removed when the parent exits.
+
+
+def put_bytes(data: bytes) -> shared_memory.SharedMemory:
+    """Copies `data` into a new block. The caller owns it: close() + unlink() when done."""
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Opens a block created by another process (without taking ownership)."""
+    return shared_memory.SharedMemory(name=name)
+
+
+def put_array(array: np.ndarray) -> ShmArray:
+    """
+    Copies `array` into a new block and hands ownership to whoever receives
+    the descriptor (they must `take_array` it, which unlinks the block).
+    """
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    descriptor = ShmArray(block.name, array.shape, array.dtype.str)
+    block.close()
+    return descriptor
+
+
+def take_array(descriptor: ShmArray) -> np.ndarray:
+    """Copies the array out of its block and frees the block."""
+    block = shared_memory.SharedMemory(name=descriptor.name)
+    try:
+        view = np.ndarray(descriptor.shape, dtype=np.dtype(descriptor.dtype), buffer=block.buf)
+        array = view.copy()
+        del view  # release the buffer export before close()
+    finally:
+        block.close()
+        block.unlink()
+    return array
+
+
+# ---------- anonymous buffers (memfd) ----------
+# For processes that aren't parent and child (the model server and the HTTP
+# workers): the buffer is a file descriptor passed over a unix socket
+# (multiprocessing.reduction.send_handle), so there is no name to unlink and
+# no resource tracker involved. The kernel frees it with the last fd / mapping.
+
+def memfd_from_bytes(data, name="receipt-upload") -> int:
+    """New memfd holding `data` (a bytes-like object). The caller closes the fd."""
+    fd = os.memfd_create(name, os.MFD_CLOEXEC)
+    try:
+        os.ftruncate(fd, len(data))
+        with mmap.mmap(fd, len(data)) as mm:
+            mm[:] = data
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd
+
+
+def memfd_from_array(array: np.ndarray, name="receipt-array"):
+    """(fd, shape, dtype) for a copy of `array` in a new memfd. The caller closes the fd."""
+    array = np.ascontiguousarray(array)
+    fd = os.memfd_create(name, os.MFD_CLOEXEC)
+    try:
+        os.ftruncate(fd, array.nbytes)
+        with mmap.mmap(fd, array.nbytes) as mm:
+            np.ndarray(array.shape, dtype=array.dtype, buffer=mm)[...] = array
+    except BaseException:
+        os.close(fd)
+        raise
+    return fd, array.shape, array.dtype.str
+
+
+def map_fd(fd: int, size: int) -> mmap.mmap:
+    """Maps a received memfd (and closes the fd: the mapping keeps the buffer alive)."""
+    try:
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
+
+
+def array_from_fd(fd: int, shape, dtype) -> np.ndarray:
+    """Array backed directly by a received memfd (no copy); freed with the array."""
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape)) * dtype.itemsize
+    return np.ndarray(shape, dtype=dtype, buffer=map_fd(fd, size))
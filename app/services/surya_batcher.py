@@ -0,0 +1,120 @@
+import concurrent.futures
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from app.services.cancellation import OperationCancelled, current_token
+from app.services.metrics import QUEUE_DEPTH, SURYA_BATCH_SIZE, record_abandoned, stage
+
+# How often a waiting caller checks its CancelToken
+_CANCEL_POLL_SECONDS = 0.1
+
+
+class SuryaBatcher:
+    """
+    Dynamic micro-batching in front of SuryaOCR.
+    Callers block on `run(image)` (or `run_lines(images)` for the strips of a
+    tiled receipt); a single scheduler thread gathers up to `max_batch`
+    images or waits at most `max_wait_ms` after the first one, then runs one
+    batched detection + recognition pass.
+
+    Images whose request was cancelled while they waited (client gone,
+    deadline passed) are dropped before the pass instead of taking a slot.
+    If a batched pass fails, its images are rerun one by one so only the
+    image that breaks Surya comes back empty.
+    """
+
+    def __init__(self, engine, max_batch=8, max_wait_ms=25, slots=None):
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000.0
+        self.slots = slots  # optional semaphore held around each batched pass
+        self._queue = queue.Queue()
+        QUEUE_DEPTH.labels("surya_batcher").set_function(self._queue.qsize)
+        self._thread = threading.Thread(target=self._loop, name="surya-batcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def run(self, image_pil) -> str:
+        return "\n".join(line.text for line in self.run_lines([image_pil])[0])
+
+    def run_lines(self, images: list) -> list:
+        """One list of OcrLine per image; all images are queued at once so they share passes."""
+        token = current_token()
+        futures = []
+        for image_pil in images:
+            future = Future()
+            self._queue.put((image_pil, future, token))
+            futures.append(future)
+        if token is None:
+            return [future.result() for future in futures]
+        # Cancelled callers return at once; their queued images are dropped by the scheduler
+        while True:
+            _, pending = concurrent.futures.wait(futures, timeout=_CANCEL_POLL_SECONDS)
+            if not pending:
+                return [future.result() for future in futures]
+            token.check()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run_batch(self, images):
+        SURYA_BATCH_SIZE.observe(len(images))
+        if self.slots is None:
+            with stage("surya.batch"):
+                return self.engine.run_lines_batch(images)
+        with self.slots, stage("surya.batch"):
+            return self.engine.run_lines_batch(images)
+
+    def _drop_cancelled(self, batch):
+        kept = []
+        for image, future, token in batch:
+            try:
+                if token is not None:
+                    token.check()
+            except OperationCancelled as e:
+                # One image, not a whole pass: counted without a time estimate
+                record_abandoned("surya.batch", token.reason, skipped=False)
+                future.set_exception(e)
+                continue
+            kept.append((image, future))
+        return kept
+
+    def _loop(self):
+        while True:
+            batch = self._drop_cancelled(self._collect())
+            if not batch:
+                continue
+            images = [image for image, _ in batch]
+            try:
+                results = self._run_batch(images)
+            except Exception as e:
+                if len(batch) == 1:
+                    print(f"❌ Surya OCR Failed: {e}")
+                    batch[0][1].set_result([])
+                    continue
+                print(f"⚠️ Surya OCR: batch of {len(batch)} failed ({e}), retrying image by image")
+                results = [self._run_alone(image) for image in images]
+            for (_, future), lines in zip(batch, results):
+                future.set_result(lines)
+
+    def _run_alone(self, image):
+        try:
+            return self._run_batch([image])[0]
+        except Exception as e:
+            print(f"❌ Surya OCR Failed: {e}")
+            return []
@@ -0,0 +1,79 @@
+"""
+Cropper throughput on CPU: one in-process session vs N worker processes.
+
+    python -m benchmarks.bench_crop_processes --processes 1,2,4,8 --requests 32
+
+The in-process row is the old behaviour (one shared ONNX session called from
+`concurrency` threads). Each pool row runs N processes with cores / N
+intra-op threads each; concurrency is 2 x N so every worker stays busy.
+
+Every row forces mode=model: with the default mode=auto the classical tier
+accepts all the synthetic photos and birefnet would never run. The classical
+tier is timed on its own row, with how many images it accepts.
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import config
+from benchmarks.synthetic import build_corpus
+
+
+def run(crop, images, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(crop, images))
+    return len(images) / (time.perf_counter() - start)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--processes", default="1,2,4")
+    ap.add_argument("--requests", type=int, default=32)
+    ap.add_argument("--concurrency", type=int, default=4, help="threads for the in-process baseline")
+    ap.add_argument("--graph-optimization", default=config.CROP_GRAPH_OPTIMIZATION)
+    args = ap.parse_args()
+
+    from app.processors.cropper import ImageCropper, make_session_options
+    from app.services.crop_workers import CropperProcessPool
+
+    corpus = [data for _, data in build_corpus("small")]
+    images = [corpus[i % len(corpus)] for i in range(args.requests)]
+    print(f"🖥️ {os.cpu_count()} cores, {len(images)} images, proxy {config.CROP_PROXY_SIZE}px")
+
+    baseline = ImageCropper(
+        model_name=config.CROP_MODEL, proxy_size=config.CROP_PROXY_SIZE, mode="model",
+        session_options=make_session_options(graph_optimization=args.graph_optimization)
+    )
+    baseline.process(images[0])  # warm-up
+    base_rps = run(baseline.process, images, args.concurrency)
+
+    # The classical tier, separately: its speed and how much of the corpus it would take
+    tiers = {"fast": 0, "model": 0, "none": 0}
+    for data in corpus:
+        original, _ = baseline.decode(data)
+        tiers[baseline.crop_tiered(original, "auto").tier] += 1
+    fast_rps = run(lambda data: baseline.process(data, mode="fast"), images, args.concurrency)
+    del baseline
+
+    print(f"{'config':<22} {'images/s':>9} {'speedup':>8}")
+    print(f"{'in-process':<22} {base_rps:>9.2f} {1.0:>8.2f}")
+    for n in [int(p) for p in args.processes.split(",")]:
+        pool = CropperProcessPool(
+            n, model_name=config.CROP_MODEL, proxy_size=config.CROP_PROXY_SIZE,
+            graph_optimization=args.graph_optimization, mode="model"
+        )
+        try:
+            rps = run(pool.process, images, 2 * n)
+        finally:
+            pool.shutdown()
+        print(f"{f'{n} processes':<22} {rps:>9.2f} {rps / base_rps:>8.2f}")
+
+    print(f"\n{'classical tier only':<22} {fast_rps:>9.2f}  (in-process, {args.concurrency} threads)")
+    print(f"auto mode would crop {tiers['fast']}/{len(corpus)} corpus images with the classical tier, "
+          f"{tiers['model']} with birefnet")
+
+
+if __name__ == "__main__":
+    main()
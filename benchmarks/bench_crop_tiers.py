@@ -0,0 +1,69 @@
+"""
+Classical crop fast path vs birefnet: acceptance rate and latency saved.
+
+    python -m benchmarks.bench_crop_tiers --corpus default
+    python -m benchmarks.bench_crop_tiers --dir ./my_receipts
+
+Crops every image with mode=model (birefnet only) and mode=auto (classical
+first, birefnet on rejection), and reports per image which tier auto used,
+why the classical checks rejected it, both latencies and, for accepted
+fast crops, how their size differs from birefnet's.
+"""
+import argparse
+import time
+
+from app import config
+from app.processors.classic_crop import ClassicalCropper
+from benchmarks.synthetic import build_corpus, load_corpus
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default="default", help="synthetic corpus (small | default | large)")
+    ap.add_argument("--dir", default="", help="use the images in this directory instead")
+    args = ap.parse_args()
+
+    from app.processors.cropper import ImageCropper
+
+    corpus = load_corpus(args.dir) if args.dir else build_corpus(args.corpus)
+    cropper = ImageCropper(
+        model_name=config.CROP_MODEL, proxy_size=config.CROP_PROXY_SIZE, decode_max_dim=config.DECODE_MAX_DIM,
+        classic=ClassicalCropper(
+            work_size=config.CROP_FAST_WORK_SIZE, min_area_ratio=config.CROP_FAST_MIN_AREA,
+            min_rectangularity=config.CROP_FAST_MIN_RECTANGULARITY, min_contrast=config.CROP_FAST_MIN_CONTRAST
+        )
+    )
+    original, _ = cropper.decode(corpus[0][1])
+    cropper.crop_tiered(original, "model")  # warm-up
+
+    print(f"{'image':<32} {'auto_tier':>9} {'check':>14} {'model_ms':>9} {'auto_ms':>8} {'size_diff':>10}")
+    total_model = total_auto = 0.0
+    accepted = 0
+    for label, data in corpus:
+        original, _ = cropper.decode(data)
+        model, model_ms = timed(lambda: cropper.crop_tiered(original, "model"))
+        auto, auto_ms = timed(lambda: cropper.crop_tiered(original, "auto"))
+        total_model += model_ms
+        total_auto += auto_ms
+
+        size_diff = ""
+        if auto.tier == "fast":
+            accepted += 1
+            (mh, mw), (ah, aw) = model.image.shape[:2], auto.image.shape[:2]
+            size_diff = f"{aw - mw:+d}x{ah - mh:+d}"
+        print(f"{label[:32]:<32} {auto.tier:>9} {auto.reason:>14} {model_ms:>9.1f} {auto_ms:>8.1f} {size_diff:>10}")
+
+    n = len(corpus)
+    print(f"\nfast path accepted {accepted}/{n} ({accepted / n:.0%}); "
+          f"mean crop {total_model / n:.1f} ms (model) -> {total_auto / n:.1f} ms (auto), "
+          f"saved {(total_model - total_auto) / n:.1f} ms per image")
+
+
+if __name__ == "__main__":
+    main()
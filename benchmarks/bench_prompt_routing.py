@@ -0,0 +1,149 @@
+"""
+Full prompt vs per-type compact prompts: prompt tokens and latency per LLM call.
+
+    python -m benchmarks.bench_prompt_routing --stub               # local stand-in for Ollama
+    python -m benchmarks.bench_prompt_routing --repeats 5          # the OLLAMA_HOSTS backends
+    python -m benchmarks.bench_prompt_routing --pipelines surya
+
+Sends the same synthetic fuel / restaurant / retail / generic receipts (OCR
+text for the Surya parser, rendered images for vision) once with the full
+prompt and once with the prompt picked by the classifier, non-streamed so
+Ollama reports prompt_eval_count and prompt_eval_duration. Calls of one
+variant run back to back with keep_alive set, the way production traffic
+keeps a prompt prefix warm.
+
+With --stub only the token columns mean anything, and even they are an
+estimate (prompt characters / 4): the stub's prefill and call times are
+fixed, so they don't model prompt length, prefix caching or model loading.
+Latency claims need a real Ollama backend.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app import config
+from app.processors.ollama_vision_ocr import VISION_MODEL, OllamaVisionOCR
+from app.processors.receipt_schema import TEXT_SCHEMA, VISION_SCHEMA, output_format
+from app.processors.receipt_types import classify_layout
+from app.processors.surya_ocr_parser import TEXT_MODEL, SuryaParser
+from app.services.ollama_pool import OllamaPool
+from benchmarks.synthetic import encode_jpeg, receipt_lines, render_receipt
+
+_TAXES = ("TPS", 0.05), ("TVQ", 0.09975)
+
+
+def _totals(lines, subtotal, extra=()):
+    subtotal = round(subtotal, 2)
+    taxes = [(name, round(subtotal * rate, 2)) for name, rate in _TAXES]
+    lines.append(f"{'SOUS-TOTAL':<18}{subtotal:>8.2f}")
+    lines += [f"{name:<18}{amount:>8.2f}" for name, amount in taxes]
+    lines += [f"{label:<18}{amount:>8.2f}" for label, amount in extra]
+    lines.append(f"{'TOTAL':<18}{subtotal + sum(a for _, a in taxes) + sum(a for _, a in extra):>8.2f}")
+    return lines
+
+
+def fuel_lines(rng):
+    litres, unit = round(rng.uniform(20, 60), 3), round(rng.uniform(1.45, 1.85), 3)
+    return ["SHELL", "POMPE 4", "2024-06-02 08:14", "ORDINAIRE", f"{litres:.3f} L @ {unit:.3f}/L",
+            f"{'ESSENCE':<18}{litres * unit:>8.2f}", f"{'TOTAL':<18}{litres * unit:>8.2f}", "VISA ****1234"]
+
+
+def restaurant_lines(rng):
+    lines = ["CHEZ PAUL BISTRO", "TABLE 12   COUVERTS 2", "SERVEUR: MARC", "2024-06-02 19:41"]
+    subtotal = 0.0
+    for dish in rng.sample(["BURGER", "POUTINE", "SALADE CESAR", "BIERE", "VIN ROUGE", "DESSERT"], 4):
+        price = round(rng.uniform(6, 28), 2)
+        subtotal += price
+        lines.append(f"1 {dish:<16}{price:>8.2f}")
+    return _totals(lines, subtotal, extra=[("POURBOIRE", round(subtotal * 0.15, 2))])
+
+
+def retail_lines(rng):
+    lines = receipt_lines(rng, 30)
+    return lines + ["NB ARTICLES 30", "MEMBRE METRO&MOI 1234"]
+
+
+def generic_lines(rng):
+    lines = ["DEPANNEUR CHEZ LUC", "2024-06-02 22:03"]
+    prices = [round(rng.uniform(1, 9), 2) for _ in range(2)]
+    lines += [f"{name:<18}{p:>8.2f}" for name, p in zip(["CHIPS", "JUS"], prices)]
+    return _totals(lines, sum(prices))
+
+
+SAMPLES = {"fuel": fuel_lines, "restaurant": restaurant_lines, "retail": retail_lines, "generic": generic_lines}
+
+
+def run_calls(pool, model, schema, messages, repeats):
+    """[(prompt tokens, prompt eval ms, call ms)] for `repeats` non-streamed calls."""
+    fmt = output_format(schema)
+    extra = {"format": fmt} if fmt is not None else {}
+    runs = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = pool.chat(model=model, messages=messages, options={"temperature": 0}, **extra)
+        elapsed = (time.perf_counter() - start) * 1000
+        runs.append((response.get("prompt_eval_count") or 0, (response.get("prompt_eval_duration") or 0) / 1e6, elapsed))
+    return runs
+
+
+def report(pipeline, label, full, routed):
+    def mean(runs, i):
+        return statistics.mean(r[i] for r in runs)
+    saved = 1 - mean(routed, 0) / mean(full, 0) if mean(full, 0) else 0.0
+    print(f"{pipeline:<7} {label:<24} {mean(full, 0):>10.0f} {mean(routed, 0):>10.0f} {saved:>7.0%} "
+          f"{mean(full, 1):>10.0f} {mean(routed, 1):>10.0f} {mean(full, 2):>9.0f} {mean(routed, 2):>9.0f}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--repeats", type=int, default=3, help="calls per receipt and variant (after one warm-up)")
+    ap.add_argument("--pipelines", default="surya,vision")
+    ap.add_argument("--stub", action="store_true", help="run against a local stub Ollama instead of OLLAMA_HOSTS")
+    args = ap.parse_args()
+
+    stub = None
+    hosts = config.OLLAMA_HOSTS
+    if args.stub:
+        from benchmarks.stub_ollama import StubOllama
+        stub = StubOllama(latency_ms=50, token_ms=1)
+        hosts = [stub.start()]
+    pool = OllamaPool(hosts, timeout=config.OLLAMA_TIMEOUT, keep_alive=config.OLLAMA_KEEP_ALIVE)
+    rng = random.Random(0)
+    full_parser = SuryaParser(client=pool, routing=False)
+    routed_parser = SuryaParser(client=pool, routing=True)
+
+    print(f"{'':<7} {'receipt (routed to)':<24} {'tok_full':>10} {'tok_route':>10} {'saved':>7} "
+          f"{'prefill_ms':>10} {'(routed)':>10} {'call_ms':>9} {'(routed)':>9}")
+    try:
+        pipelines = args.pipelines.split(",")
+        if "surya" in pipelines:
+            for kind, make in SAMPLES.items():
+                text = "\n".join(make(rng))
+                variants = []
+                for parser in (full_parser, routed_parser):
+                    receipt_type, messages = parser.messages(text)
+                    run_calls(pool, TEXT_MODEL, TEXT_SCHEMA, messages, 1)  # warm the prefix
+                    variants.append(run_calls(pool, TEXT_MODEL, TEXT_SCHEMA, messages, args.repeats))
+                report("surya", f"{kind} ({receipt_type})", *variants)
+
+        if "vision" in pipelines:
+            for kind in ("retail", "generic"):
+                image = render_receipt(SAMPLES[kind](rng))
+                receipt_type = classify_layout(image)
+                data = encode_jpeg(image)
+                variants = []
+                for routed in (None, receipt_type):
+                    messages = OllamaVisionOCR.messages(data, routed)
+                    run_calls(pool, VISION_MODEL, VISION_SCHEMA, messages, 1)
+                    variants.append(run_calls(pool, VISION_MODEL, VISION_SCHEMA, messages, args.repeats))
+                report("vision", f"{kind} ({receipt_type})", *variants)
+    finally:
+        if stub is not None:
+            stub.stop()
+
+    print("\ntok = Ollama prompt_eval_count (vision: text + image tokens); prefill_ms = prompt_eval_duration")
+
+
+if __name__ == "__main__":
+    main()
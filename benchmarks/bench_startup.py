@@ -0,0 +1,50 @@
+"""
+Import time, model-load time and RSS per SERVICE_ROLE.
+
+    python -m benchmarks.bench_startup --roles crop,vision,surya,all
+
+Each role is measured in a fresh interpreter so nothing is shared between runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, time
+t0 = time.perf_counter()
+import app.main
+t1 = time.perf_counter()
+rss_import = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+from app.services.workflow import warm_up
+warm_up()
+t2 = time.perf_counter()
+print(json.dumps({
+    "import_s": t1 - t0,
+    "load_s": t2 - t1,
+    "rss_after_import_mb": rss_import / 1024,
+    "rss_after_load_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def measure(role):
+    env = dict(os.environ, SERVICE_ROLE=role, WARMUP="0")
+    out = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--roles", default="crop,vision,surya,all")
+    args = ap.parse_args()
+
+    print(f"{'role':<8} {'import_s':>9} {'load_s':>8} {'rss_import_MB':>14} {'rss_loaded_MB':>14}")
+    for role in args.roles.split(","):
+        r = measure(role)
+        print(f"{role:<8} {r['import_s']:>9.2f} {r['load_s']:>8.2f} {r['rss_after_import_mb']:>14.0f} {r['rss_after_load_mb']:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
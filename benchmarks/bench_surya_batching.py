@@ -0,0 +1,48 @@
+"""
+Throughput of SuryaOCR with and without micro-batching.
+
+    python -m benchmarks.bench_surya_batching --requests 32 --concurrency 8
+
+Each configuration pushes the same receipts through a SuryaBatcher from
+`concurrency` threads; max_batch=1 is the old one-image-per-call behaviour.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.processors.surya_ocr import SuryaOCR
+from app.services.surya_batcher import SuryaBatcher
+from benchmarks.synthetic import receipt_pil
+
+
+def run_config(engine, images, concurrency, max_batch, max_wait_ms):
+    batcher = SuryaBatcher(engine, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(batcher.run, images))
+    elapsed = time.perf_counter() - start
+    return len(images) / elapsed, elapsed
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--requests", type=int, default=32)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--batch-sizes", default="1,2,4,8")
+    ap.add_argument("--max-wait-ms", type=float, default=25)
+    args = ap.parse_args()
+
+    engine = SuryaOCR()
+    images = [receipt_pil(n_items=10, seed=i) for i in range(args.requests)]
+
+    # Warm-up (model compilation / first-call allocations)
+    engine.run(images[0])
+
+    print(f"{'max_batch':>9} {'receipts/s':>11} {'total_s':>8}")
+    for max_batch in [int(b) for b in args.batch_sizes.split(",")]:
+        rps, elapsed = run_config(engine, images, args.concurrency, max_batch, args.max_wait_ms)
+        print(f"{max_batch:>9} {rps:>11.2f} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Whole-image vs tiled Surya OCR on long receipts.
+
+    python -m benchmarks.bench_surya_tiling --items 40,80,160
+
+For each receipt length, OCRs the same synthetic crop once as a single
+image and once as overlapping strips (SURYA_TILE_* settings), and reports
+latency, peak GPU memory (CUDA only) and how many lines each mode found.
+"""
+import argparse
+import time
+
+import cv2
+import numpy as np
+import torch
+
+from app.processors.ocr_tiling import merge_strip_lines, plan_strips, split_strips
+from app.processors.surya_ocr import SuryaOCR
+from app.processors.image_io import to_pil
+from app import config
+from benchmarks.synthetic import receipt_pil
+
+
+def _peak_reset():
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+
+
+def _peak_mb():
+    if torch.cuda.is_available():
+        return torch.cuda.max_memory_allocated() / 1e6
+    return float("nan")
+
+
+def run_whole(engine, image_bgr):
+    _peak_reset()
+    start = time.perf_counter()
+    lines = engine.run_lines_batch([to_pil(image_bgr)])[0]
+    return time.perf_counter() - start, _peak_mb(), len(lines)
+
+
+def run_tiled(engine, image_bgr):
+    h, w = image_bgr.shape[:2]
+    strips = plan_strips(h, w, config.SURYA_TILE_MAX_ASPECT, config.SURYA_TILE_ASPECT, config.SURYA_TILE_OVERLAP)
+    _peak_reset()
+    start = time.perf_counter()
+    images = [to_pil(strip) for strip in split_strips(image_bgr, strips)]
+    strip_lines = []
+    # Same batch size as the service's micro-batcher
+    for i in range(0, len(images), config.SURYA_MAX_BATCH):
+        strip_lines.extend(engine.run_lines_batch(images[i:i + config.SURYA_MAX_BATCH]))
+    lines = merge_strip_lines(strips, strip_lines)
+    return time.perf_counter() - start, _peak_mb(), len(lines), len(strips)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--items", default="40,80,160")
+    ap.add_argument("--repeats", type=int, default=3)
+    args = ap.parse_args()
+
+    engine = SuryaOCR()
+    engine.run(receipt_pil(n_items=5))  # warm-up
+
+    print(f"{'items':>5} {'aspect':>6} {'strips':>6} {'whole_s':>8} {'tiled_s':>8} "
+          f"{'whole_MB':>9} {'tiled_MB':>9} {'whole_lines':>11} {'tiled_lines':>11}")
+    for n_items in [int(n) for n in args.items.split(",")]:
+        image_bgr = cv2.cvtColor(np.asarray(receipt_pil(n_items=n_items, seed=n_items)), cv2.COLOR_RGB2BGR)
+        h, w = image_bgr.shape[:2]
+        whole = min((run_whole(engine, image_bgr) for _ in range(args.repeats)), key=lambda r: r[0])
+        tiled = min((run_tiled(engine, image_bgr) for _ in range(args.repeats)), key=lambda r: r[0])
+        print(f"{n_items:>5} {h / w:>6.1f} {tiled[3]:>6} {whole[0]:>8.2f} {tiled[0]:>8.2f} "
+              f"{whole[1]:>9.0f} {tiled[1]:>9.0f} {whole[2]:>11} {tiled[2]:>11}")
+
+
+if __name__ == "__main__":
+    main()
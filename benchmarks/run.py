@@ -0,0 +1,323 @@
+"""
+Offline benchmark suite (CPU-only, no network).
+
+    python -m benchmarks.run --suites crop,surya,parse,http --concurrency 1,4,8 \
+        --out bench.json --baseline bench_baseline.json
+
+Suites:
+  crop   ImageCropper.process on synthetic phone photos, birefnet (crop_model) and the
+         classical tier (crop_fast) timed separately, with the tier auto picks per image
+  surya  SuryaOCR.run on pre-cropped synthetic receipts
+  parse  SuryaParser / OllamaVisionOCR against the local stub Ollama server, in three
+         modes: legacy (blocking, free-form), stream (early stop) and schema
+         (early stop + `format` schema); reports tokens generated per call
+  http   /process/crop, /ocr/vision, /ocr/surya through a real uvicorn server
+
+Each (suite, concurrency) reports throughput, p50/p95/p99 latency, peak RSS
+and the split of time across workflow stages. Results are written as JSON;
+with --baseline, throughput and p95 are compared and regressions beyond
+--max-regression percent make the run exit non-zero.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.stub_ollama import StubOllama
+from benchmarks.synthetic import build_corpus, load_corpus, receipt_lines, receipt_pil, render_receipt, encode_jpeg
+
+
+# ==========================================
+# 1. MEASUREMENT HELPERS
+# ==========================================
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * q
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def peak_rss_mb():
+    # Linux reports KB; the value is the process-wide high-water mark
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_totals():
+    """{stage: total seconds} from the in-process Prometheus histograms."""
+    from app.services.metrics import STAGE_SECONDS
+    totals = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            if sample.name.endswith("_sum"):
+                totals[sample.labels["stage"]] = sample.value
+    return totals
+
+
+def drive(fn, items, concurrency, repeat=1):
+    """Calls fn(item) for every item `repeat` times from `concurrency` threads."""
+    work = [item for _ in range(repeat) for item in items]
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def one(item):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = fn(item) is not False
+        except Exception as e:
+            print(f"   ⚠️ {type(e).__name__}: {e}")
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            errors += not ok
+
+    stages_before = stage_totals()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, work))
+    wall = time.perf_counter() - start
+    stages_after = stage_totals()
+
+    latencies.sort()
+    stage_split = {
+        name: round((stages_after[name] - stages_before.get(name, 0.0)) * 1000 / len(work), 2)
+        for name in stages_after
+        if stages_after[name] - stages_before.get(name, 0.0) > 0
+    }
+    return {
+        "requests": len(work),
+        "errors": errors,
+        "throughput_rps": round(len(work) / wall, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stage_ms_per_request": stage_split,
+    }
+
+
+# ==========================================
+# 2. SUITES
+# ==========================================
+def suite_crop(corpus, levels, repeat):
+    # birefnet (mode=model) and the classical tier (mode=fast) are timed apart: under the
+    # default mode=auto the classical tier accepts every synthetic photo and birefnet never runs
+    from app.processors.cropper import ImageCropper
+    from app import config
+    cropper = ImageCropper(model_name=config.CROP_MODEL, proxy_size=config.CROP_PROXY_SIZE,
+                           alpha_matting=config.CROP_ALPHA_MATTING, mode="model")
+    cropper.process(corpus[0][1])  # warm-up
+    images = [data for _, data in corpus]
+
+    # Which tier auto would use for each image
+    tiers = {"fast": 0, "model": 0, "none": 0}
+    for data in images:
+        original, _ = cropper.decode(data)
+        tiers[cropper.crop_tiered(original, "auto").tier] += 1
+    print(f"   auto tiers: {tiers}")
+
+    results = {}
+    for c in levels:
+        results[f"crop_model@c{c}"] = drive(lambda b: cropper.process(b) is not None, images, c, repeat)
+        results[f"crop_fast@c{c}"] = drive(lambda b: cropper.process(b, mode="fast") is not None, images, c, repeat)
+        results[f"crop_model@c{c}"]["auto_tiers"] = results[f"crop_fast@c{c}"]["auto_tiers"] = tiers
+    return results
+
+
+def suite_surya(corpus, levels, repeat):
+    from app.processors.surya_ocr import SuryaOCR
+    engine = SuryaOCR()
+    receipts = [receipt_pil(n_items=n, seed=i) for i, n in enumerate([8, 15, 25, 40])]
+    engine.run(receipts[0])  # warm-up
+    return {f"surya@c{c}": drive(lambda im: bool(engine.run(im)), receipts, c, repeat) for c in levels}
+
+
+# (stream, LLM_OUTPUT_FORMAT) per parse mode
+PARSE_MODES = {"legacy": (False, "none"), "stream": (True, "none"), "schema": (True, "schema")}
+
+
+def suite_parse(corpus, levels, repeat):
+    import random
+    from app import config
+    from app.services.ollama_pool import get_ollama_pool
+    from app.processors.surya_ocr_parser import SuryaParser
+    from app.processors.ollama_vision_ocr import OllamaVisionOCR
+
+    pool = get_ollama_pool()
+    texts = ["\n".join(receipt_lines(random.Random(i), 12)) for i in range(8)]
+    payloads = [encode_jpeg(render_receipt(receipt_lines(random.Random(i), 12))) for i in range(4)]
+
+    def measure(fn, items, c):
+        tokens_before = STUB.tokens_sent
+        result = drive(fn, items, c, repeat)
+        time.sleep(0.1)  # let the stub notice closed streams
+        result["stub_tokens_per_request"] = round((STUB.tokens_sent - tokens_before) / result["requests"], 1)
+        return result
+
+    results = {}
+    default_format = config.LLM_OUTPUT_FORMAT
+    try:
+        for mode, (stream, output_format) in PARSE_MODES.items():
+            config.LLM_OUTPUT_FORMAT = output_format  # read per call by receipt_schema.output_format
+            text_parser = SuryaParser(client=pool, stream=stream)
+            vision = OllamaVisionOCR(client=pool, stream=stream)
+            for c in levels:
+                results[f"parse_text_{mode}@c{c}"] = measure(lambda t: "error" not in text_parser.parse(t), texts, c)
+                results[f"parse_vision_{mode}@c{c}"] = measure(lambda p: "error" not in vision.parse(p), payloads, c)
+    finally:
+        config.LLM_OUTPUT_FORMAT = default_format
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def suite_http(corpus, levels, repeat):
+    import httpx
+    import uvicorn
+    from app.main import app
+    from app.services.workflow import serves_pipeline, warm_up
+
+    warm_up()
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    base = f"http://127.0.0.1:{port}"
+    client = httpx.Client(timeout=300, limits=httpx.Limits(max_connections=max(levels) * 2))
+    images = [data for _, data in corpus]
+
+    def post(path):
+        def call(data):
+            # Trailing bytes after the JPEG EOI make every upload unique (no cache hits)
+            r = client.post(base + path, files={"file": ("r.jpg", data + os.urandom(8), "image/jpeg")})
+            return r.status_code == 200
+        return call
+
+    results = {}
+    try:
+        for path, pipeline in [("/process/crop", "crop"), ("/ocr/vision", "vision"), ("/ocr/surya", "surya")]:
+            if not serves_pipeline(pipeline):
+                continue
+            for c in levels:
+                results[f"http{path}@c{c}"] = drive(post(path), images, c, repeat)
+    finally:
+        client.close()
+        server.should_exit = True
+    return results
+
+
+STUB = None
+
+SUITES = {"crop": suite_crop, "surya": suite_surya, "parse": suite_parse, "http": suite_http}
+
+
+# ==========================================
+# 3. BASELINE COMPARISON
+# ==========================================
+def compare(results, baseline, max_regression):
+    """Prints deltas vs baseline; returns the list of regressed keys."""
+    regressions = []
+    print(f"\n{'benchmark':<28} {'rps':>8} {'Δrps%':>7} {'p95_ms':>9} {'Δp95%':>7} {'errors':>7} {'tokens':>7}")
+    for key, cur in sorted(results.items()):
+        base = baseline.get("results", {}).get(key)
+        tokens = cur.get("stub_tokens_per_request", "")
+        if "skipped" in cur:
+            print(f"{key:<28} skipped: {cur['skipped']}")
+            continue
+        if not base or "skipped" in base:
+            print(f"{key:<28} {cur['throughput_rps']:>8.2f} {'new':>7} {cur['p95_ms']:>9.1f} {'new':>7} {cur['errors']:>7} {tokens:>7}")
+            continue
+        d_rps = (cur["throughput_rps"] - base["throughput_rps"]) / base["throughput_rps"] * 100
+        d_p95 = (cur["p95_ms"] - base["p95_ms"]) / base["p95_ms"] * 100
+        flag = ""
+        if d_rps < -max_regression or d_p95 > max_regression:
+            regressions.append(key)
+            flag = "  ❌"
+        print(f"{key:<28} {cur['throughput_rps']:>8.2f} {d_rps:>+7.1f} {cur['p95_ms']:>9.1f} {d_p95:>+7.1f} {cur['errors']:>7} {tokens:>7}{flag}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--suites", default="crop,parse,http")
+    ap.add_argument("--concurrency", default="1,4")
+    ap.add_argument("--repeat", type=int, default=2, help="passes over the corpus per concurrency level")
+    ap.add_argument("--corpus", default="default", help="synthetic corpus size: small | default | large")
+    ap.add_argument("--corpus-dir", help="use real images from this directory instead")
+    ap.add_argument("--stub-latency-ms", type=float, default=300)
+    ap.add_argument("--stub-token-ms", type=float, default=5)
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline")
+    ap.add_argument("--max-regression", type=float, default=10.0, help="percent")
+    args = ap.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # The stub must be up (and the env set) before any `app` module reads config
+    global STUB
+    stub = STUB = StubOllama(latency_ms=args.stub_latency_ms, token_ms=args.stub_token_ms)
+    os.environ["OLLAMA_HOSTS"] = stub.start()
+    os.environ.setdefault("WARMUP", "0")
+    os.environ.setdefault("CACHE_MAX_ITEMS", "0")   # measure work, not cache hits
+    os.environ.setdefault("CACHE_DIR", "")
+
+    corpus = load_corpus(args.corpus_dir) if args.corpus_dir else build_corpus(args.corpus)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    print(f"📊 Corpus: {len(corpus)} images, concurrency {levels}, stub Ollama at {os.environ['OLLAMA_HOSTS']}")
+
+    results = {}
+    for name in args.suites.split(","):
+        print(f"▶️  Suite: {name}")
+        try:
+            results.update(SUITES[name](corpus, levels, args.repeat))
+        except ImportError as e:
+            # e.g. surya/torch/rembg not installed on this host
+            results[f"{name}"] = {"skipped": f"missing dependency: {e.name or e}"}
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "corpus": args.corpus_dir or args.corpus,
+            "stub_latency_ms": args.stub_latency_ms,
+            "stub_token_ms": args.stub_token_ms,
+            "stub_requests": stub.requests,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results written to {args.out}")
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.max_regression)
+    stub.stop()
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.max_regression}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Local stand-in for an Ollama server (POST /api/chat only).
+
+    python -m benchmarks.stub_ollama --port 11500 --latency-ms 400 --token-ms 8
+
+Replies with a canned receipt JSON (vision schema when the request carries
+images, Surya-parser schema otherwise), optionally followed by `--tail` text
+the way real models ramble on after the object (not when the request sets
+`format`: constrained decoding ends at the object). Supports `stream: true`
+(NDJSON chunks, one per token) and `stream: false`.
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VISION_REPLY = {
+    "store_name": "METRO", "date": "2024-05-14", "time": "18:32",
+    "total_amount": 34.47, "subtotal": 29.98, "tax_tps_amount": 1.50, "tax_tvq_amount": 2.99,
+    "items": [{"desc": "LAIT 2%", "qty": 1, "price": 5.49}, {"desc": "POULET", "qty": 1, "price": 24.49}],
+}
+TEXT_REPLY = {
+    "store_name": "METRO", "date": "2024-05-14", "time": "18:32", "total_amount": 34.47,
+    "taxes": {"tps": 1.50, "tvq": 2.99},
+    "items": [{"qty": 1.0, "desc": "LAIT 2%", "price": 5.49}, {"qty": 1.0, "desc": "POULET", "price": 24.49}],
+}
+DEFAULT_TAIL = "\n\nExplanation: the store name was taken from the header, taxes from the TPS/TVQ lines."
+
+
+def _tokens(text):
+    # ~4 characters per token, split on word boundaries so chunks look like a model's
+    return re.findall(r"\s*\S{1,4}", text)
+
+
+class StubOllama:
+    def __init__(self, latency_ms=300.0, token_ms=5.0, tail=DEFAULT_TAIL, fail_rate=0.0, drop_after=None):
+        self.latency_ms = latency_ms
+        self.token_ms = token_ms
+        self.tail = tail
+        self.fail_rate = fail_rate
+        self.drop_after = drop_after  # streamed tokens before the connection is cut (a backend dying mid-reply)
+        self.requests = 0
+        self.tokens_sent = 0
+        self._lock = threading.Lock()
+        self.server = None
+
+    def reply_for(self, body):
+        messages = body.get("messages", [])
+        has_images = any(m.get("images") for m in messages)
+        content = json.dumps(VISION_REPLY if has_images else TEXT_REPLY, indent=2)
+        if body.get("format"):
+            return content
+        return content + (self.tail or "")
+
+    def start(self, host="127.0.0.1", port=0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if self.path != "/api/chat":
+                    return self._send_json(404, {"error": "not found"})
+
+                with stub._lock:
+                    stub.requests += 1
+                    fail = stub.fail_rate and (stub.requests * stub.fail_rate) % 1 < stub.fail_rate
+                if fail:
+                    return self._send_json(500, {"error": "stub failure"})
+
+                prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+                tokens = _tokens(stub.reply_for(body))
+                time.sleep(stub.latency_ms / 1000)  # prefill
+                stats = {
+                    "prompt_eval_count": prompt_chars // 4,
+                    "prompt_eval_duration": int(stub.latency_ms * 1e6),
+                }
+
+                if body.get("stream", True):
+                    self._stream(body, tokens, stats)
+                else:
+                    time.sleep(len(tokens) * stub.token_ms / 1000)
+                    with stub._lock:
+                        stub.tokens_sent += len(tokens)
+                    self._send_json(200, {
+                        "model": body.get("model"), "created_at": "2024-01-01T00:00:00Z",
+                        "message": {"role": "assistant", "content": "".join(tokens)},
+                        "done": True, "done_reason": "stop",
+                        "eval_count": len(tokens), "eval_duration": int(len(tokens) * stub.token_ms * 1e6),
+                        **stats,
+                    })
+
+            def _stream(self, body, tokens, stats):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                sent = 0
+                try:
+                    for token in tokens:
+                        if stub.drop_after is not None and sent >= stub.drop_after:
+                            self.close_connection = True
+                            return
+                        time.sleep(stub.token_ms / 1000)
+                        self._chunk({"model": body.get("model"), "created_at": "2024-01-01T00:00:00Z",
+                                     "message": {"role": "assistant", "content": token}, "done": False})
+                        sent += 1
+                    self._chunk({"model": body.get("model"), "created_at": "2024-01-01T00:00:00Z",
+                                 "message": {"role": "assistant", "content": ""}, "done": True,
+                                 "done_reason": "stop", "eval_count": sent,
+                                 "eval_duration": int(sent * stub.token_ms * 1e6), **stats})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # client stopped reading (early termination)
+                finally:
+                    with stub._lock:
+                        stub.tokens_sent += sent
+
+            def _chunk(self, payload):
+                data = (json.dumps(payload) + "\n").encode()
+                self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="stub-ollama", daemon=True).start()
+        return f"http://{host}:{self.server.server_port}"
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--port", type=int, default=11500)
+    ap.add_argument("--latency-ms", type=float, default=300)
+    ap.add_argument("--token-ms", type=float, default=5)
+    ap.add_argument("--fail-rate", type=float, default=0.0)
+    ap.add_argument("--no-tail", action="store_true")
+    args = ap.parse_args()
+
+    stub = StubOllama(args.latency_ms, args.token_ms, tail="" if args.no_tail else DEFAULT_TAIL, fail_rate=args.fail_rate)
+    url = stub.start(port=args.port)
+    print(f"🧪 Stub Ollama listening on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import os
+import random
+
+import cv2
+import numpy as np
+from PIL import Image
+
+STORES = ["METRO", "IGA", "COUCHE-TARD", "PHARMAPRIX", "SHELL", "TIM HORTONS"]
+PRODUCTS = ["LAIT 2%", "PAIN BLANC", "BANANES", "CAFE MOYEN", "OEUFS 12", "POULET", "FROMAGE", "JUS ORANGE"]
+
+
+def receipt_lines(rng: random.Random, n_items: int):
+    """Plausible POS receipt text (items, subtotal, TPS/TVQ, total)."""
+    lines = [rng.choice(STORES), "123 RUE PRINCIPALE", f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(7, 22):02d}:{rng.randint(0, 59):02d}"]
+    subtotal = 0.0
+    for _ in range(n_items):
+        price = round(rng.uniform(0.99, 24.99), 2)
+        subtotal += price
+        lines.append(f"{rng.choice(PRODUCTS):<18}{price:>8.2f}")
+    subtotal = round(subtotal, 2)
+    tps = round(subtotal * 0.05, 2)
+    tvq = round(subtotal * 0.09975, 2)
+    lines += [
+        f"{'SOUS-TOTAL':<18}{subtotal:>8.2f}",
+        f"{'TPS':<18}{tps:>8.2f}",
+        f"{'TVQ':<18}{tvq:>8.2f}",
+        f"{'TOTAL':<18}{subtotal + tps + tvq:>8.2f}",
+    ]
+    return lines
+
+
+def render_receipt(lines, width=576):
+    """White thermal-paper style receipt, BGR uint8."""
+    line_h = 34
+    height = line_h * (len(lines) + 2)
+    paper = np.full((height, width, 3), 250, np.uint8)
+    for i, text in enumerate(lines):
+        cv2.putText(paper, text, (16, line_h * (i + 1) + 8), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (20, 20, 20), 2, cv2.LINE_AA)
+    return paper
+
+
+def make_photo(width, height, n_items=12, seed=0):
+    """
+    A receipt lying on a dark table, as a phone photo of `width` x `height`.
+    The receipt keeps its own aspect ratio and fills most of the frame height.
+    """
+    rng = random.Random(seed)
+    paper = render_receipt(receipt_lines(rng, n_items))
+
+    table = np.full((height, width, 3), (45, 40, 35), np.uint8)
+    noise = np.random.default_rng(seed).integers(0, 20, size=table.shape, dtype=np.uint8)
+    table = cv2.add(table, noise)
+
+    scale = min(0.85 * height / paper.shape[0], 0.85 * width / paper.shape[1])
+    paper = cv2.resize(paper, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    ph, pw = paper.shape[:2]
+    y0, x0 = (height - ph) // 2, (width - pw) // 2
+    table[y0:y0 + ph, x0:x0 + pw] = paper
+    return table
+
+
+def encode_jpeg(image_bgr, quality=90) -> bytes:
+    ok, buf = cv2.imencode(".jpg", image_bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes()
+
+
+def receipt_pil(n_items=12, seed=0) -> Image.Image:
+    """Already-cropped receipt (what SuryaOCR receives), RGB PIL."""
+    paper = render_receipt(receipt_lines(random.Random(seed), n_items))
+    return Image.fromarray(cv2.cvtColor(paper, cv2.COLOR_BGR2RGB))
+
+
+# (width, height, n_items): phone photos at several resolutions / aspect ratios,
+# including long receipts that come out of the cropper at 1:6 or worse
+CORPUS_SHAPES = {
+    "small": [(1200, 1600, 8), (1536, 2048, 15)],
+    "default": [(1200, 1600, 8), (3000, 4000, 15), (2250, 4000, 25), (4000, 3000, 12), (3000, 4000, 60)],
+    "large": [(3000, 4000, 15), (4000, 6000, 30), (6000, 8000, 25), (3000, 4000, 90)],
+}
+
+
+def build_corpus(name="default", copies=1):
+    """[(label, jpeg_bytes)] for one of CORPUS_SHAPES."""
+    corpus = []
+    for i, (w, h, n_items) in enumerate(CORPUS_SHAPES[name]):
+        for c in range(copies):
+            seed = i * 1000 + c
+            corpus.append((f"{w}x{h}_items{n_items}_{c}", encode_jpeg(make_photo(w, h, n_items=n_items, seed=seed))))
+    return corpus
+
+
+def load_corpus(directory):
+    """[(filename, bytes)] for every image in `directory`."""
+    exts = {".jpg", ".jpeg", ".png", ".webp"}
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if os.path.splitext(name)[1].lower() in exts:
+            with open(os.path.join(directory, name), "rb") as f:
+                corpus.append((name, f.read()))
+    return corpus
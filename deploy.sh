@@ -40,6 +40,7 @@ docker run --gpus all -d \
   -p 8002:8002 \
   --name $CONTAINER_NAME \
   --restart always \
+  -v receipt-ocr-data:/app/data \
   $IMAGE_NAME
 
 echo "=========================================="
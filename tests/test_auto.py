@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+import pytest
+
+from app import config
+from app.processors.receipt_schema import TEXT_SCHEMA, VISION_SCHEMA
+from app.services import auto
+from app.services.auto import AutoRouter, LatencyTracker
+from app.services.cancellation import OperationCancelled, current_token
+from app.services.executor import WorkerPool
+
+SURYA_OK = {"store_name": "METRO", "date": "2024-05-14", "time": None, "total_amount": 34.47,
+            "taxes": {"tps": 1.5, "tvq": 2.99}, "items": []}
+VISION_OK = {"store_name": "METRO", "date": "2024-05-14", "total_amount": 34.47, "items": []}
+
+
+@pytest.fixture
+def paths(monkeypatch):
+    """Replaces both pipelines with fakes: `paths.set(name, seconds, result)`; `paths.log[name]` records each run."""
+    class Paths:
+        log = {}
+
+        def set(self, name, seconds, result):
+            def run(digest, cropped):
+                entry = self.log[name] = {"started": time.monotonic(), "cancelled": None}
+                token = current_token()
+                end = time.monotonic() + seconds
+                while time.monotonic() < end:
+                    try:
+                        token.check()
+                    except OperationCancelled:
+                        entry["cancelled"] = token.reason
+                        raise
+                    time.sleep(0.01)
+                return result
+            schema = TEXT_SCHEMA if name == "surya" else VISION_SCHEMA
+            monkeypatch.setitem(auto.AUTO_PATHS, name, (run, WorkerPool(f"test-{name}", 2, 0), schema))
+
+        def wait_cancelled(self, name):
+            deadline = time.monotonic() + 2
+            while not self.log[name]["cancelled"] and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return self.log[name]["cancelled"]
+
+    monkeypatch.setattr(auto, "workflow_shared_crop", lambda data: ("digest", "crop"))
+    monkeypatch.setattr(config, "AUTO_HEDGE_DELAY_MS", 100)
+    return Paths()
+
+
+def _run(policy, primary="surya"):
+    start = time.monotonic()
+    return asyncio.run(AutoRouter().run(b"image", policy=policy, primary=primary)), start
+
+
+def test_cascade_stops_at_a_valid_primary(paths):
+    paths.set("surya", 0.0, SURYA_OK)
+    paths.set("vision", 0.0, VISION_OK)
+    outcome, _ = _run("cascade")
+    assert (outcome["winner"], outcome["started"], outcome["result"]) == ("surya", ["surya"], SURYA_OK)
+
+
+def test_cascade_falls_back_when_the_primary_fails_the_schema(paths):
+    paths.set("surya", 0.0, {"store_name": "METRO"})
+    paths.set("vision", 0.0, VISION_OK)
+    outcome, _ = _run("cascade")
+    assert (outcome["winner"], outcome["started"]) == ("vision", ["surya", "vision"])
+
+
+def test_every_path_failing_surfaces_the_primary_error(paths):
+    paths.set("surya", 0.0, {"error": "Ollama down"})
+    paths.set("vision", 0.0, {"error": "vision down"})
+    outcome, _ = _run("cascade")
+    assert outcome["winner"] is None and outcome["result"] == {"error": "Ollama down"}
+
+
+def test_hedge_starts_the_secondary_after_the_delay_and_cancels_the_loser(paths):
+    paths.set("surya", 2.0, SURYA_OK)
+    paths.set("vision", 0.05, VISION_OK)
+    outcome, start = _run("hedge")
+
+    assert (outcome["winner"], outcome["started"]) == ("vision", ["surya", "vision"])
+    assert 0.09 <= paths.log["vision"]["started"] - start < 0.5
+    assert outcome["elapsed_ms"] < 1000
+    assert paths.wait_cancelled("surya") == "lost_race"
+
+
+def test_hedge_never_fires_for_a_fast_primary(paths):
+    paths.set("surya", 0.0, SURYA_OK)
+    paths.set("vision", 0.0, VISION_OK)
+    outcome, _ = _run("hedge")
+    assert outcome["started"] == ["surya"]
+
+
+def test_race_starts_both_and_the_first_valid_wins(paths):
+    paths.set("surya", 2.0, SURYA_OK)
+    paths.set("vision", 0.1, VISION_OK)
+    outcome, start = _run("race")
+
+    assert (outcome["winner"], outcome["started"]) == ("vision", ["surya", "vision"])
+    assert paths.log["vision"]["started"] - start < 0.09
+    assert paths.wait_cancelled("surya") == "lost_race"
+
+
+def test_hedge_delay_is_the_p95_once_there_are_enough_samples():
+    tracker = LatencyTracker()
+    assert tracker.percentile(0.95, 20, default=0.5) == 0.5
+    for ms in range(1, 101):
+        tracker.record(ms / 1000)
+    assert tracker.percentile(0.95, 20, default=0.5) == 0.096
@@ -0,0 +1,77 @@
+import io
+import json
+import threading
+import zipfile
+
+from fastapi.testclient import TestClient
+
+from app import config
+from app import main
+from app.services.executor import WorkerPool
+
+
+def _archive(count, size):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i in range(count):
+            zf.writestr(f"r{i}.jpg", bytes(size))
+        zf.writestr("notes.txt", b"skipped")
+    return buf.getvalue()
+
+
+def _post(archive):
+    return TestClient(main.app).post("/ocr/batch", files={"archive": ("a.zip", archive)}, data={"pipeline": "surya"})
+
+
+def _refuse_inflating(monkeypatch):
+    def inflate(*args):
+        raise AssertionError("entry inflated before the archive was checked")
+    monkeypatch.setattr(main, "_inflate", inflate)
+
+
+def test_entry_count_is_checked_before_inflating(monkeypatch):
+    monkeypatch.setattr(config, "BATCH_MAX_FILES", 3)
+    _refuse_inflating(monkeypatch)
+    response = _post(_archive(4, 100))
+    assert response.status_code == 413
+    assert response.json() == {"error": "Too many files (4 > 3)"}
+
+
+def test_declared_total_is_checked_before_inflating(monkeypatch):
+    # Zeros deflate to almost nothing: a small upload that inflates past the cap
+    monkeypatch.setattr(config, "BATCH_MAX_BYTES", 100_000)
+    _refuse_inflating(monkeypatch)
+    archive = _archive(4, 40_000)
+    assert len(archive) < 100_000
+
+    response = _post(archive)
+    assert response.status_code == 413
+    assert "inflates to 160000 bytes" in response.json()["error"]
+
+
+def test_entries_are_inflated_as_their_turn_comes(monkeypatch):
+    monkeypatch.setattr(config, "BATCH_CONCURRENCY", 2)
+    in_memory, peak = [0], [0]
+    lock = threading.Lock()
+    inflate = main._inflate
+
+    def counting_inflate(*args):
+        data = inflate(*args)
+        with lock:
+            in_memory[0] += 1
+            peak[0] = max(peak[0], in_memory[0])
+        return data
+
+    def workflow(data):
+        with lock:
+            in_memory[0] -= 1
+        return {"total": float(len(data))}
+
+    monkeypatch.setattr(main, "_inflate", counting_inflate)
+    monkeypatch.setattr(main, "workflow_quality_gate", lambda data, endpoint: {"scores": None, "failed": []})
+    monkeypatch.setitem(main.BATCH_PIPELINES, "surya", (workflow, WorkerPool("test-batch", 2, 0)))
+
+    lines = [json.loads(line) for line in _post(_archive(6, 100)).text.splitlines()]
+    assert lines[-1] == {"summary": {"total": 6, "ok": 6, "errors": 0, "rejected": 0}}
+    assert sorted(line["filename"] for line in lines[:-1]) == [f"r{i}.jpg" for i in range(6)]
+    assert peak[0] <= 2
@@ -0,0 +1,148 @@
+import json
+import sys
+import types
+
+import pytest
+
+from app import config
+from app.services import bulk
+from app.services.bulk import BulkRun, load_checkpoint
+
+
+class FakeWorkflow:
+    """Crops / OCRs / parses by echoing the file bytes; nothing is stored yet."""
+
+    def workflow_artifact(self, stage, digest):
+        return None
+
+    def workflow_crop(self, data, digest):
+        return None if data == b"blank" else data.decode()
+
+    def workflow_surya_text(self, digest, crop):
+        return crop.upper()
+
+    def workflow_surya_parse(self, digest, text):
+        return {"text": text}
+
+    def workflow_vision_from_crop(self, digest, crop):
+        return {"vision": crop}
+
+
+class StoredWorkflow(FakeWorkflow):
+    """Has a stored crop for "c" and a stored vision result for "d"."""
+
+    def __init__(self):
+        self.cropped = []
+
+    def workflow_artifact(self, stage, digest):
+        stored = {("crop", bulk.content_digest(b"c")): "stored-c",
+                  ("vision_json", bulk.content_digest(b"d")): {"vision": "stored-d"}}
+        return stored.get((stage, digest))
+
+    def workflow_crop(self, data, digest):
+        self.cropped.append(data)
+        return super().workflow_crop(data, digest)
+
+
+def write_inputs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / f"{name}.jpg"
+        path.write_bytes(name.encode())
+        paths.append(str(path))
+    return paths
+
+
+def test_run_reads_every_input_and_resumes_from_the_output(tmp_path):
+    paths = write_inputs(tmp_path, ("a", "b", "blank"))
+    out = tmp_path / "results.jsonl"
+
+    run = BulkRun("surya", str(out), crop_workers=2, ocr_workers=2, llm_workers=2, queue_size=1, read_workers=2)
+    run.workflow = FakeWorkflow()
+    summary = run.run(paths)
+
+    records = {json.loads(line)["path"]: json.loads(line) for line in out.read_text().splitlines()}
+    assert summary["ok"] == 2 and summary["error"] == 1
+    assert records[paths[0]]["result"] == {"text": "A"}
+    assert records[paths[2]]["status"] == "error"
+    assert load_checkpoint(str(out), retry_errors=True) == set(paths[:2])
+
+
+def test_vision_pipeline_skips_ocr_and_enters_at_the_stored_crop(tmp_path):
+    paths = write_inputs(tmp_path, ("a", "c", "d"))
+    out = tmp_path / "vision.jsonl"
+
+    run = BulkRun("vision", str(out), crop_workers=1, ocr_workers=1, llm_workers=2, queue_size=1, read_workers=1)
+    run.workflow = workflow = StoredWorkflow()
+    summary = run.run(paths)
+
+    records = {json.loads(line)["path"]: json.loads(line) for line in out.read_text().splitlines()}
+    assert run.ocr_stage is None and summary["ok"] == 3
+    assert [records[path]["entry"] for path in paths] == ["crop", "llm", "stored"]
+    assert [records[path]["result"] for path in paths] == [{"vision": "a"}, {"vision": "stored-c"},
+                                                           {"vision": "stored-d"}]
+    assert workflow.cropped == [b"a"]
+
+
+# ==================== CLI ====================
+@pytest.fixture
+def cli(tmp_path, monkeypatch):
+    """Runs bulk.main() with BulkRun replaced by a recorder; returns the recorded calls."""
+    calls = []
+
+    class RecordingRun:
+        def __init__(self, pipeline, out_path, crop_workers, ocr_workers, llm_workers, queue_size=64,
+                     progress_every=10.0, read_workers=4):
+            calls.append({"pipeline": pipeline, "crop_workers": crop_workers, "llm_workers": llm_workers,
+                          "read_workers": read_workers, "crop_processes": config.CROP_PROCESSES})
+
+        def run(self, paths):
+            calls[-1]["paths"] = paths
+            return {"receipts": len(paths)}
+
+    monkeypatch.setattr(bulk, "BulkRun", RecordingRun)
+    monkeypatch.setattr(bulk.result_cache, "enable_disk", lambda disk_dir: calls.append({"artifacts": disk_dir}))
+    monkeypatch.setattr(config, "CROP_PROCESSES", 0)
+    monkeypatch.delenv("CROP_PROCESSES", raising=False)
+    monkeypatch.setattr(bulk.os, "cpu_count", lambda: 6)
+    monkeypatch.setitem(sys.modules, "onnxruntime", None)  # a CPU-only host
+    paths = write_inputs(tmp_path, ("a", "b"))
+
+    def main(*argv):
+        calls.clear()
+        monkeypatch.setattr(sys, "argv", ["bulk", str(tmp_path), "--out", str(tmp_path / "out.jsonl"),
+                                          "--artifacts", str(tmp_path / "artifacts"), *argv])
+        bulk.main()
+        return calls
+
+    main.paths = paths
+    return main
+
+
+def test_cli_defaults_to_one_crop_process_per_core_on_cpu_hosts(cli):
+    artifacts, run = cli()
+    assert artifacts["artifacts"].endswith("artifacts")
+    assert run["crop_processes"] == 6 and run["crop_workers"] == 6
+    assert run["pipeline"] == "surya" and sorted(run["paths"]) == sorted(cli.paths)
+
+
+def test_cli_crop_processes_flag_and_environment(cli, monkeypatch):
+    _, run = cli("--crop-processes", "0", "--pipeline", "vision", "--llm-workers", "3", "--read-workers", "2")
+    assert run["crop_processes"] == 0 and run["crop_workers"] == config.GPU_STAGE_CONCURRENCY
+    assert (run["pipeline"], run["llm_workers"], run["read_workers"]) == ("vision", 3, 2)
+
+    monkeypatch.setenv("CROP_PROCESSES", "2")
+    monkeypatch.setattr(config, "CROP_PROCESSES", 2)
+    assert cli()[1]["crop_processes"] == 2
+
+
+def test_cli_keeps_the_cropper_in_process_on_a_gpu(cli, monkeypatch):
+    gpu = types.SimpleNamespace(get_available_providers=lambda: ["CUDAExecutionProvider", "CPUExecutionProvider"])
+    monkeypatch.setitem(sys.modules, "onnxruntime", gpu)
+    assert cli()[1]["crop_processes"] == 0
+
+
+def test_cli_skips_inputs_already_in_the_output(cli, tmp_path):
+    (tmp_path / "out.jsonl").write_text("".join(json.dumps({"path": path, "status": "ok"}) + "\n"
+                                                for path in cli.paths))
+    assert cli() == [{"artifacts": str(tmp_path / "artifacts")}]
@@ -0,0 +1,113 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from app.services.cache import ResultCache, _sizeof
+from app.services.cancellation import CancelToken, DeadlineExceeded, OperationCancelled, run_with_token
+
+
+def test_concurrent_callers_share_one_computation():
+    cache = ResultCache()
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.1)
+        return {"total": 12.5}
+
+    with ThreadPoolExecutor(8) as pool:
+        futures = [pool.submit(cache.get_or_compute, "json", "abc-v1", compute) for _ in range(8)]
+        results = [f.result() for f in futures]
+
+    assert len(calls) == 1
+    assert all(r == {"total": 12.5} for r in results)
+    stages = cache.stats()["stages"]["json"]
+    assert stages["misses"] == 1
+    assert stages["hits"] + stages["coalesced"] == 7
+
+
+def test_errors_are_not_cached():
+    cache = ResultCache()
+    results = iter([{"error": "Ollama down"}, {"total": 1.0}])
+    assert cache.get_or_compute("json", "k", lambda: next(results)) == {"error": "Ollama down"}
+    assert cache.get_or_compute("json", "k", lambda: next(results)) == {"total": 1.0}
+
+
+def test_evicts_least_recently_used_over_byte_budget():
+    cache = ResultCache(max_items=100, max_bytes=250)
+    for key in ("a", "b"):
+        cache.get_or_compute("text", key, lambda: "x" * 100)
+    cache.get_or_compute("text", "a", lambda: "unused")  # a is now the most recent
+    cache.get_or_compute("text", "c", lambda: "x" * 100)
+
+    assert cache.stats()["memory_bytes"] == 200
+    assert cache.peek("text", "a") is not None
+    assert cache.peek("text", "b") is None
+
+
+def test_array_view_is_sized_by_its_base():
+    original = np.zeros((1000, 1000, 3), np.uint8)
+    view = original[10:20, 10:20]
+    assert _sizeof(view) == original.nbytes
+    assert _sizeof(view.copy()) == view.nbytes
+
+
+def test_arrays_go_to_disk_as_lossless_png(tmp_path):
+    crop = np.random.default_rng(0).integers(0, 255, (40, 30, 3), dtype=np.uint8)
+    ResultCache(disk_dir=str(tmp_path)).get_or_compute("crop", "abc-v1", lambda: crop)
+
+    assert [p.name for p in tmp_path.rglob("*.*")] == ["abc-v1.png"]
+    stored = ResultCache(disk_dir=str(tmp_path)).peek("crop", "abc-v1")
+    assert np.array_equal(stored, crop)
+
+
+def test_disk_tier_drops_least_recently_used_over_budget(tmp_path):
+    cache = ResultCache(max_items=1, disk_dir=str(tmp_path), disk_max_bytes=1200)
+    for i, key in enumerate(("a", "b", "c")):
+        cache.get_or_compute("json", key, lambda: {"text": "x" * 300})
+        os.utime(next(tmp_path.rglob(f"{key}.pkl")), (i, i))  # a is the oldest
+    cache.get_or_compute("json", "d", lambda: {"text": "x" * 300})
+
+    assert sorted(p.stem for p in tmp_path.rglob("*.pkl")) == ["b", "c", "d"]
+    assert cache.stats()["disk_bytes"] <= 1080
+
+
+def test_cancelled_follower_stops_waiting_for_the_leader():
+    cache = ResultCache()
+    release = threading.Event()
+    leader = threading.Thread(target=cache.get_or_compute, args=("json", "k", lambda: release.wait(5) and {"total": 1}))
+    leader.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        run_with_token(CancelToken.with_timeout(0.2), cache.get_or_compute, "json", "k", lambda: {"total": 2})
+    assert time.monotonic() - start < 1.0
+    release.set()
+    leader.join(5)
+
+
+def test_follower_takes_over_from_a_cancelled_leader():
+    cache = ResultCache()
+    token = CancelToken()
+    started = threading.Event()
+
+    def abandoned():
+        started.set()
+        time.sleep(0.1)
+        token.check()
+
+    leader = threading.Thread(target=lambda: pytest.raises(OperationCancelled, run_with_token, token,
+                                                           cache.get_or_compute, "json", "k", abandoned))
+    leader.start()
+    started.wait(5)
+    token.cancel()
+
+    assert cache.get_or_compute("json", "k", lambda: {"total": 2}) == {"total": 2}
+    leader.join(5)
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config
+from app import main
+from app.services import metrics, workflow
+from app.services.cancellation import (
+    DISCONNECTED, CancelToken, DeadlineExceeded, OperationCancelled, check_cancelled, current_token, run_with_token
+)
+from app.services.executor import WorkerPool
+
+
+def _stages_until_cancelled(data):
+    # A workflow that checks its token between short stages
+    for _ in range(200):
+        check_cancelled()
+        time.sleep(0.01)
+    return {"total_amount": 1.0}
+
+
+def test_request_timeout_header_gives_504(monkeypatch):
+    monkeypatch.setattr(main, "workflow_quality_gate", lambda data, endpoint: {"scores": None, "failed": []})
+    monkeypatch.setattr(main, "workflow_vision_direct", _stages_until_cancelled)
+
+    start = time.monotonic()
+    response = TestClient(main.app).post("/ocr/vision", files={"file": ("r.jpg", b"x")},
+                                         headers={config.REQUEST_TIMEOUT_HEADER: "0.2"})
+    assert response.status_code == 504
+    assert response.json()["error"] == "Deadline exceeded"
+    assert time.monotonic() - start < 1.5
+
+
+def test_token_reaches_the_worker_thread_and_its_children():
+    token = CancelToken.with_timeout(5)
+    seen = {}
+
+    async def scenario():
+        pool = WorkerPool("test-propagation", 1, 0)
+        await pool.submit(run_with_token, token, lambda: seen.update(token=current_token()))
+
+    asyncio.run(scenario())
+    assert seen["token"] is token
+
+    child = token.child()
+    token.cancel(DISCONNECTED)
+    assert child.cancelled and child.reason == DISCONNECTED
+
+
+def test_checkpoint_stops_a_cancelled_request_before_the_stage():
+    token = CancelToken()
+    token.cancel(DISCONNECTED)
+    with pytest.raises(OperationCancelled):
+        run_with_token(token, workflow._checkpoint, "crop")
+    workflow._checkpoint("crop")  # no token: nothing to check
+
+
+def test_checkpoint_skips_a_stage_that_cannot_finish_in_time(monkeypatch):
+    monkeypatch.setitem(metrics._stage_means, "surya.ocr", 3.0)
+    with pytest.raises(DeadlineExceeded, match="surya.ocr needs"):
+        run_with_token(CancelToken.with_timeout(1.0), workflow._checkpoint, "surya.ocr")
+    run_with_token(CancelToken.with_timeout(10.0), workflow._checkpoint, "surya.ocr")
+
+
+class _Request:
+    """Stands in for a starlette Request whose client leaves after `seconds`."""
+
+    def __init__(self, seconds):
+        self.gone_at = time.monotonic() + seconds
+
+    async def is_disconnected(self):
+        return time.monotonic() >= self.gone_at
+
+
+def test_disconnect_cancels_work_still_queued(monkeypatch):
+    monkeypatch.setattr(config, "DISCONNECT_POLL_SECONDS", 0.02)
+    monkeypatch.setattr(config, "CROP_PROCESSES", 0)
+    monkeypatch.setattr(config, "MODEL_SERVER_SOCKET", "")
+    cropped = []
+
+    class Cropper:
+        def process(self, data, mode=None):
+            cropped.append(data)
+
+    monkeypatch.setattr(workflow, "get_cropper", Cropper)
+
+    pool = WorkerPool("test-disconnect", 1, 1)
+    busy = threading.Event()
+    token = CancelToken()
+
+    async def scenario():
+        blocker = asyncio.create_task(pool.submit(busy.wait, 0.3))
+        await asyncio.sleep(0.02)
+        # Queued behind the blocker; the client leaves while it waits
+        async with main._cancel_on_disconnect(_Request(0.05), token):
+            with pytest.raises(OperationCancelled):
+                await pool.submit(run_with_token, token, workflow._run_cropper, b"photo", "model")
+        await blocker
+
+    asyncio.run(scenario())
+    assert token.reason == DISCONNECTED
+    assert cropped == []  # the crop stage never ran
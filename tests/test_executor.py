@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config
+from app import main
+from app.services import workflow
+from app.services.executor import PoolFullError, WorkerPool, gpu_slots
+
+
+def test_pool_rejects_past_workers_plus_queue():
+    pool = WorkerPool("test-admission", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.create_task(pool.submit(release.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(PoolFullError) as excinfo:
+            await pool.submit(lambda: None)
+        # Callers that bound their own concurrency skip the check
+        extra = asyncio.create_task(pool.submit(release.wait, 5, admit=False))
+        await asyncio.sleep(0.05)
+        assert pool.pending == 3
+        release.set()
+        await asyncio.gather(*running, extra)
+        return excinfo.value
+
+    error = asyncio.run(scenario())
+    assert error.retry_after == config.RETRY_AFTER_SECONDS
+    assert pool.pending == 0
+
+
+def test_full_pool_answers_503_with_retry_after(monkeypatch):
+    pool = WorkerPool("test-vision", max_workers=1, max_queue=0)
+    release = threading.Event()
+    monkeypatch.setattr(main, "vision_pool", pool)
+    monkeypatch.setattr(main, "workflow_quality_gate", lambda data, endpoint: {"scores": None, "failed": []})
+    monkeypatch.setattr(main, "workflow_vision_direct", lambda data: release.wait(5) and {"total": 1.0})
+    client = TestClient(main.app)
+
+    first = {}
+    busy = threading.Thread(target=lambda: first.update(r=client.post("/ocr/vision", files={"file": ("a.jpg", b"a")})))
+    busy.start()
+    deadline = time.monotonic() + 5
+    while pool.pending < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    response = client.post("/ocr/vision", files={"file": ("b.jpg", b"b")})
+    release.set()
+    busy.join(5)
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(config.RETRY_AFTER_SECONDS)
+    assert response.json() == {"error": "Server busy (test-vision), retry later"}
+    assert first["r"].status_code == 200
+
+
+def test_gpu_slots_bound_concurrent_crops(monkeypatch):
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    class SlowCropper:
+        def process(self, data, mode=None):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return data
+
+    monkeypatch.setattr(config, "CROP_PROCESSES", 0)
+    monkeypatch.setattr(config, "MODEL_SERVER_SOCKET", "")
+    monkeypatch.setattr(workflow, "get_cropper", SlowCropper)
+    threads = [threading.Thread(target=workflow._run_cropper, args=(b"x", "model")) for _ in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+
+    assert peak[0] == config.GPU_STAGE_CONCURRENCY
+    assert gpu_slots._value == config.GPU_STAGE_CONCURRENCY  # every slot given back
@@ -0,0 +1,56 @@
+from app.processors.fast_parser import FastReceiptParser
+from app.processors.receipt_schema import TEXT_SCHEMA, matches
+
+GROCERY = """METRO
+123 RUE PRINCIPALE
+2024-05-14 18:32
+LAIT 2%              5.49
+POULET              24.49
+SOUS-TOTAL          29.98
+TPS                  1.50
+TVQ                  2.99
+TOTAL               34.47
+"""
+
+
+def test_consistent_receipt_skips_the_llm():
+    fast = FastReceiptParser(min_confidence=0.8).parse(GROCERY)
+
+    assert fast.confident
+    assert fast.result == {
+        "store_name": "METRO",
+        "date": "2024-05-14",
+        "time": "18:32",
+        "total_amount": 34.47,
+        "taxes": {"tps": 1.50, "tvq": 2.99},
+        "items": [{"qty": 1.0, "desc": "LAIT 2%", "price": 5.49}, {"qty": 1.0, "desc": "POULET", "price": 24.49}],
+    }
+
+
+def test_result_has_the_llm_schema_and_nothing_else():
+    fast = FastReceiptParser().parse(GROCERY.replace("TPS ", "HST "))
+
+    assert matches(fast.result, TEXT_SCHEMA)
+    assert set(fast.result) == set(TEXT_SCHEMA["properties"])
+    assert set(fast.result["taxes"]) == {"tps", "tvq"}
+    assert "confidence" not in fast.result
+    # HST has nowhere to go in the schema: left to the LLM
+    assert not fast.confident
+
+
+def test_totals_that_do_not_add_up_fall_back():
+    fast = FastReceiptParser().parse(GROCERY.replace("34.47", "39.47"))
+    assert not fast.confident
+    assert fast.confidence["total_amount"] <= 0.4
+
+
+def test_fuel_receipts_go_to_the_llm():
+    fast = FastReceiptParser().parse("SHELL\nPOMPE 3\n42.619L @ 1.619/L\nTOTAL 69.00")
+    assert fast.result is None and not fast.confident
+
+
+def test_day_month_dates():
+    parser = FastReceiptParser()
+    assert parser._date("14/05/2024")[0] == "2024-05-14"
+    assert parser._date("05/14/24")[0] == "2024-05-14"
+    assert parser._date("31/02/2024")[0] is None
@@ -0,0 +1,52 @@
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from app.services.ingest import BodySizeLimit
+
+
+def _client(max_bytes):
+    app = FastAPI()
+    app.add_middleware(BodySizeLimit, max_bytes=max_bytes)
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    return TestClient(app)
+
+
+def _multipart(payload):
+    boundary = "xyz"
+    return boundary, (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="r.jpg"\r\n'
+        f"Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + payload + f"\r\n--{boundary}--\r\n".encode()
+
+
+def _chunks(body, size=1024):
+    for i in range(0, len(body), size):
+        yield body[i:i + size]
+
+
+def test_declared_length_over_cap_is_rejected():
+    boundary, body = _multipart(b"x" * 4096)
+    response = _client(2048).post("/upload", content=body,
+                                  headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert response.json() == {"error": "Upload too large (limit 2 KB)"}
+
+
+def test_chunked_upload_over_cap_gets_413():
+    boundary, body = _multipart(b"x" * 8192)
+    response = _client(2048).post("/upload", content=_chunks(body),
+                                  headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 413
+    assert "limit 2 KB" in response.json()["error"]
+
+
+def test_chunked_upload_under_cap_passes():
+    boundary, body = _multipart(b"x" * 512)
+    response = _client(4096).post("/upload", content=_chunks(body, 256),
+                                  headers={"content-type": f"multipart/form-data; boundary={boundary}"})
+    assert response.status_code == 200
+    assert response.json() == {"size": 512}
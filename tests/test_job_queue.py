@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from app import config
+from app.services.job_queue import JobQueue
+from app.services.job_worker import webhook_url_error
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.db"), max_attempts=2, lease_seconds=60, backoff_base=0.0)
+
+
+def test_claim_complete(queue):
+    job_id = queue.enqueue("surya", b"jpeg", None)
+    assert queue.claim("w1") == (job_id, "surya", b"jpeg", None)
+    assert queue.claim("w2") is None  # leased
+
+    assert queue.complete(job_id, "w1", {"total_amount": 1.0})
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["result"] == {"total_amount": 1.0} and job["attempts"] == 1
+
+
+def test_retry_then_dead_letter(queue):
+    job_id = queue.enqueue("vision", b"jpeg")
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "Ollama Error: timeout") == "queued"
+
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "Ollama Error: timeout") == "dead"
+    job = queue.get(job_id)
+    assert job["status"] == "dead" and job["attempts"] == 2
+    assert queue.counts()["dead"] == 1
+
+
+def test_non_retryable_failure_is_dead_lettered_at_once(queue):
+    job_id = queue.enqueue("surya", b"jpeg")
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "Cropping failed - could not detect receipt", retryable=False) == "dead"
+    assert queue.get(job_id)["attempts"] == 1
+
+
+def test_expired_lease_is_reclaimed_and_fences_the_old_worker(queue):
+    queue.lease_seconds = 0.05
+    job_id = queue.enqueue("surya", b"jpeg")
+    queue.claim("w1")
+    time.sleep(0.1)
+    queue.lease_seconds = 60
+    assert queue.claim("w2")[0] == job_id
+
+    # w1 finishes late: neither its result nor its failure may touch w2's job
+    assert not queue.complete(job_id, "w1", {"stale": True})
+    assert queue.fail(job_id, "w1", "late failure") is None
+    job = queue.get(job_id)
+    assert job["status"] == "running" and job["worker"] == "w2" and job["result"] is None
+
+    assert queue.complete(job_id, "w2", {"total_amount": 2.0})
+
+
+def test_worker_lost_on_final_attempt_is_dead_lettered(queue):
+    queue.max_attempts = 1
+    queue.lease_seconds = 0.01
+    job_id = queue.enqueue("surya", b"jpeg")
+    queue.claim("w1")
+    time.sleep(0.05)
+    assert queue.claim("w2") is None
+    assert queue.get(job_id)["status"] == "dead"
+
+
+@pytest.mark.parametrize("url", [
+    "ftp://example.com/hook",
+    "http://127.0.0.1:8000/hook",
+    "http://localhost/hook",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+])
+def test_webhooks_into_the_private_network_are_refused(url):
+    assert webhook_url_error(url)
+
+
+def test_public_webhook_address_is_accepted():
+    assert webhook_url_error("https://93.184.216.34/hook") is None
+
+
+def test_webhook_allowlist(monkeypatch):
+    monkeypatch.setattr(config, "JOB_WEBHOOK_ALLOWED_HOSTS", ["hooks.example.com"])
+    assert webhook_url_error("https://hooks.example.com/a") is None
+    assert webhook_url_error("https://eu.hooks.example.com/a") is None
+    assert webhook_url_error("https://evil.com/a")
+
+
+def test_api_opens_the_jobs_db_on_first_use_only(tmp_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from app import main
+    from app.services import job_queue
+
+    db = tmp_path / "jobs.db"
+    monkeypatch.setattr(config, "JOBS_DB", str(db))
+    monkeypatch.setattr(config, "JOB_WORKERS", 0)
+    monkeypatch.setattr(config, "WARMUP", False)
+    monkeypatch.setattr(job_queue, "_queue", None)
+
+    for _ in range(2):  # a second startup in the same process
+        with TestClient(main.app):
+            pass
+    assert not db.exists()
+
+    client = TestClient(main.app)
+    assert client.get("/jobs").status_code == 200
+    assert client.get("/jobs").status_code == 200
+    assert db.exists()
+    assert "receipt_jobs" in client.get("/metrics").text
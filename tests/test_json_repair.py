@@ -0,0 +1,84 @@
+import pytest
+
+from app.processors.json_repair import repair_json
+from app.processors.json_stream import JsonObjectStream
+from app.processors.receipt_schema import TEXT_SCHEMA, matches
+
+RECEIPT = ('{"store_name": "METRO", "date": "2024-05-14", "time": null, "total_amount": 34.47, '
+           '"taxes": {"tps": 1.5, "tvq": 2.99}, "items": [{"qty": 1, "desc": "LAIT", "price": 5.49}]}')
+
+
+def test_valid_json_is_strict():
+    obj, path = repair_json(f"Here you go:\n```json\n{RECEIPT}\n```")
+    assert path == "strict"
+    assert obj["total_amount"] == 34.47
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("{'store_name': 'Tim Horton's', 'total': 4.5,}", {"store_name": "Tim Horton's", "total": 4.5}),
+    ('{"a": 1 // comment\n"b": None}', {"a": 1, "b": None}),
+    ('{"items": [{"desc": "LAIT", "price": 5.4', {"items": [{"desc": "LAIT", "price": 5.4}]}),
+    ('{"price": 5*2, "total": 4.99 + 1.50}', {"price": 10, "total": 6.49}),
+])
+def test_local_repairs(text, expected):
+    assert repair_json(text) == (expected, "repaired")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"date": 2024-5-12, "total": 12.50}', {"date": "2024-5-12", "total": 12.5}),
+    ('{"date": 12/05/24}', {"date": "12/05/24"}),
+    ('{"time": 18:32}', {"time": "18:32"}),
+    ('{"phone": 514-555-1234}', {"phone": "514-555-1234"}),
+    ('{"phone": (514) 555-1234}', {"phone": "(514) 555-1234"}),
+])
+def test_dates_times_and_phones_are_quoted_not_evaluated(text, expected):
+    assert repair_json(text) == (expected, "repaired")
+
+
+def test_minus_and_divide_are_never_evaluated():
+    assert repair_json('{"total": 20-5}') == (None, None)
+    assert repair_json('{"total": 20/5}') == (None, None)
+
+
+def test_repaired_object_must_match_the_schema():
+    broken = RECEIPT.replace('"2024-05-14"', "2024-05-14").replace('"total_amount": 34.47', '"total_amount": "oops"')
+    assert repair_json(broken, TEXT_SCHEMA) == (None, None)
+
+    obj, path = repair_json(RECEIPT.replace('"2024-05-14"', "2024-05-14"), TEXT_SCHEMA)
+    assert path == "repaired" and obj["date"] == "2024-05-14" and matches(obj, TEXT_SCHEMA)
+
+
+def test_missing_field_is_accepted_on_both_paths():
+    no_time = RECEIPT.replace('"time": null, ', "")
+    assert repair_json(no_time, TEXT_SCHEMA) == (repair_json(no_time)[0], "strict")
+
+    obj, path = repair_json(no_time.replace('"2024-05-14"', "2024-05-14"), TEXT_SCHEMA)
+    assert path == "repaired" and obj["date"] == "2024-05-14" and "time" not in obj
+
+
+def test_wrong_types_are_rejected_on_both_paths():
+    wrong = RECEIPT.replace('"total_amount": 34.47', '"total_amount": "oops"')
+    assert repair_json(wrong, TEXT_SCHEMA) == (None, None)
+    assert repair_json(wrong.replace('"2024-05-14"', "2024-05-14"), TEXT_SCHEMA) == (None, None)
+
+
+def test_nothing_usable():
+    assert repair_json("") == (None, None)
+    assert repair_json("no json here") == (None, None)
+
+
+def test_stream_stops_at_first_matching_object():
+    scanner = JsonObjectStream(accept=lambda obj: matches(obj, TEXT_SCHEMA))
+    chunks = ['Example: {"a": 1} then ', RECEIPT[:40], RECEIPT[40:], ' and {"more": "text"}']
+    stopped_at = next(i for i, chunk in enumerate(chunks) if scanner.feed(chunk))
+
+    assert stopped_at == 2
+    assert scanner.result["store_name"] == "METRO"
+    assert scanner.objects_seen == 2
+
+
+def test_stream_ignores_braces_inside_strings():
+    scanner = JsonObjectStream()
+    assert not scanner.feed('{"desc": "brace } and \\" quote {"')
+    assert scanner.feed(', "price": 1}')
+    assert scanner.result == {"desc": 'brace } and " quote {', "price": 1}
@@ -0,0 +1,52 @@
+from app.processors.ocr_tiling import OcrLine, merge_strip_lines, plan_strips
+
+
+def test_short_crop_is_not_tiled():
+    assert plan_strips(250, 100) == [(0, 250)]
+
+
+def test_strips_cover_the_crop_with_overlap():
+    strips = plan_strips(1000, 100)
+    assert len(strips) > 1
+    assert strips[0][0] == 0 and strips[-1][1] == 1000
+    for (_, prev_end), (start, _) in zip(strips, strips[1:]):
+        assert start < prev_end  # every cut is covered by two strips
+
+
+def _strip_view(strips, page_lines):
+    """What each strip would read: the page lines it fully contains, in its own coordinates."""
+    views = []
+    for y0, y1 in strips:
+        views.append([
+            OcrLine(text, (x0, ly0 - y0, x1, ly1 - y0), 0.9)
+            for text, (x0, ly0, x1, ly1) in page_lines
+            if ly0 >= y0 and ly1 <= y1
+        ])
+    return views
+
+
+def test_line_in_an_overlap_is_kept_once():
+    strips = [(0, 200), (170, 370)]
+    page_lines = [("SHELL", (10, 20, 90, 32)), ("ESSENCE 52.10", (10, 178, 90, 190)),
+                  ("TOTAL 52.10", (10, 300, 90, 312))]
+    merged = merge_strip_lines(strips, _strip_view(strips, page_lines))
+
+    assert [line.text for line in merged] == ["SHELL", "ESSENCE 52.10", "TOTAL 52.10"]
+    assert [line.bbox for line in merged] == [bbox for _, bbox in page_lines]
+
+
+def test_jittered_copy_across_the_cut_is_not_lost_or_doubled():
+    strips = [(0, 200), (170, 370)]
+    # The cut is at 185: strip 0 puts the line's centre just above it, strip 1 just below
+    views = [[OcrLine("TPS 2.61", (10, 177, 90, 189), 0.9)],
+             [OcrLine("TPS 2.61", (10, 11, 90, 23), 0.9)]]
+    merged = merge_strip_lines(strips, views)
+    assert [line.text for line in merged] == ["TPS 2.61"]
+
+
+def test_different_lines_side_by_side_are_both_kept():
+    strips = [(0, 200), (170, 370)]
+    views = [[OcrLine("TPS", (10, 178, 40, 190), 0.9)],
+             [OcrLine("2.61", (60, 8, 90, 20), 0.9)]]
+    merged = merge_strip_lines(strips, views)
+    assert [line.text for line in merged] == ["TPS", "2.61"]
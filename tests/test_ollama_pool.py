@@ -0,0 +1,97 @@
+import threading
+import time
+from urllib.parse import urlparse
+
+import pytest
+
+from app.services.ollama_pool import OllamaPool, OllamaStreamError, OllamaUnavailableError
+from benchmarks.stub_ollama import StubOllama
+
+MESSAGES = [{"role": "user", "content": "RAW TEXT"}]
+
+
+@pytest.fixture
+def stubs():
+    started = [StubOllama(latency_ms=20, token_ms=0), StubOllama(latency_ms=20, token_ms=0)]
+    hosts = [stub.start() for stub in started]
+    yield started, hosts
+    for stub in started:
+        stub.stop()
+
+
+def _pool(hosts, **kwargs):
+    return OllamaPool(hosts, timeout=5, max_attempts=2, failure_threshold=2, cooldown=0.5, **kwargs)
+
+
+def _chat_concurrently(pool, n):
+    errors = []
+
+    def call():
+        try:
+            pool.chat(model="qwen", messages=MESSAGES)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    return errors
+
+
+def test_least_outstanding_spreads_concurrent_calls(stubs):
+    (a, b), hosts = stubs
+    a.latency_ms = b.latency_ms = 200
+    assert _chat_concurrently(_pool(hosts), 6) == []
+    assert (a.requests, b.requests) == (3, 3)
+
+
+def test_dead_backend_fails_over_trips_probes_once_and_recovers(stubs):
+    (a, b), hosts = stubs
+    pool = _pool(hosts)
+    port = urlparse(hosts[0]).port
+    a.stop()
+
+    # Every call still succeeds on b; after two failures a's circuit opens
+    for _ in range(4):
+        assert pool.chat(model="qwen", messages=MESSAGES)["message"]["content"]
+    dead, alive = pool.stats()
+    assert dead["circuit_open"] and dead["requests"] == 2
+    assert alive["requests"] == 4 and not alive["circuit_open"]
+
+    # Back up (slowly); once the cooldown passes exactly one call probes it
+    revived = StubOllama(latency_ms=300, token_ms=0)
+    revived.start(port=port)
+    try:
+        time.sleep(0.6)
+        assert _chat_concurrently(pool, 5) == []
+        assert revived.requests == 1
+        assert b.requests == 8
+
+        # The probe succeeded: a takes traffic again
+        assert not pool.stats()[0]["circuit_open"]
+        revived.latency_ms = 200
+        b.latency_ms = 200
+        assert _chat_concurrently(pool, 4) == []
+        assert revived.requests == 3
+    finally:
+        revived.stop()
+
+
+def test_no_backend_left(stubs):
+    (a, b), hosts = stubs
+    a.stop()
+    b.stop()
+    with pytest.raises(OllamaUnavailableError):
+        _pool(hosts).chat(model="qwen", messages=MESSAGES)
+
+
+def test_mid_stream_failure_is_not_retried(stubs):
+    (a, b), hosts = stubs
+    a.drop_after = 3
+    pieces = []
+    with pytest.raises(OllamaStreamError):
+        _pool(hosts).stream_chat(pieces.append, model="qwen", messages=MESSAGES)
+    assert len(pieces) == 3
+    assert b.requests == 0  # b would have replayed the reply into the same parser
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app import config
+from app import main
+from app.processors.image_io import decode_image
+from app.services.workflow import workflow_quality_gate
+from benchmarks.synthetic import encode_jpeg, make_photo
+
+GOOD = encode_jpeg(make_photo(900, 1200))
+BLANK = encode_jpeg(np.full((800, 600, 3), 10, np.uint8))
+# A sharp, readable receipt in a dim room: only the exposure check fails
+DIM = encode_jpeg((make_photo(900, 1200).astype(np.float32) * 0.18).astype(np.uint8))
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(config, "QUALITY_GATE_ENDPOINTS", {"vision", "surya"})
+    monkeypatch.setattr(main, "workflow_vision_direct", lambda data: {"total_amount": 1.0})
+    monkeypatch.setattr(main, "workflow_surya_pipeline", lambda data: {"total_amount": 1.0})
+    return TestClient(main.app)
+
+
+def _post(client, endpoint, data):
+    return client.post(f"/ocr/{endpoint}", files={"file": ("r.jpg", data)})
+
+
+@pytest.mark.parametrize("data", [b"", b"not an image", GOOD[:200]])
+def test_undecodable_bytes_decode_to_none(data):
+    assert decode_image(data, max_dim=512, grayscale=True) is None
+
+
+def test_usable_photo_passes_with_its_scores(client):
+    response = _post(client, "vision", GOOD)
+    assert response.status_code == 200
+    assert response.headers["X-Image-Quality"].startswith("blur=")
+
+
+def test_unusable_photo_gets_422_with_the_failed_checks(client):
+    response = _post(client, "vision", BLANK)
+    assert response.status_code == 422
+    body = response.json()
+    assert body["error"] == "Image quality too low"
+    assert {f["check"] for f in body["failed"]} == {"blur", "too_dark", "no_text"}
+    assert body["failed"][0].keys() == {"check", "score", "limit"}
+    assert body["quality"]["brightness"] == 10.0
+
+
+def test_empty_upload_fails_the_decode_check(client):
+    response = _post(client, "vision", b"")
+    assert response.status_code == 422
+    assert response.json()["failed"] == [{"check": "decode", "score": None, "limit": None}]
+
+
+def test_per_endpoint_override(client, monkeypatch):
+    monkeypatch.setattr(config, "QUALITY_OVERRIDES", {"vision": {"min_brightness": 0}})
+    assert _post(client, "vision", DIM).status_code == 200
+    response = _post(client, "surya", DIM)
+    assert response.status_code == 422
+    assert [f["check"] for f in response.json()["failed"]] == ["too_dark"]
+
+
+def test_observe_only_by_default():
+    assert config.QUALITY_GATE_ENDPOINTS == set()
+    report = workflow_quality_gate(BLANK, "crop")
+    assert report["failed"]  # scored and counted, not raised
+
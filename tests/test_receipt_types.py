@@ -0,0 +1,43 @@
+import random
+
+from app.processors.receipt_types import classify_layout, classify_text
+from app.processors.surya_ocr_parser import SYSTEM_PROMPT, TEXT_PROMPTS, SuryaParser
+from benchmarks.synthetic import receipt_lines, render_receipt
+
+FUEL = "SHELL\nPOMPE 4\nORDINAIRE\n42.619 L @ 1.619/L\nESSENCE             69.00\nTOTAL               69.00"
+RESTAURANT = "CHEZ PAUL BISTRO\nTABLE 12\n1 POUTINE            14.50\nSOUS-TOTAL          14.50\nPOURBOIRE            2.18"
+GENERIC = "DEPANNEUR CHEZ LUC\nCHIPS                3.49\nJUS                  2.99\nSOUS-TOTAL           6.48\nTPS                  0.32\nTVQ                  0.65\nTOTAL                7.45"
+
+
+def test_classify_text():
+    assert classify_text(FUEL) == "fuel"
+    assert classify_text(RESTAURANT) == "restaurant"
+    assert classify_text("\n".join(receipt_lines(random.Random(0), 8))) == "retail"
+    assert classify_text(GENERIC) == "generic"
+    assert classify_text("") == "generic"
+
+
+def test_fuel_wins_over_other_evidence():
+    assert classify_text(FUEL + "\nMEMBRE 1234\nSERVEUR: MARC") == "fuel"
+
+
+def test_subtotals_and_taxes_do_not_make_a_retail_receipt():
+    # Six priced lines, but only two are items
+    assert classify_text(GENERIC + "\nVISA                 7.45") == "generic"
+
+
+def test_classify_layout_by_row_count():
+    rng = random.Random(0)
+    assert classify_layout(render_receipt(receipt_lines(rng, 30))) == "retail"
+    assert classify_layout(render_receipt(receipt_lines(rng, 3))) == "generic"
+
+
+def test_parser_routes_to_the_prompt_for_the_type():
+    receipt_type, messages = SuryaParser(client=object(), routing=True).messages(RESTAURANT)
+    assert receipt_type == "restaurant"
+    assert messages[0]["content"] == TEXT_PROMPTS["restaurant"]
+    assert messages[1]["content"] == RESTAURANT
+
+    receipt_type, messages = SuryaParser(client=object(), routing=False).messages(RESTAURANT)
+    assert receipt_type == "full"
+    assert messages[0]["content"] == SYSTEM_PROMPT
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from app.processors.ocr_tiling import OcrLine
+from app.services.cancellation import CancelToken, DeadlineExceeded, run_with_token
+from app.services.surya_batcher import SuryaBatcher
+
+
+class FakeEngine:
+    """Echoes each image (a string) as one line; fails any pass that contains "bad"."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def run_lines_batch(self, images):
+        self.batches.append(list(images))
+        time.sleep(self.delay)
+        if "bad" in images:
+            raise RuntimeError("CUDA error")
+        return [[OcrLine(image, (0, 0, 1, 1), 0.9)] for image in images]
+
+
+def _run_concurrently(batcher, images):
+    results = {}
+
+    def call(image):
+        results[image] = batcher.run(image)
+
+    threads = [threading.Thread(target=call, args=(image,)) for image in images]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_concurrent_callers_share_a_pass():
+    engine = FakeEngine()
+    batcher = SuryaBatcher(engine, max_batch=4, max_wait_ms=200)
+    results = _run_concurrently(batcher, ["a", "b", "c", "d"])
+
+    assert results == {"a": "a", "b": "b", "c": "c", "d": "d"}
+    assert len(engine.batches) == 1
+
+
+def test_failed_batch_is_retried_image_by_image():
+    engine = FakeEngine()
+    batcher = SuryaBatcher(engine, max_batch=3, max_wait_ms=200)
+    results = _run_concurrently(batcher, ["a", "bad", "c"])
+
+    # Only the image that breaks Surya comes back empty
+    assert results == {"a": "a", "bad": "", "c": "c"}
+    assert sorted(map(len, engine.batches)) == [1, 1, 1, 3]
+
+
+def test_cancelled_caller_does_not_wait_for_the_pass():
+    batcher = SuryaBatcher(FakeEngine(delay=1.0), max_batch=1, max_wait_ms=0)
+    token = CancelToken.with_timeout(0.2)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        run_with_token(token, batcher.run, "a")
+    assert time.monotonic() - start < 0.8